@@ -0,0 +1,167 @@
+# batch_solve.py
+"""
+Command-line batch solver: streams puzzles (line, SDK or SadMan format, see
+puzzle_io) from a file or stdin, solves them on a process pool and writes
+the solutions in input order. Throughput and p50/p99 solve times go to
+stderr, so public hard-puzzle corpora can be used as a benchmark.
+
+A puzzle without a solution is written back unchanged (and counted), so
+output line N always belongs to input puzzle N.
+
+Example:
+    python batch_solve.py top1465.txt --workers 8 > solutions.txt
+    cat puzzles.sdk | python batch_solve.py - --format sdk --solver dlx
+"""
+import argparse
+import os
+import sys
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from puzzle_io import read_puzzles, write_puzzles, FORMATS
+from sudoku_logic import SudokuGenerator, SOLVER_BACKENDS
+
+CHUNK_SIZE = 64         # Puzzles per job sent to a worker process
+PROGRESS_INTERVAL = 1.0 # Giây giữa hai lần in tiến độ
+
+_worker_generators = {} # (size, solver) -> SudokuGenerator, one set per worker process
+
+
+def _solve_chunk(solver, puzzles):
+    """Worker entry point: [(solution or None, seconds)] for a chunk of puzzles."""
+    results = []
+    for puzzle in puzzles:
+        key = (len(puzzle), solver)
+        generator = _worker_generators.get(key)
+        if generator is None:
+            generator = _worker_generators[key] = SudokuGenerator(len(puzzle), solver)
+        start = time.perf_counter()
+        solution = generator.solve(puzzle)
+        results.append((solution, time.perf_counter() - start))
+    return results
+
+
+def _chunks(puzzles, chunk_size):
+    puzzles = iter(puzzles)
+    while True:
+        chunk = list(islice(puzzles, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def solve_stream(puzzles, solver="bitmask", workers=1, chunk_size=CHUNK_SIZE, max_pending=None):
+    """
+    Lazily yields (puzzle, solution or None, seconds) in input order.
+    With workers > 1 chunks of puzzles are solved on a process pool with at
+    most `max_pending` (default 2 * workers) chunks in flight, so the input
+    is only read as fast as results are consumed.
+    """
+    chunks = _chunks(puzzles, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            for puzzle, (solution, seconds) in zip(chunk, _solve_chunk(solver, chunk)):
+                yield puzzle, solution, seconds
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(_solve_chunk, solver, chunk)))
+            if len(pending) < max_pending:
+                continue
+            chunk, future = pending.popleft()
+            for puzzle, (solution, seconds) in zip(chunk, future.result()):
+                yield puzzle, solution, seconds
+        while pending:
+            chunk, future = pending.popleft()
+            for puzzle, (solution, seconds) in zip(chunk, future.result()):
+                yield puzzle, solution, seconds
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=not pending, cancel_futures=True)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile (q in 0..100) of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def batch_solve(source, out, fmt="auto", output_format="line", solver="bitmask", workers=1,
+                chunk_size=CHUNK_SIZE, max_pending=None, report=None):
+    """
+    Solves every puzzle of `source` (path, open file or "-") and writes the
+    solutions to the text file `out`. Returns {'count', 'solved', 'unsolved',
+    'seconds', 'per_second', 'p50_ms', 'p99_ms', 'max_ms'}.
+    """
+    report = report or (lambda text: print(text, file=sys.stderr))
+    times = array("d") # Thời gian giải từng puzzle (giây), gọn hơn list float với hàng triệu puzzle
+    unsolved = 0
+    start = last_report = time.monotonic()
+
+    def solutions():
+        nonlocal unsolved, last_report
+        for puzzle, solution, seconds in solve_stream(read_puzzles(source, fmt), solver, workers,
+                                                      chunk_size, max_pending):
+            times.append(seconds)
+            if solution is None:
+                unsolved += 1
+                solution = puzzle # Giữ nguyên thứ tự: ghi lại đề không giải được
+            yield solution
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                report(f"  {len(times)} puzzle ({len(times) / (now - start):.1f} puzzle/s)")
+
+    write_puzzles(solutions(), out, output_format)
+    elapsed = time.monotonic() - start
+    ordered = sorted(times)
+    return {
+        'count': len(times),
+        'solved': len(times) - unsolved,
+        'unsolved': unsolved,
+        'seconds': elapsed,
+        'per_second': len(times) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Giải hàng loạt puzzle Sudoku từ file hoặc stdin.")
+    parser.add_argument("input", nargs="?", default="-", help="File puzzle (mặc định: stdin)")
+    parser.add_argument("--format", default="auto", choices=("auto",) + FORMATS, help="Định dạng đầu vào")
+    parser.add_argument("--output", default="-", help="File ghi lời giải (mặc định: stdout)")
+    parser.add_argument("--output-format", default="line", choices=FORMATS, help="Định dạng đầu ra")
+    parser.add_argument("--solver", default="bitmask", choices=sorted(SOLVER_BACKENDS), help="Bộ giải")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình (mặc định: số lõi CPU)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Số puzzle mỗi việc gửi cho một tiến trình")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Số việc tối đa đang chờ trong pool (mặc định: 2 x workers)")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count() or 1
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        result = batch_solve(args.input, out, args.format, args.output_format, args.solver, workers,
+                             args.chunk_size, args.max_pending)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"BATCH: {result['count']} puzzle ({result['unsolved']} không giải được) trong {result['seconds']:.2f}s "
+          f"- {result['per_second']:.1f} puzzle/s, p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+          f"max {result['max_ms']:.2f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 # client.py
+import os
 import socket
 import threading
-import json
 import tkinter as tk 
 
+from protocol import PROTOCOL_VERSION, DEFAULT_FRAMING, FrameError, FrameReader, encode_frame
+
+# Cách đóng khung message với server (xem protocol.py); "newline" để dễ đọc khi gỡ lỗi
+WIRE_FRAMING = os.environ.get("SUDOKU_WIRE_FRAMING", DEFAULT_FRAMING)
+
 
 
 class SudokuClient:
@@ -11,6 +16,8 @@ class SudokuClient:
         self.host = host
         self.port = port
         self.socket = None
+        self.reader = None # protocol.FrameReader trên socket
+        self.framing = "newline" # Đến khi server xác nhận hello
         self.app_controller = app_controller # Reference to SudokuApp (main.py)
         self.game_ui = None # Reference to the GameScreenUI instance, set by app_controller
 
@@ -22,6 +29,9 @@ class SudokuClient:
         # Trạng thái bảng game từ server (để client tự kiểm tra hoặc hiển thị)
         self.server_board_state = [[0 for _ in range(9)] for _ in range(9)]
         self.server_fixed_mask = [[False for _ in range(9)] for _ in range(9)]
+        self.server_variant = None # Luật biến thể của game (SudokuVariant.to_dict()); None = cổ điển
+        self.last_hint = None # Gợi ý logic gần nhất từ server (chế độ coach)
+        self.last_puzzle_check = None # Kết quả check_puzzle gần nhất: status, solution, strategy, seconds
 
 
     def connect(self):
@@ -32,6 +42,7 @@ class SudokuClient:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(5) # Timeout cho kết nối
             self.socket.connect((self.host, self.port))
+            self._negotiate() # Vẫn trong timeout kết nối
             self.socket.settimeout(None) # Bỏ timeout sau khi kết nối
             self.is_connected = True
             
@@ -52,8 +63,32 @@ class SudokuClient:
             print(f"CLIENT ERROR: Lỗi kết nối - {e}")
             if self.game_ui: self.game_ui.show_message("Lỗi", f"Không thể kết nối: {e}", "error")
             self.is_connected = False
+            if self.socket:
+                self.socket.close()
+                self.socket = None
             return False
 
+    def _negotiate(self):
+        """
+        Reads connected_ack (one JSON line) and answers with a hello line
+        choosing WIRE_FRAMING when the server offers it. The server switches
+        as soon as it reads the hello, so both sides switch here too.
+        """
+        self.reader = FrameReader(self.socket, "newline")
+        self.framing = "newline"
+        ack = self.reader.read()
+        if ack.get('command') != 'connected_ack':
+            raise FrameError(f"Expected connected_ack, got {ack.get('command')}")
+        self._process_message(ack)
+        if ack.get('protocol') != PROTOCOL_VERSION or WIRE_FRAMING not in ack.get('framings', ()):
+            print(f"CLIENT: Server không hỗ trợ {WIRE_FRAMING} (protocol {ack.get('protocol')}), dùng newline.")
+            return
+        self.socket.sendall(encode_frame({'command': 'hello', 'protocol': PROTOCOL_VERSION, 'framing': WIRE_FRAMING},
+                                         "newline"))
+        self.framing = self.reader.framing = WIRE_FRAMING
+        if ack.get('max_frame_size'):
+            self.reader.max_frame_size = ack['max_frame_size']
+
     def disconnect(self):
         if self.is_connected and self.socket:
             try:
@@ -68,7 +103,8 @@ class SudokuClient:
                 except OSError as e: # Có thể đã đóng rồi
                      print(f"CLIENT: Lỗi khi đóng socket: {e}")
                 self.socket = None
-                if self.receive_thread and self.receive_thread.is_alive():
+                if self.receive_thread and self.receive_thread.is_alive() \
+                        and self.receive_thread is not threading.current_thread(): # Không tự join chính luồng nhận
                     self.receive_thread.join(timeout=1) # Chờ thread kết thúc
                 print("CLIENT: Đã ngắt kết nối.")
                 if self.game_ui: self.game_ui.show_message("Thông báo", "Đã ngắt kết nối server.")
@@ -82,8 +118,7 @@ class SudokuClient:
             if self.game_ui: self.game_ui.show_message("Lỗi", "Chưa kết nối server.", "error")
             return False
         try:
-            json_message = json.dumps(message_dict)
-            self.socket.sendall(json_message.encode('utf-8'))
+            self.socket.sendall(encode_frame(message_dict, self.framing))
             # print(f"CLIENT SENT: {message_dict}") # DEBUG
             return True
         except Exception as e:
@@ -93,28 +128,21 @@ class SudokuClient:
             return False
 
     def _receive_data(self):
-        buffer = ""
         while self.is_connected and self.socket:
             try:
-                data_chunk = self.socket.recv(4096)
-                if not data_chunk:
-                    print("CLIENT: Server đã đóng kết nối.")
-                    self.disconnect() # Xử lý ngắt kết nối sạch sẽ
-                    break
-                
-                buffer += data_chunk.decode('utf-8')
-                
-                # Xử lý trường hợp nhận được nhiều JSON object trong một lần recv
-                while True:
-                    try:
-                        message_obj, index = json.JSONDecoder().raw_decode(buffer)
-                        # print(f"CLIENT RECEIVED: {message_obj}") # DEBUG
-                        self._process_message(message_obj)
-                        buffer = buffer[index:].lstrip() # Bỏ phần đã xử lý và khoảng trắng đầu
-                    except json.JSONDecodeError:
-                        # Chưa đủ dữ liệu để parse một JSON object hoàn chỉnh
-                        break # Chờ thêm dữ liệu
+                # Đọc đúng một frame: header 4 byte rồi đúng số byte đó (hoặc một dòng với framing newline)
+                message_obj = self.reader.read()
+                # print(f"CLIENT RECEIVED: {message_obj}") # DEBUG
+                self._process_message(message_obj)
 
+            except EOFError:
+                print("CLIENT: Server đã đóng kết nối.")
+                self.disconnect() # Xử lý ngắt kết nối sạch sẽ
+                break
+            except FrameError as e: # Frame quá lớn hoặc không phải JSON: luồng dữ liệu không còn tin được
+                print(f"CLIENT ERROR: Dữ liệu không hợp lệ từ server: {e}")
+                self.disconnect()
+                break
             except ConnectionResetError:
                 print("CLIENT: Kết nối bị reset bởi server.")
                 self.disconnect()
@@ -133,6 +161,29 @@ class SudokuClient:
         print("CLIENT: Thread nhận dữ liệu đã dừng.")
 
 
+    def _call_on_ui_thread(self, callback, *args, wait=False):
+        """
+        Runs an app_controller callback on the Tk main loop (app.after):
+        Tk widgets must not be built or destroyed from the receive thread.
+        With wait=True, blocks until it has run or the client disconnects.
+        Controllers without after() (the test mock below) are called directly.
+        """
+        after = getattr(self.app_controller, 'after', None)
+        if after is None or threading.current_thread() is threading.main_thread():
+            callback(*args)
+            return
+        done = threading.Event()
+        def run():
+            try:
+                callback(*args)
+            finally:
+                done.set()
+        after(0, run)
+        # Không chờ vô hạn: disconnect() trên luồng Tk chờ (join) chính luồng nhận này
+        while wait and not done.wait(0.1):
+            if not self.is_connected:
+                return
+
     def _process_message(self, message):
         command = message.get('command')
         
@@ -141,10 +192,20 @@ class SudokuClient:
             print(f"CLIENT: Được server gán Player ID: {self.player_id}")
             # Client có thể yêu cầu danh sách game hoặc tạo game mới ở đây
 
+        elif command == 'hello_ack': # Server đã chuyển sang cách đóng khung client chọn
+            print(f"CLIENT: Giao thức {message.get('protocol')}, framing {message.get('framing')}")
+
         elif command == 'game_state_update': # Server gửi trạng thái game ban đầu hoặc cập nhật
             self.current_game_id = message.get('game_id')
             self.server_board_state = message.get('board_data')
             self.server_fixed_mask = message.get('fixed_mask')
+            self.server_variant = message.get('variant')
+            size = message.get('size', len(self.server_board_state))
+            # Dựng lại màn hình nếu kích thước bảng khác với bảng đang hiển thị
+            if self.game_ui and getattr(self.game_ui, 'grid_size', size) != size \
+                    and hasattr(self.app_controller, 'resize_multiplayer_board'):
+                # Dựng widget mới trên luồng Tk và chờ xong, để update_board_display bên dưới vẽ lên màn hình mới
+                self._call_on_ui_thread(self.app_controller.resize_multiplayer_board, size, wait=True)
             # Có thể có thêm thông tin như current_player, opponent_id, v.v.
             if self.game_ui:
                 # UI cần được cập nhật với board này
@@ -199,6 +260,16 @@ class SudokuClient:
             if self.game_ui:
                 self.game_ui.show_message("Lỗi Server", error_message, "error")
         
+        elif command == 'hint': # Bước logic tiếp theo: ô, số, kỹ thuật và các ứng viên bị loại
+            self.last_hint = message.get('hint')
+            print(f"CLIENT: Gợi ý từ server: {self.last_hint}")
+            self._call_on_ui_thread(self.app_controller.show_multiplayer_hint, self.last_hint)
+
+        elif command == 'puzzle_check': # Kết quả kiểm tra puzzle tự nhập (solved/unsolvable/limit/timeout/invalid)
+            self.last_puzzle_check = {k: message.get(k) for k in ('status', 'solution', 'strategy', 'seconds')}
+            print(f"CLIENT: Kiểm tra puzzle: {self.last_puzzle_check['status']}")
+            self._call_on_ui_thread(self.app_controller.show_puzzle_check, self.last_puzzle_check)
+
         elif command == 'message': # Thông báo chung từ server
             text = message.get('text')
             if self.game_ui: self.game_ui.show_message("Thông báo Server", text)
@@ -206,14 +277,24 @@ class SudokuClient:
         
 
     # --- Các hàm để UI gọi ---
-    def request_new_multiplayer_game(self, difficulty="medium"):
+    def request_new_multiplayer_game(self, difficulty="medium", size=9, variant="classic"):
         if not self.is_connected: return
         self.send_message({
             'command': 'create_game',
             'difficulty': difficulty,
+            'size': size,
+            'variant': variant, # classic, diagonal, anti_knight, jigsaw, killer, consecutive
             'player_id': self.player_id # Gửi player_id để server biết ai tạo
         })
 
+    def request_hint(self):
+        if not self.is_connected or not self.current_game_id: return
+        self.send_message({'command': 'get_hint', 'game_id': self.current_game_id, 'player_id': self.player_id})
+
+    def request_puzzle_check(self, grid):
+        if not self.is_connected: return
+        self.send_message({'command': 'check_puzzle', 'grid': [list(row) for row in grid], 'player_id': self.player_id})
+
     def request_join_game(self, game_id_to_join):
         if not self.is_connected: return
         self.send_message({
@@ -250,6 +331,8 @@ if __name__ == '__main__':
     # Phần này chỉ để test client độc lập, không có UI đầy đủ
     class MockAppController: # Để test client mà không cần full SudokuApp
         def show_main_menu(self): pass
+        def show_multiplayer_hint(self, hint): print(f"MOCK: Gợi ý {hint}")
+        def show_puzzle_check(self, result): print(f"MOCK: Kiểm tra {result['status']}")
     
     class MockGameUI:
         def show_message(self, title, msg, type="info"): print(f"UI MOCK ({type.upper()}) {title}: {msg}")
@@ -271,9 +354,13 @@ if __name__ == '__main__':
         # Giữ client chạy để nhận tin nhắn (trong thực tế, main loop của Tkinter sẽ giữ chương trình chạy)
         try:
             while client.is_connected:
-                cmd = input("Client cmd (new, join <id>, move <r> <c> <n>, quit): ")
+                cmd = input("Client cmd (new, join <id>, move <r> <c> <n>, hint, check, quit): ")
                 if cmd.startswith("new"):
                     client.request_new_multiplayer_game()
+                elif cmd == "hint":
+                    client.request_hint()
+                elif cmd == "check" and client.server_board_state is not None:
+                    client.request_puzzle_check(client.server_board_state)
                 elif cmd.startswith("join"):
                     try:
                         _, gid = cmd.split()
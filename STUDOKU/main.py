@@ -6,7 +6,7 @@ import uuid # For unique game IDs
 
 # --- Local Module Imports ---
 from ui import MainMenuScreen, GameScreenUI, NewGameDialog, SettingsScreen, StatisticsScreen
-from sudoku_logic import SudokuGenerator
+from sudoku_logic import SudokuGenerator, BoardTracker, HintEngine, SudokuBoard, box_dimensions
 from client import SudokuClient # For multiplayer functionality
 
 # --- Constants ---
@@ -14,6 +14,20 @@ SAVE_FILE_PATH = "sudoku_save.json"         # Stores saved classic game state
 SETTINGS_FILE_PATH = "sudoku_settings.json" # Stores app settings (theme, custom colors)
 USER_STATS_FILE_PATH = "sudoku_user_stats.json" # Stores user game statistics
 TIMER_INTERVAL_MS = 1000                    # Interval for the classic game timer (1 second)
+HINT_TECHNIQUE_NAMES = {                    # HintEngine technique -> name shown to the player
+    "naked_single": "Ô duy nhất (naked single)",
+    "hidden_single": "Vị trí duy nhất (hidden single)",
+    "variant_rule": "Tổng lồng / vạch liên tiếp",
+    "pointing_pair": "Cặp chỉ hướng (pointing pair)",
+    "box_line_reduction": "Giao khối - hàng (box/line reduction)",
+    "naked_pair": "Cặp lộ (naked pair)",
+    "hidden_pair": "Cặp ẩn (hidden pair)",
+    "naked_triple": "Bộ ba lộ (naked triple)",
+    "hidden_triple": "Bộ ba ẩn (hidden triple)",
+    "x_wing": "X-Wing",
+    "swordfish": "Swordfish",
+    "chain": "Chuỗi tô màu (simple coloring)",
+}
 
 class SudokuApp(ctk.CTk):
     """
@@ -36,6 +50,8 @@ class SudokuApp(ctk.CTk):
 
         # --- Game Logic & State ---
         self.sudoku_generator = SudokuGenerator() # For generating new puzzles
+        self.sized_generators = {9: self.sudoku_generator} # grid_size -> SudokuGenerator (created on demand)
+        self.board_tracker = None # BoardTracker over classic_game_state['board_data']
         self.current_frame = None                 # Holds the currently displayed UI screen
         
         # Multiplayer State
@@ -185,12 +201,7 @@ class SudokuApp(ctk.CTk):
         if isinstance(self.current_frame, GameScreenUI) and self.is_classic_game_active and self.classic_game_state.get('board_data'):
             # GameScreenUI needs to re-fetch colors with the new config
             self.current_frame.board_specific_colors = self.current_frame.controller.ui.ColorScheme().get_colors(self.board_colors_config)
-            self.current_frame.update_board_display(
-                self.classic_game_state['board_data'],
-                self.classic_game_state['fixed_mask'],
-                self.classic_game_state.get('error_cells'),
-                self.classic_game_state.get('pencil_data')
-            )
+            self.current_frame.update_board_display(self.classic_game_state['board_data'])
         # If settings screen is active, repopulate color inputs
         elif isinstance(self.current_frame, SettingsScreen):
             self.current_frame._populate_board_color_inputs()
@@ -216,6 +227,7 @@ class SudokuApp(ctk.CTk):
             args, kwargs = [], {} # Arguments for re-initializing the screen
             if isinstance(self.current_frame, GameScreenUI):
                 kwargs['game_mode'] = self.current_frame.game_mode # Preserve game mode
+                kwargs['grid_size'] = self.current_frame.grid_size # Preserve board size
             self.switch_frame(current_screen_type, *args, **kwargs)
 
 
@@ -274,11 +286,17 @@ class SudokuApp(ctk.CTk):
         self.wait_window(dialog) # Wait for dialog to close
         
         if hasattr(dialog, 'ok_pressed') and dialog.ok_pressed and dialog.result:
-            self.start_new_classic_game(dialog.result) # Start game with selected difficulty
+            self.start_new_classic_game(dialog.result, getattr(dialog, 'selected_size', 9)) # Start game with selected difficulty and size
 
     # --- Classic Game Mode Logic ---
-    def start_new_classic_game(self, difficulty):
-        """Starts a new classic Sudoku game with the given difficulty."""
+    def get_generator_for_size(self, size):
+        """Returns the (cached) SudokuGenerator for the given board size."""
+        if size not in self.sized_generators:
+            self.sized_generators[size] = SudokuGenerator(size)
+        return self.sized_generators[size]
+
+    def start_new_classic_game(self, difficulty, size=9):
+        """Starts a new classic Sudoku game with the given difficulty and board size."""
         # Reset win streak if starting new while another game was active (and not just won)
         if self.is_classic_game_active and not self.just_won_classic_game:
             self.user_stats["current_win_streak"] = 0
@@ -293,32 +311,29 @@ class SudokuApp(ctk.CTk):
         max_m = 3 if difficulty.lower() in ["hard", "expert"] else 5 # Max mistakes
         hints_r = 6 # Hints available
 
-        board, solution = self.sudoku_generator.generate_puzzle(difficulty)
+        board, solution = self.get_generator_for_size(size).generate_puzzle(difficulty)
         if not board or not solution:
             messagebox.showerror("Lỗi", "Không thể tạo bảng Sudoku.", parent=self)
             return
 
-        fixed_mask = [[(board[r][c] != 0) for c in range(9)] for r in range(9)]
-        
         # Initialize classic_game_state
+        # board_data is a SudokuBoard: values, fixed cells, pencil marks and error flags in one object
         self.classic_game_state = {
-            'board_data': board,
+            'board_data': SudokuBoard.from_grid(board),
             'solution_data': solution,
-            'fixed_mask': fixed_mask,
-            'pencil_data': {},
             'time_played': 0,
             'mistakes': 0,
             'max_mistakes': max_m,
             'difficulty': difficulty,
             'score': 0,
-            'error_cells': set(), # Stores (r,c) of cells with incorrect numbers
             'game_id': str(uuid.uuid4()), # Unique ID for this game instance
             'hints_available': hints_r,
-            'hints_used_count': 0
+            'hints_used_count': 0,
+            'size': size
         }
         self.selected_cell_classic = None
         
-        self.switch_frame(GameScreenUI, game_mode="classic")
+        self.switch_frame(GameScreenUI, game_mode="classic", grid_size=size)
         if isinstance(self.current_frame, GameScreenUI):
             ui = self.current_frame
             gs = self.classic_game_state
@@ -332,7 +347,8 @@ class SudokuApp(ctk.CTk):
             if hasattr(ui, 'hints_remaining_var'): # Ensure var exists
                 ui.hints_remaining_var.set(f"💡 Gợi ý ({gs['hints_available']})")
             
-            ui.update_board_display(gs['board_data'], gs['fixed_mask'], gs['error_cells'], gs.get('pencil_data',{}))
+            self.get_board_tracker() # Track the new board (also feeds the number pad counts)
+            ui.update_board_display(gs['board_data'])
             ui.update_info_display(gs['mistakes'], gs['time_played'], gs['difficulty'], gs['score'], gs['max_mistakes'])
             
             self.start_classic_timer()
@@ -352,8 +368,9 @@ class SudokuApp(ctk.CTk):
         gs.setdefault('max_mistakes', 3 if gs.get('difficulty', 'medium').lower() in ["hard", "expert"] else 5)
         gs.setdefault('hints_available', 6)
         gs.setdefault('hints_used_count', 0)
+        gs.setdefault('size', len(gs['board_data']))
 
-        self.switch_frame(GameScreenUI, game_mode="classic")
+        self.switch_frame(GameScreenUI, game_mode="classic", grid_size=gs['size'])
         if isinstance(self.current_frame, GameScreenUI):
             ui = self.current_frame
             ui.reset_ui_for_new_game()
@@ -366,7 +383,8 @@ class SudokuApp(ctk.CTk):
             if hasattr(ui, 'hints_remaining_var'):
                 ui.hints_remaining_var.set(f"💡 Gợi ý ({gs['hints_available']})")
 
-            ui.update_board_display(gs['board_data'], gs['fixed_mask'], gs.get('error_cells', set()), gs.get('pencil_data', {}))
+            self.get_board_tracker()
+            ui.update_board_display(gs['board_data'])
             ui.update_info_display(gs['mistakes'], gs['time_played'], gs['difficulty'], gs['score'], gs['max_mistakes'])
             
             self.start_classic_timer() # Resume timer
@@ -388,7 +406,7 @@ class SudokuApp(ctk.CTk):
             # In multiplayer, selection is simpler, just for input focus.
             # Server might have its own concept of "active cell" if turn-based highlighting is desired.
             current_ui.selected_cell_coords = (r,c) # GameScreenUI tracks its own selected_cell for MP input
-            current_ui.highlight_selected_cell(r, c, []) # Basic highlight
+            current_ui.highlight_selected_cell(r, c, set()) # Basic highlight
 
     def input_number(self, num_to_input, is_pencil_mode):
         """Handles number input from the number pad."""
@@ -400,61 +418,62 @@ class SudokuApp(ctk.CTk):
             if not self.selected_cell_classic: return # No cell selected
             r, c = self.selected_cell_classic
             gs = self.classic_game_state # Game State shorthand
+            board = gs['board_data']
             
-            if gs['fixed_mask'][r][c]: return # Cannot change fixed cells
-
-            # Save current state for Undo
-            prev_board_state = [row[:] for row in gs['board_data']]
-            prev_pencil_state = {k: v.copy() for k, v in gs.get('pencil_data', {}).items()}
-            prev_error_state = gs.get('error_cells', set()).copy()
-            prev_mistakes = gs.get('mistakes', 0)
-            prev_score = gs.get('score', 0)
-            self.undo_stack.append({
-                'board_data': prev_board_state, 'pencil_data': prev_pencil_state,
-                'error_cells': prev_error_state, 'mistakes': prev_mistakes, 'score': prev_score
-            })
-            if len(self.undo_stack) > 50: self.undo_stack.pop(0) # Limit undo stack size
+            if board.is_fixed(r, c): return # Cannot change fixed cells
+
+            # Save current state for Undo (one compact copy of the board)
+            self.push_undo_snapshot()
+            conflict_cells = set() # Other cells whose error flag changed (solution-free checking)
 
             # Pencil Mode Logic
             if is_pencil_mode:
-                pencil_marks_for_cell = gs['pencil_data'].setdefault((r, c), set())
-                if num_to_input in pencil_marks_for_cell:
-                    pencil_marks_for_cell.remove(num_to_input)
-                else:
-                    pencil_marks_for_cell.add(num_to_input)
-                if not pencil_marks_for_cell: # If set becomes empty
-                    del gs['pencil_data'][(r,c)]
+                board.toggle_pencil(r, c, num_to_input)
                 
                 # Clear main number and error if placing pencil marks
-                if gs['board_data'][r][c] != 0:
-                    gs['board_data'][r][c] = 0
-                    gs['error_cells'].discard((r,c)) # Clear error from this cell
+                if board.get(r, c) != 0:
+                    self.get_board_tracker().clear(r, c)
+                    board.set_error(r, c, False) # Clear error from this cell
             
             # Normal Number Input Logic
             else:
-                old_number_in_cell = gs['board_data'][r][c]
-                gs['board_data'][r][c] = num_to_input # Place the number
+                tracker = self.get_board_tracker()
+                old_number_in_cell = tracker.set(r, c, num_to_input) # Place the number
                 
-                if (r,c) in gs['pencil_data']: del gs['pencil_data'][(r,c)] # Clear pencil marks
-                gs['error_cells'].discard((r,c)) # Clear previous error on this cell
+                board.clear_pencil(r, c) # Clear pencil marks
+                board.set_error(r, c, False) # Clear previous error on this cell
+
+                solution = gs.get('solution_data')
+                if solution is None:
+                    # Không có lời giải (đề tự nhập, nhiều lời giải): ô sai = ô trùng số trong hàng/cột/khối.
+                    # Chỉ các ô cùng hàng/cột/khối chứa số cũ hoặc số mới mới có thể đổi trạng thái.
+                    for rr, cc in tracker.cells_with(r, c, (old_number_in_cell, num_to_input)):
+                        board.set_error(rr, cc, tracker.has_conflict(rr, cc))
+                        conflict_cells.add((rr, cc))
+                    is_correct_number = not tracker.has_conflict(r, c)
+                else:
+                    is_correct_number = num_to_input == solution[r][c]
 
                 if num_to_input != 0: # If not erasing
                     # Check if the number is incorrect
-                    if num_to_input != gs['solution_data'][r][c]:
-                        gs['error_cells'].add((r,c)) # Mark as error
+                    if not is_correct_number:
+                        board.set_error(r, c) # Mark as error
                     
                     # Update mistakes and score
-                    if old_number_in_cell != num_to_input and num_to_input != gs['solution_data'][r][c]: # Made a mistake
+                    if old_number_in_cell != num_to_input and not is_correct_number: # Made a mistake
                         gs['mistakes'] += 1
                         gs['score'] = max(0, gs.get('score', 0) - 50) # Penalty
-                    elif num_to_input == gs['solution_data'][r][c]: # Corrected a mistake or filled empty
+                    elif is_correct_number: # Corrected a mistake or filled empty
                         if old_number_in_cell != 0 and old_number_in_cell != num_to_input: # Corrected a wrong number
                             gs['score'] = gs.get('score', 0) + 20
                         elif old_number_in_cell == 0 : # Filled an empty cell correctly
                             gs['score'] = gs.get('score', 0) + 10
             
-            # Update UI display
-            current_ui.update_board_display(gs['board_data'], gs['fixed_mask'], gs['error_cells'], gs['pencil_data'])
+            # Update UI display: only this cell and the peers whose candidates changed (~20 cells)
+            changed_cells = set(self.get_board_tracker().hint_engine.take_changed())
+            changed_cells.add((r, c))
+            changed_cells.update(conflict_cells)
+            current_ui.update_cells_display(board, changed_cells)
             current_ui.update_info_display(gs['mistakes'], gs['time_played'], gs['difficulty'], gs['score'], gs['max_mistakes'])
 
             # Check for Game Over (too many mistakes)
@@ -496,22 +515,18 @@ class SudokuApp(ctk.CTk):
 
         if self.is_classic_game_active and self.selected_cell_classic:
             r, c = self.selected_cell_classic
-            gs = self.classic_game_state
-            if gs['fixed_mask'][r][c]: return # Cannot erase fixed cells
+            board = self.classic_game_state['board_data']
+            if board.is_fixed(r, c): return # Cannot erase fixed cells
 
             # If there's a number, erasing is like inputting 0
-            if gs['board_data'][r][c] != 0:
+            if board.get(r, c) != 0:
                 self.input_number(0, False) # is_pencil_mode = False
                 return
             # If there are pencil marks, clear them
-            elif (r,c) in gs.get('pencil_data', {}):
-                # Save state for Undo (only for pencil mark removal)
-                prev_b = [row[:] for row in gs['board_data']]; prev_p = {k: v.copy() for k, v in gs.get('pencil_data', {}).items()}; prev_e = gs.get('error_cells', set()).copy(); prev_m = gs.get('mistakes', 0); prev_s = gs.get('score', 0)
-                self.undo_stack.append({'board_data': prev_b, 'pencil_data': prev_p, 'error_cells': prev_e, 'mistakes': prev_m, 'score': prev_s});
-                if len(self.undo_stack) > 50: self.undo_stack.pop(0)
-
-                if (r,c) in gs['pencil_data']: del gs['pencil_data'][(r,c)]
-                current_ui.update_board_display(gs['board_data'], gs['fixed_mask'], gs['error_cells'], gs['pencil_data'])
+            elif board.pencil_mask(r, c):
+                self.push_undo_snapshot() # Save state for Undo (only for pencil mark removal)
+                board.clear_pencil(r, c)
+                current_ui.update_cells_display(board, [(r, c)])
                 self.save_classic_game()
         
         elif self.is_multiplayer and self.sudoku_client and current_ui.selected_cell_coords:
@@ -531,43 +546,62 @@ class SudokuApp(ctk.CTk):
         prev_state = self.undo_stack.pop()
         gs = self.classic_game_state
         gs.update(prev_state) # Restore game state attributes
+        self.get_board_tracker() # board_data was replaced by the snapshot: rebuild the tracker
         
-        current_ui.update_board_display(gs['board_data'], gs['fixed_mask'], gs['error_cells'], gs['pencil_data'])
+        current_ui.update_board_display(gs['board_data'])
         current_ui.update_info_display(gs['mistakes'], gs['time_played'], gs['difficulty'], gs['score'], gs['max_mistakes'])
         self.save_classic_game()
         return True
 
+    def push_undo_snapshot(self):
+        """Saves the classic board (a cheap SudokuBoard copy), mistakes and score for Undo."""
+        gs = self.classic_game_state
+        self.undo_stack.append({'board_data': gs['board_data'].copy(), 'mistakes': gs.get('mistakes', 0), 'score': gs.get('score', 0)})
+        if len(self.undo_stack) > 50: self.undo_stack.pop(0) # Limit undo stack size
+
     def request_hint(self):
-        """Provides a hint for the selected cell in classic mode."""
+        """
+        Provides a hint in classic mode: the next logical step from the
+        HintEngine (cell, digit and technique) while every filled cell is
+        right, otherwise the correct number of the selected cell.
+        """
         ui = self.current_frame
         if not isinstance(ui, GameScreenUI): return
 
         if self.is_classic_game_active:
-            if not self.selected_cell_classic :
-                ui.show_message("Gợi ý", "Vui lòng chọn một ô.", "warning")
-                return
-            
             gs = self.classic_game_state
             if gs.get('hints_available', 0) <= 0:
                 ui.show_message("Gợi ý", "Hết lượt gợi ý!", "warning")
                 return
-            
-            r, c = self.selected_cell_classic
-            # Don't give hint for fixed cells or already correct cells
-            if gs['fixed_mask'][r][c] or \
-               (gs['board_data'][r][c] != 0 and gs['board_data'][r][c] == gs['solution_data'][r][c]):
-                ui.show_message("Gợi ý", "Ô này không cần gợi ý.", "info")
-                return
 
-            # Save state for Undo before applying hint
-            prev_b = [row[:] for row in gs['board_data']]; prev_p = {k: v.copy() for k, v in gs.get('pencil_data', {}).items()}; prev_e = gs.get('error_cells', set()).copy(); prev_m = gs.get('mistakes', 0); prev_s = gs.get('score', 0)
-            self.undo_stack.append({'board_data': prev_b, 'pencil_data': prev_p, 'error_cells': prev_e, 'mistakes': prev_m, 'score': prev_s});
-            if len(self.undo_stack) > 50: self.undo_stack.pop(0)
-
-            correct_number = gs['solution_data'][r][c]
-            gs['board_data'][r][c] = correct_number
-            if (r,c) in gs['pencil_data']: del gs['pencil_data'][(r,c)] # Clear pencil marks
-            gs['error_cells'].discard((r,c)) # Clear error state
+            board = gs['board_data']
+            tracker = self.get_board_tracker()
+            # Bước logic chỉ đáng tin khi chưa có ô nào điền sai hoặc trùng số
+            logical = tracker.hint_engine.hint() if tracker.mismatches == 0 and tracker.conflicts == 0 else None
+            if logical is not None and logical['digit'] is not None:
+                r, c = logical['cell']
+                self.selected_cell_classic = (r, c)
+            else:
+                logical = None
+                if gs.get('solution_data') is None: # Không có lời giải để lộ ra
+                    ui.show_message("Gợi ý", "Không tìm được bước logic tiếp theo.", "info")
+                    return
+                if not self.selected_cell_classic :
+                    ui.show_message("Gợi ý", "Vui lòng chọn một ô.", "warning")
+                    return
+                r, c = self.selected_cell_classic
+                # Don't give hint for fixed cells or already correct cells
+                if board.is_fixed(r, c) or \
+                   (board.get(r, c) != 0 and board.get(r, c) == gs['solution_data'][r][c]):
+                    ui.show_message("Gợi ý", "Ô này không cần gợi ý.", "info")
+                    return
+
+            self.push_undo_snapshot() # Save state for Undo before applying hint
+
+            correct_number = logical['digit'] if logical else gs['solution_data'][r][c]
+            self.get_board_tracker().set(r, c, correct_number)
+            board.clear_pencil(r, c) # Clear pencil marks
+            board.set_error(r, c, False) # Clear error state
             gs['hints_available'] -= 1
             gs['hints_used_count'] = gs.get('hints_used_count', 0) + 1
             gs['score'] = max(0, gs.get('score', 0) - 75) # Penalty for hint
@@ -575,20 +609,28 @@ class SudokuApp(ctk.CTk):
             if hasattr(ui, 'hints_remaining_var'):
                  ui.hints_remaining_var.set(f"💡 Gợi ý ({gs['hints_available']})")
 
-            ui.update_board_display(gs['board_data'], gs['fixed_mask'], gs['error_cells'], gs['pencil_data'])
+            ui.update_board_display(board)
             ui.update_cell_display(r, c, correct_number, False, False, None, is_hint_fill=True) # Special hint fill
             ui.update_info_display(gs['mistakes'], gs['time_played'], gs['difficulty'], gs['score'], gs['max_mistakes'])
 
             # Temporarily highlight the hint, then revert to normal cell display
             def clear_visual_hint():
                 if not self.is_classic_game_active or not gs.get('board_data') or not ui.winfo_exists(): return
-                is_err = (r,c) in gs['error_cells'] # Recheck error status after hint
-                ui.update_cell_display(r, c, gs['board_data'][r][c], gs['fixed_mask'][r][c], is_err, gs['pencil_data'].get((r,c)), is_hint_fill=False)
+                hint_board = gs['board_data']
+                is_err = hint_board.is_error(r, c) # Recheck error status after hint
+                ui.update_cell_display(r, c, hint_board.get(r, c), hint_board.is_fixed(r, c), is_err, hint_board.pencil_marks(r, c), is_hint_fill=False)
                 if self.selected_cell_classic == (r,c): # Re-apply selection highlight
                     rel = self.get_related_coords_for_highlight(r,c)
                     ui.highlight_selected_cell(r,c,rel)
             self.after(1200, clear_visual_hint) # Clear visual hint after 1.2 seconds
 
+            if logical:
+                technique = HINT_TECHNIQUE_NAMES.get(logical['technique'], logical['technique'])
+                detail = f"Hàng {r + 1}, cột {c + 1} là {correct_number}.\nKỹ thuật: {technique}"
+                if logical['eliminations']:
+                    detail += f" ({len(logical['eliminations'])} ứng viên bị loại trước đó)"
+                ui.show_message("Gợi ý", detail, "info")
+
             self.save_classic_game()
             
             # Check for win after hint
@@ -601,33 +643,89 @@ class SudokuApp(ctk.CTk):
                 self.classic_game_state = {}; self.save_classic_game(); self.show_main_menu()
         
         elif self.is_multiplayer:
-            ui.show_message("Gợi ý", "Gợi ý không có trong chơi mạng.", "info")
+            if self.sudoku_client and self.sudoku_client.current_game_id:
+                self.sudoku_client.request_hint() # Server trả lời bằng 'hint' -> show_multiplayer_hint
+            else:
+                ui.show_message("Gợi ý", "Chưa ở trong phòng chơi nào.", "warning")
+
+    def show_multiplayer_hint(self, hint):
+        """
+        Shows the server's coach hint (see HintEngine.hint) for the shared
+        board: cell, digit and technique. Nothing is filled in.
+        """
+        ui = self.current_frame
+        if not self.is_multiplayer or not isinstance(ui, GameScreenUI): return
+        if hint is None:
+            ui.show_message("Gợi ý", "Không tìm được bước logic tiếp theo.", "info")
+            return
+        r, c = hint['cell']
+        if hint['digit'] is None: # 'contradiction': ô này không còn số nào hợp lệ
+            ui.show_message("Gợi ý", f"Hàng {r + 1}, cột {c + 1} không còn số nào hợp lệ.", "warning")
+            return
+        technique = HINT_TECHNIQUE_NAMES.get(hint['technique'], hint['technique'])
+        ui.show_message("Gợi ý", f"Hàng {r + 1}, cột {c + 1} là {hint['digit']}.\nKỹ thuật: {technique}", "info")
+
+    def request_puzzle_check(self):
+        """Asks the server whether the shared multiplayer board can still be solved."""
+        ui = self.current_frame
+        if not self.is_multiplayer or not isinstance(ui, GameScreenUI): return
+        client = self.sudoku_client
+        if not client or not client.current_game_id or client.server_board_state is None:
+            ui.show_message("Kiểm tra", "Chưa ở trong phòng chơi nào.", "warning")
+            return
+        client.request_puzzle_check(client.server_board_state) # Server trả lời bằng 'puzzle_check'
+
+    def show_puzzle_check(self, result):
+        """Shows the server's check_puzzle result for the shared board."""
+        ui = self.current_frame
+        if not self.is_multiplayer or not isinstance(ui, GameScreenUI): return
+        texts = {
+            'solved': "Bảng hiện tại vẫn giải được.",
+            'unsolvable': "Bảng hiện tại không còn lời giải!",
+            'limit': "Server dừng kiểm tra: bảng quá mở.",
+            'timeout': "Server dừng kiểm tra: quá thời gian.",
+            'invalid': "Bảng gửi lên không hợp lệ.",
+        }
+        status = result.get('status')
+        ui.show_message("Kiểm tra", texts.get(status, str(status)), "warning" if status == 'unsolvable' else "info")
 
     def is_board_complete_and_correct(self):
         """Checks if the classic game board is fully and correctly filled."""
         gs = self.classic_game_state
         if not gs or not gs.get('board_data') or not gs.get('solution_data'):
             return False
-        for r in range(9):
-            for c in range(9):
-                if gs['board_data'][r][c] == 0 or \
-                   gs['board_data'][r][c] != gs['solution_data'][r][c]:
-                    return False
-        return True
+        return self.get_board_tracker().is_correct() # O(1): the tracker keeps the counts
+
+    def get_board_tracker(self):
+        """
+        Returns the BoardTracker for the classic board, rebuilding it when
+        board_data was replaced (new game, load, undo), and hands it to the
+        game screen for the number pad counts.
+        """
+        gs = self.classic_game_state
+        tracker = self.board_tracker
+        if tracker is None or tracker.board is not gs.get('board_data') or tracker.solution is not gs.get('solution_data'):
+            tracker = self.board_tracker = BoardTracker(gs['board_data'], gs.get('solution_data'),
+                                                        HintEngine(gs['board_data']))
+        if isinstance(self.current_frame, GameScreenUI):
+            self.current_frame.board_tracker = tracker
+        return tracker
 
     def get_related_coords_for_highlight(self, r, c):
-        """Returns a list of coordinates related to (r,c) for highlighting."""
+        """Returns the set of coordinates related to (r,c) for highlighting."""
         rel = set()
+        size = self.current_frame.grid_size if isinstance(self.current_frame, GameScreenUI) else 9
+        box_rows, box_cols = box_dimensions(size)
         # Row and Column
-        for i in range(9):
+        for i in range(size):
             rel.add((r, i))
             rel.add((i, c))
-        # Subgrid (3x3 box)
-        sr, sc = (r // 3) * 3, (c // 3) * 3 # Top-left of subgrid
-        for i in range(3):
-            for j in range(3):
+        # Subgrid (3x3 box for 9x9, 2x3 for 6x6, ...)
+        sr, sc = (r // box_rows) * box_rows, (c // box_cols) * box_cols # Top-left of subgrid
+        for i in range(box_rows):
+            for j in range(box_cols):
                 rel.add((sr + i, sc + j))
-        return list(rel)
+        return rel
 
     def start_classic_timer(self):
         """Starts or continues the timer for classic games."""
@@ -658,14 +756,10 @@ class SudokuApp(ctk.CTk):
             if os.path.exists(SAVE_FILE_PATH):
                 with open(SAVE_FILE_PATH, 'r') as f:
                     data = json.load(f)
-                if data and data.get('board_data'): # Basic check for valid save data
-                    # Convert pencil_data keys from "r,c" strings to (r,c) tuples
-                    pencil_data = {tuple(map(int, k.split(','))): set(v)
-                                   for k, v in data.get('pencil_data', {}).items()}
-                    # Convert error_cells from list of lists to set of tuples
-                    error_cells = set(map(tuple, data.get('error_cells', [])))
-                    
-                    self.classic_game_state = {**data, 'pencil_data': pencil_data, 'error_cells': error_cells}
+                # Compact save (SudokuBoard.to_save) or an older list-based one with pencil dict and error list
+                board, fields = SudokuBoard.from_save(data or {})
+                if board is not None:
+                    self.classic_game_state = {**fields, 'board_data': board}
                     self.classic_game_state.setdefault('hints_used_count', 0) # For older saves
             else:
                 self.classic_game_state = {} # No save file
@@ -684,11 +778,9 @@ class SudokuApp(ctk.CTk):
                 return
 
             data_to_save = self.classic_game_state.copy()
-            # Convert pencil_data keys (tuples) to strings for JSON compatibility
-            data_to_save['pencil_data'] = {f"{k[0]},{k[1]}": list(v)
-                                           for k, v in data_to_save.get('pencil_data', {}).items()}
-            # Convert error_cells (set of tuples) to list of lists for JSON
-            data_to_save['error_cells'] = [list(cell) for cell in data_to_save.get('error_cells', set())]
+            # The whole SudokuBoard (values, fixed, pencil, errors) is saved as one base64 blob
+            board = data_to_save.pop('board_data')
+            data_to_save.update(board.to_save())
             
             with open(SAVE_FILE_PATH, 'w') as f:
                 json.dump(data_to_save, f, indent=2)
@@ -745,6 +837,12 @@ class SudokuApp(ctk.CTk):
                 self.sudoku_client.request_join_game(game_id_to_join.strip())
         # Else: User cancelled or entered nothing.
 
+    def resize_multiplayer_board(self, size):
+        """Rebuilds the multiplayer screen when the server sends a board of a different size."""
+        self.switch_frame(GameScreenUI, game_mode="multiplayer", grid_size=size)
+        if isinstance(self.current_frame, GameScreenUI) and self.sudoku_client:
+            self.sudoku_client.set_game_ui(self.current_frame)
+
     # --- Application Lifecycle ---
     def quit_application(self):
         """Handles application shutdown procedures."""
@@ -0,0 +1,143 @@
+# protocol.py
+"""
+Wire framing shared by server.py and client.py.
+
+Right after accepting a connection the server sends connected_ack as one
+JSON line, listing the protocol version, the framings it speaks and the
+largest frame it accepts. The client answers with one JSON line
+{'command': 'hello', 'protocol': 1, 'framing': ...}; from then on both sides
+use that framing:
+
+  length  : 4-byte big-endian payload size, then the UTF-8 JSON payload.
+            A frame is read as its header, then exactly that many bytes.
+  newline : one JSON object per line. Meant for debugging: a client that
+            never sends hello (nc, telnet) stays on this framing.
+
+Frames larger than MAX_FRAME_SIZE are refused with FrameError.
+"""
+import asyncio
+import json
+import struct
+
+PROTOCOL_VERSION = 1
+FRAMINGS = ("length", "newline")
+DEFAULT_FRAMING = "length"
+MAX_FRAME_SIZE = 1 << 20 # Byte tối đa của một message (1 MB)
+FRAME_HEADER = struct.Struct("!I")
+RECV_SIZE = 4096
+
+
+class FrameError(ValueError):
+    """A frame that breaks the protocol: too large, not a JSON object, or an unknown framing."""
+
+
+def encode_payload(message):
+    """UTF-8 JSON bytes of a message dict (encode once, frame per connection)."""
+    return json.dumps(message).encode("utf-8")
+
+
+def frame(payload, framing):
+    """Bytes on the wire for an encoded payload."""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE}")
+    if framing == "length":
+        return FRAME_HEADER.pack(len(payload)) + payload
+    if framing == "newline":
+        return payload + b"\n" # json.dumps escapes newlines inside strings
+    raise FrameError(f"Unknown framing '{framing}'. Choose from: {', '.join(FRAMINGS)}")
+
+
+def encode_frame(message, framing):
+    return frame(encode_payload(message), framing)
+
+
+def decode_payload(payload):
+    """Message dict of one frame's payload (bytes or bytearray)."""
+    try:
+        message = json.loads(payload)
+    except ValueError as e: # JSONDecodeError và UnicodeDecodeError đều là ValueError
+        raise FrameError(f"Invalid JSON frame: {e}") from None
+    if not isinstance(message, dict):
+        raise FrameError("Frame is not a JSON object")
+    return message
+
+
+class FrameReader:
+    """
+    Reads messages from a blocking socket. Bytes received past the current
+    frame wait in one bytearray; a length-prefixed payload is received
+    straight into a bytearray of its exact size through a memoryview, so
+    large or queued messages are never rescanned or copied around.
+    Raises EOFError when the peer closes the connection.
+    """
+    def __init__(self, sock, framing="newline", max_frame_size=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.pending = bytearray() # Đã nhận nhưng chưa thuộc frame nào
+
+    def read(self):
+        """Next message dict."""
+        if self.framing == "length":
+            size = FRAME_HEADER.unpack(self._read_exact(FRAME_HEADER.size))[0]
+            if size > self.max_frame_size:
+                raise FrameError(f"Frame of {size} bytes exceeds {self.max_frame_size}")
+            return decode_payload(self._read_exact(size))
+        while True:
+            line = self._read_line()
+            if line.strip(): # Bỏ qua dòng trống
+                return decode_payload(line)
+
+    def _read_exact(self, n):
+        payload = bytearray(n)
+        with memoryview(payload) as view:
+            got = min(n, len(self.pending))
+            if got:
+                view[:got] = self.pending[:got]
+                del self.pending[:got]
+            while got < n:
+                received = self.sock.recv_into(view[got:])
+                if not received:
+                    raise EOFError("connection closed")
+                got += received
+        return payload
+
+    def _read_line(self):
+        start = 0 # Phần đã dò không có "\n" thì không dò lại
+        while True:
+            end = self.pending.find(b"\n", start)
+            if end >= 0:
+                line = self.pending[:end]
+                del self.pending[:end + 1]
+                return line
+            if len(self.pending) > self.max_frame_size:
+                raise FrameError(f"Line exceeds {self.max_frame_size} bytes")
+            start = len(self.pending)
+            chunk = self.sock.recv(RECV_SIZE)
+            if not chunk:
+                raise EOFError("connection closed")
+            self.pending += chunk
+
+
+async def read_message(reader, framing, max_frame_size=MAX_FRAME_SIZE):
+    """
+    Next message dict from an asyncio StreamReader, or None at the end of
+    the stream. Newline framing needs the reader's limit above
+    max_frame_size (see asyncio.start_server(limit=...)).
+    """
+    try:
+        if framing == "length":
+            size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))[0]
+            if size > max_frame_size:
+                raise FrameError(f"Frame of {size} bytes exceeds {max_frame_size}")
+            return decode_payload(await reader.readexactly(size))
+        while True:
+            line = await reader.readuntil(b"\n")
+            if len(line) > max_frame_size + 1:
+                raise FrameError(f"Line exceeds {max_frame_size} bytes")
+            if line.strip():
+                return decode_payload(line)
+    except asyncio.IncompleteReadError:
+        return None # Kết nối đóng (giữa chừng một frame cũng coi như đóng)
+    except asyncio.LimitOverrunError:
+        raise FrameError(f"Line exceeds {max_frame_size} bytes") from None
@@ -0,0 +1,145 @@
+# puzzle_factory.py
+"""
+Command-line puzzle factory: generates, rates, deduplicates and writes
+puzzles into a binary puzzle bank (see sudoku_logic.PuzzleBank), using a
+process pool across all CPU cores.
+
+Puzzles are deduplicated by their canonical fingerprint, so a relabeled,
+permuted or transposed copy of a puzzle already written counts as a
+duplicate. With --dedup-file the fingerprints go to an on-disk
+FingerprintSet, which also keeps later runs from repeating earlier banks.
+
+Example:
+    python puzzle_factory.py --count 100000 --difficulty easy,medium,hard --output puzzles.bank
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sudoku_logic import iter_puzzles, PuzzleBankWriter, PuzzlePool, FingerprintSet, BOX_SHAPES
+
+PROGRESS_INTERVAL = 1.0     # Giây giữa hai lần in tiến độ
+MAX_DUPLICATE_STREAK = 2000 # Consecutive duplicates before a level is taken as exhausted
+
+
+class _MemorySet(set):
+    """In-memory stand-in for FingerprintSet (same add() contract)."""
+    def add(self, fingerprint):
+        if fingerprint in self:
+            return False
+        set.add(self, fingerprint)
+        return True
+
+    def close(self):
+        pass
+
+
+def build_bank(output, count, difficulties, size=9, solver="bitmask", workers=None, seed=None,
+               max_pending=None, dedup_path=None, report=print, max_duplicate_streak=MAX_DUPLICATE_STREAK):
+    """
+    Writes `count` unique puzzles of every difficulty into the bank `output`.
+    Fingerprints of written puzzles are kept in memory, or in the on-disk
+    FingerprintSet `dedup_path` (created if missing) when given. The on-disk
+    set only learns this run's fingerprints once the bank file is committed,
+    so a failed or interrupted run leaves it untouched.
+    A level that yields `max_duplicate_streak` duplicates in a row has run
+    out of distinct puzzles (small boards, easy levels): it stops with a
+    warning and the missing puzzles are reported as its 'shortfall'.
+    Returns {difficulty: {'count', 'duplicates', 'shortfall', 'seconds', 'per_second'}}.
+    """
+    workers = workers or os.cpu_count() or 1
+    results = {}
+    seen = FingerprintSet(dedup_path) if dedup_path else None
+    written_fingerprints = _MemorySet() # Của lần chạy này, chỉ ghi vào `seen` sau khi bank đã ghi xong
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with PuzzleBankWriter(output, size) as writer:
+            for i, difficulty in enumerate(difficulties):
+                written = 0
+                duplicates = 0
+                streak = 0 # Số puzzle trùng liên tiếp
+                start = last_report = time.monotonic()
+                # Dấu vân tay được tính ngay trong tiến trình con đã tạo puzzle
+                stream = iter_puzzles(difficulty, None if seed is None else seed + i, size, solver,
+                                      workers, max_pending, executor, fingerprints=True)
+                try:
+                    while written < count:
+                        puzzle, solution, rating, puzzle_seed, fingerprint = next(stream)
+                        if (seen is not None and fingerprint in seen) or not written_fingerprints.add(fingerprint):
+                            duplicates += 1
+                            streak += 1
+                            if streak >= max_duplicate_streak:
+                                report(f"FACTORY: CẢNH BÁO - {difficulty}: {streak} puzzle trùng liên tiếp, "
+                                       f"dừng ở {written}/{count} (thiếu {count - written})")
+                                break
+                        else:
+                            writer.add(difficulty, puzzle, solution, rating, puzzle_seed)
+                            written += 1
+                            streak = 0
+
+                        now = time.monotonic()
+                        if now - last_report >= PROGRESS_INTERVAL:
+                            last_report = now
+                            report(f"  {difficulty}: {written}/{count} "
+                                   f"({written / (now - start):.1f} puzzle/s, {duplicates} trùng)")
+                finally:
+                    stream.close()
+
+                elapsed = time.monotonic() - start
+                results[difficulty] = {
+                    'count': written,
+                    'duplicates': duplicates,
+                    'shortfall': count - written,
+                    'seconds': elapsed,
+                    'per_second': written / elapsed if elapsed > 0 else 0.0,
+                }
+                report(f"FACTORY: {difficulty} xong - {written} puzzle trong {elapsed:.1f}s "
+                       f"({results[difficulty]['per_second']:.1f} puzzle/s)")
+        if seen is not None: # Bank đã ghi (rename) xong
+            for fingerprint in written_fingerprints:
+                seen.add(fingerprint)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if seen is not None:
+            seen.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tạo hàng loạt puzzle Sudoku vào một ngân hàng puzzle nhị phân.")
+    parser.add_argument("--count", type=int, required=True, help="Số puzzle (không trùng) cho mỗi độ khó")
+    parser.add_argument("--difficulty", default=",".join(PuzzlePool.DIFFICULTIES),
+                        help="Danh sách độ khó, cách nhau bởi dấu phẩy")
+    parser.add_argument("--output", required=True, help="File ngân hàng puzzle cần ghi")
+    parser.add_argument("--size", type=int, default=9, choices=sorted(BOX_SHAPES), help="Kích thước bảng")
+    parser.add_argument("--solver", default="bitmask", help="Bộ giải dùng khi tạo puzzle (bitmask, dlx)")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình (mặc định: số lõi CPU)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed để có thể tạo lại đúng các puzzle")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Số việc tối đa đang chờ trong pool (mặc định: 2 x workers)")
+    parser.add_argument("--dedup-file", default=None,
+                        help="File FingerprintSet để lọc trùng trên đĩa (giữ lại giữa các lần chạy)")
+    parser.add_argument("--max-duplicate-streak", type=int, default=MAX_DUPLICATE_STREAK,
+                        help="Số puzzle trùng liên tiếp trước khi bỏ một độ khó (đã hết puzzle khác nhau)")
+    args = parser.parse_args(argv)
+
+    difficulties = [d.strip().lower() for d in args.difficulty.split(",") if d.strip()]
+    print(f"FACTORY: {args.count} puzzle x {len(difficulties)} độ khó, {args.size}x{args.size}, "
+          f"{args.workers or os.cpu_count()} tiến trình -> {args.output}")
+    start = time.monotonic()
+    results = build_bank(args.output, args.count, difficulties, args.size, args.solver,
+                         args.workers, args.seed, args.max_pending, args.dedup_file,
+                         max_duplicate_streak=args.max_duplicate_streak)
+    total = sum(r['count'] for r in results.values())
+    elapsed = time.monotonic() - start
+    print(f"FACTORY: Đã ghi {total} puzzle trong {elapsed:.1f}s ({total / elapsed if elapsed > 0 else 0:.1f} puzzle/s)")
+    for difficulty, r in results.items():
+        shortfall = f"  thiếu {r['shortfall']}" if r['shortfall'] else ""
+        print(f"  {difficulty:<10} {r['count']:>8} puzzle  {r['per_second']:>8.1f} puzzle/s  {r['duplicates']} trùng"
+              f"{shortfall}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# puzzle_io.py
+"""
+Streaming readers and writers for common Sudoku interchange formats:
+
+  line   : one puzzle per line, size*size characters, '.' or '0' for blanks
+           (81 for 9x9). Anything after the cells (ratings, names) is ignored
+           once a separator (space, ',', ...) ends the cells.
+  sdk    : one row per line, '.' for blanks; puzzles separated by blank lines,
+           '#' lines are comments.
+  sadman : SadMan Software .sdk files: a [Puzzle] section with one row per
+           line; other sections ([State], [Solution], ...) are skipped.
+
+Readers are generators over lines, so files with millions of puzzles are
+never loaded whole. Digits above 9 (boards up to 25x25) are written as
+letters: A = 10, B = 11, ... Malformed input raises ValueError naming the
+line number.
+"""
+import sys
+from itertools import chain
+
+from sudoku_logic import BOX_SHAPES
+
+FORMATS = ("line", "sdk", "sadman")
+BLANKS = ".0"
+DIGIT_CHARS = "123456789ABCDEFGHIJKLMNOP" # Ký tự của các số 1..25
+SIZES_BY_CELLS = {s * s: s for s in BOX_SHAPES} # Số ô của một dòng -> kích thước bảng
+
+
+def _at(line_number):
+    """Error message prefix for a line number (None: unknown)."""
+    return f"Line {line_number}: " if line_number is not None else ""
+
+
+def _cell_value(ch):
+    if ch in BLANKS:
+        return 0
+    value = DIGIT_CHARS.find(ch.upper()) + 1
+    if value == 0:
+        raise ValueError(f"Invalid Sudoku cell character '{ch}'")
+    return value
+
+
+def _cell_values(chars, size, line_number):
+    """Values of a run of cell characters; digits above `size` raise ValueError naming the line."""
+    values = [_cell_value(ch) for ch in chars]
+    if max(values, default=0) > size:
+        bad = next(ch for ch, v in zip(chars, values) if v > size)
+        raise ValueError(f"{_at(line_number)}Digit '{bad}' is too large for a {size}x{size} board")
+    return values
+
+
+def _cell_char(value, blank="."):
+    return DIGIT_CHARS[value - 1] if value else blank
+
+
+def _is_cells(text):
+    return bool(text) and all(ch in BLANKS or ch.upper() in DIGIT_CHARS for ch in text)
+
+
+def _cells_prefix(text):
+    """Length of the leading run of cell characters in `text`."""
+    end = 0
+    while end < len(text) and (text[end] in BLANKS or text[end].upper() in DIGIT_CHARS):
+        end += 1
+    return end
+
+
+def parse_line(text, line_number=None):
+    """
+    Parses one line-format puzzle. The cells are the leading run of cell
+    characters and must be exactly size*size long for a supported size;
+    whatever follows a separator (",rating", " name", ...) is ignored.
+    Returns a list-of-lists grid.
+    """
+    text = text.strip()
+    end = _cells_prefix(text)
+    size = SIZES_BY_CELLS.get(end)
+    if size is None:
+        raise ValueError(f"{_at(line_number)}Not a puzzle line ({end} cells, expected "
+                         f"{' or '.join(str(n) for n in sorted(SIZES_BY_CELLS))}): '{text[:40]}'")
+    values = _cell_values(text[:end], size, line_number)
+    return [values[r * size:(r + 1) * size] for r in range(size)]
+
+
+def _parse_row(line, rows, line_number, kind):
+    """Cells of one SDK/SadMan row; every row of a puzzle has the same supported width."""
+    if not _is_cells(line):
+        raise ValueError(f"{_at(line_number)}Not a valid {kind} row: '{line[:40]}'")
+    width = len(rows[0]) if rows else len(line)
+    if len(line) != width or width not in BOX_SHAPES:
+        raise ValueError(f"{_at(line_number)}{kind} row has {len(line)} cells, expected "
+                         f"{width if rows else 'a board size'}: '{line[:40]}'")
+    return _cell_values(line, width, line_number)
+
+
+def format_line(grid, blank="."):
+    """One line-format string (no newline) for a grid."""
+    return "".join(_cell_char(v, blank) for row in grid for v in row)
+
+
+def format_sdk(grid, blank="."):
+    """SDK text of a grid: one row per line, ending with a newline."""
+    return "".join("".join(_cell_char(v, blank) for v in row) + "\n" for row in grid)
+
+
+def format_sadman(grid):
+    """SadMan .sdk text of a grid: a [Puzzle] section."""
+    return "[Puzzle]\n" + format_sdk(grid)
+
+
+def read_line_puzzles(lines):
+    """Yields grids from line-format text; blank lines and '#' comments are skipped."""
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield parse_line(line, line_number)
+
+
+def read_sdk_puzzles(lines):
+    """
+    Yields grids from SDK text: consecutive rows of cells form a puzzle once
+    there are as many rows as cells per row; '#' lines and blank lines are skipped.
+    """
+    rows = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        rows.append(_parse_row(line, rows, line_number, "SDK"))
+        if len(rows) == len(rows[0]):
+            yield rows
+            rows = []
+    if rows:
+        raise ValueError(f"Incomplete SDK puzzle at end of input: {len(rows)} of {len(rows[0])} rows")
+
+
+def read_sadman_puzzles(lines):
+    """Yields the grid of every [Puzzle] section of SadMan .sdk text."""
+    section = None
+    rows = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            if rows:
+                raise ValueError(f"{_at(line_number)}Incomplete SadMan puzzle: {len(rows)} of {len(rows[0])} rows")
+            section = line[1:-1].strip().lower()
+            continue
+        if section != "puzzle" or not line or line.startswith("#"):
+            continue
+        rows.append(_parse_row(line, rows, line_number, "SadMan"))
+        if len(rows) == len(rows[0]):
+            yield rows
+            rows = []
+            section = None # Mỗi [Puzzle] chỉ chứa một đề
+    if rows:
+        raise ValueError(f"Incomplete SadMan puzzle at end of input: {len(rows)} of {len(rows[0])} rows")
+
+
+READERS = {
+    "line": read_line_puzzles,
+    "sdk": read_sdk_puzzles,
+    "sadman": read_sadman_puzzles,
+}
+
+
+def detect_format(first_line):
+    """
+    Guesses the format from the first non-comment line of a file: a run of
+    cells longer than one row can be is a line-format puzzle. (A 16-cell
+    4x4 line looks like a 16x16 SDK row: pass fmt="line" for those.)
+    """
+    line = first_line.strip()
+    if line.startswith("["):
+        return "sadman"
+    return "sdk" if _cells_prefix(line) in BOX_SHAPES else "line"
+
+
+def iter_puzzles_from_lines(lines, fmt="auto"):
+    """Yields grids from an iterable of text lines in format `fmt` ("auto" detects it)."""
+    lines = iter(lines)
+    if fmt == "auto":
+        # Đọc trước đến dòng có nội dung đầu tiên để đoán định dạng, rồi nối lại
+        peeked = []
+        for line in lines:
+            peeked.append(line)
+            if line.strip() and not line.strip().startswith("#"):
+                fmt = detect_format(line)
+                break
+        else:
+            return
+        lines = chain(peeked, lines)
+    if fmt not in READERS:
+        raise ValueError(f"Unknown puzzle format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+    yield from READERS[fmt](lines)
+
+
+def read_puzzles(source, fmt="auto"):
+    """
+    Yields grids from `source`: a path, an open text file, or "-" for stdin.
+    A path is opened lazily and closed when the generator finishes.
+    """
+    if source == "-":
+        yield from iter_puzzles_from_lines(sys.stdin, fmt)
+    elif isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as f:
+            yield from iter_puzzles_from_lines(f, fmt)
+    else:
+        yield from iter_puzzles_from_lines(source, fmt)
+
+
+def write_puzzles(puzzles, out, fmt="line", blank="."):
+    """Writes grids to the text file `out` as they come; returns how many were written."""
+    count = 0
+    for grid in puzzles:
+        if fmt == "line":
+            out.write(format_line(grid, blank) + "\n")
+        elif fmt == "sdk":
+            out.write(("\n" if count else "") + format_sdk(grid, blank))
+        elif fmt == "sadman":
+            out.write(("\n" if count else "") + format_sadman(grid))
+        else:
+            raise ValueError(f"Unknown puzzle format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+        count += 1
+    return count
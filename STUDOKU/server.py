@@ -1,34 +1,79 @@
 # server.py
-import socket
+import asyncio
 import threading
-import json
 import uuid # For generating unique game IDs and player IDs
-from sudoku_logic import SudokuGenerator
+import time
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from protocol import (PROTOCOL_VERSION, FRAMINGS, MAX_FRAME_SIZE, FrameError, encode_payload, frame,
+                      read_message)
+from sudoku_logic import SudokuGenerator, PuzzlePool, PuzzleBank, SolverStats, BoardTracker, HintEngine, SudokuBoard, PortfolioSolver, BOX_SHAPES, VARIANTS
 import traceback # Để in chi tiết lỗi
 
 HOST = '0.0.0.0' # Nghe trên tất cả các interface
 PORT = 5555
 MAX_PLAYERS_PER_GAME = 2 # Ví dụ: game 1v1
+PUZZLE_POOL_LOW_WATER = 5   # Bắt đầu tạo thêm puzzle khi hàng đợi xuống dưới mức này
+PUZZLE_POOL_HIGH_WATER = 20 # Ngừng tạo khi hàng đợi đạt mức này
+PUZZLE_BANK_PATH = os.environ.get("SUDOKU_PUZZLE_BANK") # File ngân hàng puzzle (mmap); None = tạo trực tiếp
+COLLECT_SOLVER_STATS = True # Ghi lại số nút/backtrack/thời gian của bộ giải cho mỗi lần tạo game
+# Cách kiểm tra nước đi: "solution" (so với lời giải), "conflicts" (chỉ luật hàng/cột/khối, không giữ
+# lời giải trong bộ nhớ) hoặc "solvable" (luật + bảng vẫn còn giải được, trong giới hạn số nút)
+MOVE_VALIDATION = os.environ.get("SUDOKU_MOVE_VALIDATION", "solution")
+MOVE_VALIDATION_MODES = ("solution", "conflicts", "solvable")
+# Giới hạn cứng cho lệnh check_puzzle (puzzle do người dùng gửi lên): nhiều chiến lược giải chạy đua,
+# dừng khi hết thời gian hoặc hết số nút
+CHECK_PUZZLE_TIMEOUT = 0.5
+CHECK_PUZZLE_NODE_LIMIT = 100000
+SERVER_BACKLOG = 1024            # Kết nối đang chờ accept tối đa
+MAX_WRITE_BUFFER = 1 << 20       # Byte chờ gửi tối đa cho một client trước khi ngắt kết nối (client không đọc)
+GENERATION_WORKERS = None        # Tiến trình tạo đề cho create_game (None = số lõi CPU)
+VARIANT_GENERATION_TIMEOUT = 0.5 # Giây cho mỗi lần thử tạo đề biến thể (đề cổ điển dùng mặc định của generator)
+VARIANT_GENERATION_ATTEMPTS = 3  # Số lần thử trước khi báo lỗi thay vì trả về đề sai độ khó
 
 class SudokuGameMultiplayer:
-    def __init__(self, game_id, difficulty="medium", created_by_player_id=None):
+    def __init__(self, game_id, difficulty="medium", created_by_player_id=None, puzzle=None, size=9, bank=None,
+                 validation=MOVE_VALIDATION, variant="classic", variant_rules=None, generation_stats=None):
+        if validation not in MOVE_VALIDATION_MODES:
+            raise ValueError(f"Unknown move validation '{validation}'. Choose from: {', '.join(MOVE_VALIDATION_MODES)}")
         self.game_id = game_id
+        self.validation = validation
         self.difficulty = difficulty
-        self.generator = SudokuGenerator()
-        self.puzzle_board, self.solution_board = self.generator.generate_puzzle(difficulty)
+        self.size = size # Kích thước bảng (4, 6, 9, 12, 16, 25...)
+        self.generator = SudokuGenerator(size, collect_stats=COLLECT_SOLVER_STATS, bank=bank, variant=variant)
+        self.generation_stats = generation_stats # SolverStats nếu puzzle được tạo trực tiếp cho game này
+        if puzzle is not None: # (puzzle_board, solution_board) lấy sẵn từ PuzzlePool hoặc tiến trình tạo đề
+            self.puzzle_board, self.solution_board = puzzle
+            if variant_rules is not None: # Vùng/lồng/vạch của đề tạo sẵn (jigsaw, killer, consecutive)
+                self.generator._use_variant(variant_rules)
+        else:
+            self.puzzle_board, self.solution_board = self.generator.generate_puzzle(difficulty)
+            self.generation_stats = self.generator.last_stats
+        self.variant = self.generator.variant # Luật biến thể của đề (vùng/lồng/vạch); None = cổ điển
         
         # --- DEBUG INIT ---
-        print(f"\nDEBUG SERVER: New SudokuGameMultiplayer CREATED: ID={game_id}, Difficulty={difficulty}, CreatedBy={created_by_player_id}")
+        print(f"\nDEBUG SERVER: New SudokuGameMultiplayer CREATED: ID={game_id}, Size={size}x{size}, Difficulty={difficulty}, CreatedBy={created_by_player_id}")
         print(f"  Initial Puzzle Board (sent to clients as board_data in game_state_update):")
         for i, row_data in enumerate(self.puzzle_board): print(f"    Row {i}: {row_data}")
-        print(f"  Solution Board (used for checking victory):")
-        for i, row_data in enumerate(self.solution_board): print(f"    Row {i}: {row_data}")
+        if validation == "solution":
+            print(f"  Solution Board (used for checking victory):")
+            for i, row_data in enumerate(self.solution_board): print(f"    Row {i}: {row_data}")
+        else:
+            # Kiểm tra theo luật: không giữ lời giải (thắng = bảng đầy và không trùng số)
+            print(f"  Move validation: {validation} (solution discarded)")
+            self.solution_board = None
+            self.generator.solution = None
         # --- END DEBUG INIT ---
 
-        self.current_board_state = [row[:] for row in self.puzzle_board]
-        self.fixed_mask = [[(self.puzzle_board[r][c] != 0) for c in range(9)] for r in range(9)]
+        self.current_board_state = SudokuBoard.from_grid(self.puzzle_board) # Bảng gọn: bytearray + bitset ô cố định
+        # Đếm ô đã điền/ô sai theo từng nước đi, không phải quét lại cả bảng
+        # HintEngine giữ lưới ứng viên theo từng nước đi: get_hint không phải quét lại bảng
+        self.hint_engine = HintEngine(self.current_board_state, self.variant)
+        self.tracker = BoardTracker(self.current_board_state, self.solution_board, self.hint_engine, self.variant)
+        self.fixed_mask = self.current_board_state.fixed_mask() # Dạng list cho game_state_update
         
-        self.players = {} # player_id -> client_socket object
+        self.players = {} # player_id -> ClientConnection
         self.player_states = {} # player_id -> {'score': 0, ...}
         self.current_turn_player_id = None # Ai đang đến lượt
         self.game_started = False
@@ -36,7 +81,7 @@ class SudokuGameMultiplayer:
         self.game_over = False
         self.winner = None
         print(f"  Initial current_board_state (server's tracking board):")
-        for i, row_data in enumerate(self.current_board_state): print(f"    Row {i}: {row_data}")
+        for i, row_data in enumerate(self.current_board_state): print(f"    Row {i}: {list(row_data)}")
         print("-" * 30)
 
 
@@ -86,6 +131,10 @@ class SudokuGameMultiplayer:
             print(f"DEBUG SERVER (Game {self.game_id}): start_game conditions not met.")
 
 
+    def get_hint(self):
+        """Next logical step on the shared board (see HintEngine.hint), or None."""
+        return self.hint_engine.hint()
+
     def make_move(self, player_id, r, c, number):
         print(f"\nDEBUG SERVER (Game {self.game_id}): make_move CALLED by Player {player_id}")
         print(f"  Move details: row={r}, col={c}, number={number}")
@@ -98,41 +147,40 @@ class SudokuGameMultiplayer:
             print(f"  Move REJECTED: Not player {player_id}'s turn (current is {self.current_turn_player_id}).")
             return False, "Không phải lượt của bạn."
         
-        if r < 0 or r >= 9 or c < 0 or c >= 9:
+        if r < 0 or r >= self.size or c < 0 or c >= self.size:
             print(f"  Move REJECTED: Invalid coordinates ({r},{c}).")
             return False, "Tọa độ không hợp lệ."
-        if self.fixed_mask[r][c]:
+        if self.current_board_state.is_fixed(r, c):
             print(f"  Move REJECTED: Cell ({r},{c}) is fixed.")
             return False, "Không thể thay đổi ô cố định."
-        if not (0 <= number <= 9): 
+        if not (0 <= number <= self.size): 
             print(f"  Move REJECTED: Invalid number {number}.")
             return False, "Số không hợp lệ."
 
         print(f"  Board state BEFORE applying number to current_board_state[{r}][{c}]:")
-        print(f"    Value at ({r},{c}) was: {self.current_board_state[r][c]}")
+        print(f"    Value at ({r},{c}) was: {self.current_board_state.get(r, c)}")
 
 
         # CHÍNH SÁCH NƯỚC ĐI SAI: Hiện tại đang từ chối nước đi sai ngay
-        is_correct_move = (number == 0 or number == self.solution_board[r][c]) 
+        if self.solution_board is not None:
+            is_correct_move = (number == 0 or number == self.solution_board[r][c]) 
+            reason = f"Expected {self.solution_board[r][c]}"
+        else:
+            # Không có lời giải: trùng số trong hàng/cột/khối (O(1) nhờ bộ đếm), hoặc làm bảng hết đường giải
+            is_correct_move, reason = self.tracker.check_move(r, c, number, solvable=self.validation == "solvable")
         if not is_correct_move: 
             self.player_states[player_id]['score'] -=1 
-            print(f"  Move REJECTED: Incorrect number {number} for cell ({r},{c}). Expected {self.solution_board[r][c]}.")
+            print(f"  Move REJECTED: Incorrect number {number} for cell ({r},{c}). {reason}.")
             return False, "Nước đi không chính xác."
 
-        self.current_board_state[r][c] = number
+        self.tracker.set(r, c, number) # Cập nhật current_board_state và các bộ đếm
         self.player_states[player_id]['moves_made'] += 1
         print(f"  Board state AFTER applying number to current_board_state[{r}][{c}]:")
         # for i, row_d in enumerate(self.current_board_state): print(f"    Row {i}: {row_d}") # Có thể làm log dài
-        print(f"    Value at ({r},{c}) is now: {self.current_board_state[r][c]}")
+        print(f"    Value at ({r},{c}) is now: {self.current_board_state.get(r, c)}")
 
-        print(f"  Comparing current_board_state with SOLUTION board for game {self.game_id}:")
-        # for i, row_d in enumerate(self.solution_board): print(f"    Row {i}: {row_d}") # Có thể làm log dài
-        
-        board_complete, board_correct = self.generator.check_board_state(
-            self.current_board_state, 
-            self.solution_board       
-        )
-        print(f"  Result from check_board_state: complete={board_complete}, correct={board_correct}")
+        board_complete, board_correct = self.tracker.check_board_state()
+        print(f"  Result from tracker: complete={board_complete}, correct={board_correct} (filled={self.tracker.filled}/{self.size * self.size})")
 
         if board_complete and board_correct:
             self.winner = player_id
@@ -165,23 +213,23 @@ class SudokuGameMultiplayer:
     def broadcast_message(self, message_dict, to_player_id=None):
         """Gửi tin nhắn tới một hoặc tất cả người chơi trong game."""
         try:
-            json_message = json.dumps(message_dict)
-            # print(f"DEBUG SERVER (Game {self.game_id}): Broadcasting to {'player ' + to_player_id if to_player_id else 'ALL'}: {json_message}")
-            encoded_message = json_message.encode('utf-8')
+            # Mã hóa JSON một lần; mỗi kết nối tự đóng khung theo cách đã thỏa thuận
+            payload = encode_payload(message_dict)
+            # print(f"DEBUG SERVER (Game {self.game_id}): Broadcasting to {'player ' + to_player_id if to_player_id else 'ALL'}: {payload}")
             if to_player_id and to_player_id in self.players:
                 try:
-                    self.players[to_player_id].sendall(encoded_message)
+                    self.players[to_player_id].send_payload(payload)
                 except Exception as e_send_single:
                     print(f"SERVER ERR (broadcast to {to_player_id} in game {self.game_id}): {e_send_single}")
                     # self.remove_player(to_player_id) # Cân nhắc xóa player nếu gửi lỗi
             else: 
                 for pid_loop, sock_loop in list(self.players.items()): 
                     try:
-                        sock_loop.sendall(encoded_message)
+                        sock_loop.send_payload(payload)
                     except Exception as e_send_all:
                         print(f"SERVER ERR (broadcast to {pid_loop} in game {self.game_id} during all_broadcast): {e_send_all}")
                         # self.remove_player(pid_loop) # Cân nhắc xóa player nếu gửi lỗi
-        except json.JSONDecodeError as e_json:
+        except (TypeError, ValueError) as e_json:
             print(f"SERVER CRITICAL ERROR: JSON encoding failed for message: {message_dict} - Error: {e_json}")
         except Exception as e_broadcast_general:
             print(f"SERVER CRITICAL ERROR: General error in broadcast_message for game {self.game_id}: {e_broadcast_general}")
@@ -193,8 +241,10 @@ class SudokuGameMultiplayer:
             state_msg = {
                 'command': 'game_state_update',
                 'game_id': self.game_id,
+                'size': self.size,
                 'board_data': self.puzzle_board, 
                 'fixed_mask': self.fixed_mask,
+                'variant': self.variant.to_dict() if self.variant is not None else None,
                 'current_turn': self.current_turn_player_id,
                 'your_turn': (pid_broadcast == self.current_turn_player_id),
                 'players_in_game': list(self.players.keys()) # Thêm thông tin người chơi
@@ -229,214 +279,380 @@ class SudokuGameMultiplayer:
         self.broadcast_message(msg)
 
 
+class ClientConnection:
+    """
+    One player's stream pair and its wire framing (see protocol.py): newline
+    until the client's hello picks another. Sending only queues the bytes on
+    the event loop; the transport writes them out as the socket allows.
+    """
+    def __init__(self, reader, writer, player_id):
+        self.reader = reader
+        self.writer = writer
+        self.player_id = player_id
+        self.game_id = None # Game hiện tại của người chơi
+        self.framing = "newline"
+        self.peer = writer.get_extra_info('peername')
+
+    def sendall(self, data):
+        if self.writer.is_closing():
+            raise ConnectionError("connection closed")
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.writer.close() # Client không đọc dữ liệu: ngắt thay vì giữ bộ đệm lớn dần
+            raise ConnectionError("client is not reading, connection dropped")
+        self.writer.write(data)
+
+    def send_payload(self, payload):
+        """Sends an already encoded message (protocol.encode_payload)."""
+        self.sendall(frame(payload, self.framing))
+
+    def send(self, message_dict):
+        self.send_payload(encode_payload(message_dict))
+
+
+_worker_generators = {} # (size, variant) -> SudokuGenerator, one set per generation process
+
+
+def _generate_game_puzzle(difficulty, size, variant):
+    """
+    Generation-process entry point for create_game: (puzzle, solution,
+    variant rules or None, SolverStats or None) of a new puzzle.
+    Variants get VARIANT_GENERATION_ATTEMPTS tries of VARIANT_GENERATION_TIMEOUT
+    seconds each; a puzzle outside the difficulty's band is never returned
+    for them (ValueError instead).
+    """
+    key = (size, variant)
+    generator = _worker_generators.get(key)
+    if generator is None:
+        generator = _worker_generators[key] = SudokuGenerator(size, collect_stats=COLLECT_SOLVER_STATS, variant=variant)
+    if variant == 'classic':
+        puzzle, solution = generator.generate_puzzle(difficulty)
+        return puzzle, solution, generator.variant, generator.last_stats
+    for _ in range(VARIANT_GENERATION_ATTEMPTS):
+        puzzle, solution = generator.generate_puzzle(difficulty, timeout=VARIANT_GENERATION_TIMEOUT)
+        if generator.in_band(difficulty):
+            return puzzle, solution, generator.variant, generator.last_stats
+    raise ValueError(f"không tìm được đề {variant} {size}x{size} đúng độ khó '{difficulty}'")
+
+
 class SudokuServer:
-    def __init__(self, host, port):
+    """
+    asyncio server: one coroutine per connection instead of one OS thread,
+    so idle players only cost a socket and a few objects. Game state is
+    only touched on the event loop. Puzzle generation runs on a process
+    pool and check_puzzle on a thread, so neither stalls other players.
+    """
+    def __init__(self, host, port, bank_path=PUZZLE_BANK_PATH, generation_workers=GENERATION_WORKERS):
         self.host = host
         self.port = port
-        self.server_socket = None
-        self.clients = {} 
+        self.puzzle_bank = self.open_puzzle_bank(bank_path)
+        self.server = None # asyncio.Server, set by serve()
+        self.clients = {} # ClientConnection -> player_id
         self.games = {}   
         self.generator = SudokuGenerator() 
+        self.puzzle_pool = PuzzlePool(low_water=PUZZLE_POOL_LOW_WATER, high_water=PUZZLE_POOL_HIGH_WATER,
+                                      collect_stats=COLLECT_SOLVER_STATS)
+        self.generation_workers = generation_workers or os.cpu_count() or 1
+        self.generation_executor = None # ProcessPoolExecutor cho create_game, tạo trong serve()
+        self.create_game_stats = {} # (difficulty, size) -> SolverStats của các lần create_game
+        self.stats_lock = threading.Lock()
+        self.portfolios = {} # size -> PortfolioSolver, tạo khi có lệnh check_puzzle đầu tiên
+        self.portfolio_lock = threading.Lock()
+
+    def open_puzzle_bank(self, bank_path):
+        """Opens the shared puzzle bank if one is configured; None means live generation."""
+        if not bank_path:
+            return None
+        try:
+            bank = PuzzleBank(bank_path)
+            print(f"SERVER: Dùng ngân hàng puzzle {bank_path} ({len(bank)} puzzle, {bank.size}x{bank.size}): {bank.index}")
+            return bank
+        except (OSError, ValueError) as e_bank:
+            print(f"SERVER WARN: Không mở được ngân hàng puzzle {bank_path}: {e_bank}. Dùng tạo puzzle trực tiếp.")
+            return None
+
+    def record_create_game_stats(self, difficulty, size, elapsed, game_stats):
+        """Aggregates the cost of one create_game call (and its live generation, if any)."""
+        stats = SolverStats()
+        stats.calls = 1
+        stats.add_time("create_game", elapsed)
+        if game_stats is not None:
+            stats.merge(game_stats)
+            stats.calls = 1
+        with self.stats_lock:
+            key = (difficulty, size)
+            if key not in self.create_game_stats:
+                self.create_game_stats[key] = SolverStats()
+            self.create_game_stats[key].merge(stats)
+        print(f"SERVER STATS: create_game {difficulty} {size}x{size} took {elapsed * 1000:.1f}ms"
+              + (f" - {game_stats}" if game_stats is not None else " (từ PuzzlePool)"))
+
+    def get_stats_snapshot(self):
+        """Returns the aggregated create_game and PuzzlePool stats as JSON-friendly dicts."""
+        with self.stats_lock:
+            create_game = {f"{d}_{n}x{n}": stats.as_dict() for (d, n), stats in self.create_game_stats.items()}
+        return {'create_game': create_game, 'puzzle_pool': self.puzzle_pool.stats_snapshot()}
+
+    def check_puzzle(self, grid):
+        """
+        Solves a user-supplied puzzle under CHECK_PUZZLE_TIMEOUT and
+        CHECK_PUZZLE_NODE_LIMIT. Returns the PortfolioSolver result, or an
+        'invalid' status if the grid is not a square board of digits.
+        Blocks up to the timeout: the server calls it on a worker thread.
+        """
+        size = len(grid) if isinstance(grid, list) else 0
+        if size not in BOX_SHAPES or not all(isinstance(row, list) and len(row) == size and
+                                             all(isinstance(v, int) and 0 <= v <= size for v in row) for row in grid):
+            return {'status': 'invalid', 'solution': None, 'strategy': None, 'seconds': 0.0}
+        with self.portfolio_lock:
+            portfolio = self.portfolios.get(size)
+            if portfolio is None:
+                portfolio = self.portfolios[size] = PortfolioSolver(size)
+        result = portfolio.solve(grid, CHECK_PUZZLE_TIMEOUT, CHECK_PUZZLE_NODE_LIMIT)
+        print(f"SERVER: check_puzzle {size}x{size} -> {result['status']} ({result['strategy']}) "
+              f"in {result['seconds'] * 1000:.1f}ms")
+        return result
 
     def start(self):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        """Runs the server until interrupted (Ctrl+C)."""
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            print(f"SERVER: Đang lắng nghe trên {self.host}:{self.port}")
-
-            while True:
-                try:
-                    client_socket, client_address = self.server_socket.accept()
-                    player_id = str(uuid.uuid4()) 
-                    self.clients[client_socket] = player_id
-                    print(f"SERVER: Kết nối mới từ {client_address}, Player ID: {player_id}")
-                    
-                    client_socket.sendall(json.dumps({'command':'connected_ack', 'player_id':player_id}).encode('utf-8'))
-
-                    client_thread = threading.Thread(target=self.handle_client, args=(client_socket, player_id), daemon=True)
-                    client_thread.start()
-                except OSError as e_accept: # Nếu server_socket đã bị đóng
-                    if self.server_socket and self.server_socket.fileno() == -1: # Socket closed
-                        print("SERVER: Server socket closed, stopping accept loop.")
-                        break
-                    print(f"SERVER ERROR: Lỗi khi chấp nhận kết nối: {e_accept}")
-                except Exception as e_accept_general: 
-                    print(f"SERVER ERROR: Lỗi không xác định khi chấp nhận kết nối: {e_accept_general}")
-                    traceback.print_exc()
-                    break 
-
-        except OSError as e_bind: 
-            print(f"SERVER CRITICAL ERROR: Không thể bind tới {self.host}:{self.port} - {e_bind}")
+            asyncio.run(self.serve())
         except KeyboardInterrupt:
-            print("SERVER: Nhận KeyboardInterrupt, đang tắt server...")
+            print("SERVER: Nhận KeyboardInterrupt, đã tắt server.")
+
+    async def serve(self):
+        if self.puzzle_bank is None or not all(self.puzzle_bank.has(d, self.puzzle_pool.size) for d in self.puzzle_pool.difficulties):
+            self.puzzle_pool.start() # Tạo sẵn puzzle ở nền cho các độ khó không có trong ngân hàng
+        # "spawn": tiến trình con không fork giữa lúc các luồng PuzzlePool đang giữ khóa
+        self.generation_executor = ProcessPoolExecutor(max_workers=self.generation_workers,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+        try:
+            try:
+                self.server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                                         backlog=SERVER_BACKLOG, reuse_address=True,
+                                                         limit=MAX_FRAME_SIZE + 1)
+            except OSError as e_bind:
+                print(f"SERVER CRITICAL ERROR: Không thể bind tới {self.host}:{self.port} - {e_bind}")
+                return
+            print(f"SERVER: Đang lắng nghe trên {self.host}:{self.port}")
+            async with self.server:
+                await self.server.serve_forever()
         finally:
-            print("SERVER: Bắt đầu quá trình dọn dẹp và đóng server...")
-            # Thông báo cho các client đang kết nối rằng server sắp tắt
-            for client_sock_in_clients in list(self.clients.keys()): # list() để tạo bản sao
-                try:
-                    client_sock_in_clients.sendall(json.dumps({'command':'message', 'text':'Server đang tắt...'}).encode('utf-8'))
-                except Exception as e_send_shutdown:
-                    print(f"SERVER WARN: Không thể gửi tin nhắn server tắt cho client: {e_send_shutdown}")
-            
-            # Đóng tất cả các game đang hoạt động
-            for game_id_loop, game_obj_loop in list(self.games.items()):
-                 print(f"SERVER: Dọn dẹp game {game_id_loop}...")
-                 game_obj_loop.broadcast_message({'command':'message', 'text':f'Game {game_id_loop} bị hủy do server tắt.'})
-                 # Có thể thêm logic dọn dẹp game cụ thể hơn nếu cần
-            self.games.clear()
-
-            # Đóng socket của server
-            if self.server_socket:
-                print("SERVER: Đang đóng server socket...")
-                try:
-                    self.server_socket.close()
-                except Exception as e_close_server_socket:
-                    print(f"SERVER ERROR: Lỗi khi đóng server socket: {e_close_server_socket}")
-            print("SERVER: Đã đóng.")
+            self.shutdown()
 
-
-    def handle_client(self, client_socket, player_id):
-        buffer = ""
-        player_current_game_id = None
-        print(f"DEBUG SERVER: handle_client started for Player {player_id}")
+    def shutdown(self):
+        print("SERVER: Bắt đầu quá trình dọn dẹp và đóng server...")
+        # Thông báo cho các client đang kết nối rằng server sắp tắt
+        for conn in list(self.clients.keys()): # list() để tạo bản sao
+            try:
+                conn.send({'command':'message', 'text':'Server đang tắt...'})
+            except Exception as e_send_shutdown:
+                print(f"SERVER WARN: Không thể gửi tin nhắn server tắt cho client: {e_send_shutdown}")
+
+        # Đóng tất cả các game đang hoạt động
+        for game_id_loop, game_obj_loop in list(self.games.items()):
+             print(f"SERVER: Dọn dẹp game {game_id_loop}...")
+             game_obj_loop.broadcast_message({'command':'message', 'text':f'Game {game_id_loop} bị hủy do server tắt.'})
+        self.games.clear()
+        for conn in list(self.clients.keys()):
+            conn.writer.close()
+        self.puzzle_pool.stop(timeout=1)
+        if self.generation_executor is not None:
+            self.generation_executor.shutdown(wait=False, cancel_futures=True)
+        for portfolio in self.portfolios.values():
+            portfolio.close()
+        if self.puzzle_bank is not None:
+            self.puzzle_bank.close()
+        print("SERVER: Đã đóng.")
+
+    async def handle_client(self, reader, writer):
+        player_id = str(uuid.uuid4())
+        conn = ClientConnection(reader, writer, player_id)
+        self.clients[conn] = player_id
+        print(f"SERVER: Kết nối mới từ {conn.peer}, Player ID: {player_id}")
 
         try:
+            # connected_ack luôn là một dòng JSON; client trả lời bằng một dòng hello chọn cách đóng khung
+            conn.send({'command':'connected_ack', 'player_id':player_id, 'protocol':PROTOCOL_VERSION,
+                       'framings':list(FRAMINGS), 'max_frame_size':MAX_FRAME_SIZE})
             while True:
-                try:
-                    data_chunk = client_socket.recv(4096)
-                except ConnectionAbortedError: # Client đột ngột hủy kết nối
-                    print(f"SERVER WARN: ConnectionAbortedError for player {player_id}. Client might have closed abruptly.")
-                    break
-                except OSError as e_recv: # Socket có thể đã bị đóng
-                    if e_recv.winerror == 10038 or e_recv.errno == 9: # WSAENOTSOCK or EBADF
-                         print(f"SERVER WARN: Socket error (likely closed) on recv for player {player_id}: {e_recv}")
-                    else:
-                         print(f"SERVER ERROR: OSError on recv for player {player_id}: {e_recv}")
-                    break
-
-                if not data_chunk:
-                    print(f"SERVER: Player {player_id} đã ngắt kết nối (no data_chunk).")
-                    break 
-                
-                buffer += data_chunk.decode('utf-8')
-                # print(f"DEBUG SERVER (Player {player_id}): Buffer content: '{buffer[:100]}...'") # Log buffer nếu cần
-
-                while True: 
-                    try:
-                        message, index = json.JSONDecoder().raw_decode(buffer)
-                        print(f"SERVER RECEIVED from {player_id}: {message}") 
-                        
-                        command = message.get('command')
-                        game_id_req = message.get('game_id') 
-
-                        if command == 'create_game':
-                            difficulty = message.get('difficulty', 'medium')
-                            new_game_id = str(uuid.uuid4())[:8] 
-                            print(f"DEBUG SERVER: Player {player_id} creating game {new_game_id} with difficulty {difficulty}")
-                            game = SudokuGameMultiplayer(new_game_id, difficulty, created_by_player_id=player_id)
-                            game.add_player(player_id, client_socket)
-                            self.games[new_game_id] = game
-                            player_current_game_id = new_game_id
-                            client_socket.sendall(json.dumps({
-                                'command':'message',
-                                'text': f"Game {new_game_id} đã được tạo. Chờ người chơi khác..."
-                            }).encode('utf-8'))
-                            # Nếu game bắt đầu ngay với 1 người (ví dụ chế độ chờ đặc biệt)
-                            # if MAX_PLAYERS_PER_GAME == 1: game.start_game()
-
-                        elif command == 'join_game':
-                            print(f"DEBUG SERVER: Player {player_id} attempting to join game {game_id_req}")
-                            if game_id_req in self.games:
-                                game = self.games[game_id_req]
-                                if not game.game_started and len(game.players) < MAX_PLAYERS_PER_GAME : # Chỉ cho join nếu game chưa bắt đầu và còn chỗ
-                                    if game.add_player(player_id, client_socket):
-                                        player_current_game_id = game_id_req
-                                        print(f"DEBUG SERVER: Player {player_id} successfully joined game {game_id_req}. Current players in game: {len(game.players)}")
-                                    else: # add_player trả về False
-                                        print(f"DEBUG SERVER: Player {player_id} failed to join game {game_id_req} (add_player returned False).")
-                                        client_socket.sendall(json.dumps({'command':'error', 'message':'Lỗi khi tham gia phòng. Có thể đã đầy hoặc bạn đã ở trong phòng.'}).encode('utf-8'))
-                                else:
-                                    error_msg_join = "Phòng đã bắt đầu hoặc đã đầy." if game.game_started else "Phòng đã đầy."
-                                    print(f"DEBUG SERVER: Player {player_id} cannot join game {game_id_req}: {error_msg_join}")
-                                    client_socket.sendall(json.dumps({'command':'error', 'message': error_msg_join}).encode('utf-8'))
-                            else:
-                                print(f"DEBUG SERVER: Player {player_id} tried to join non-existent game {game_id_req}")
-                                client_socket.sendall(json.dumps({'command':'error', 'message':'Game ID không tồn tại.'}).encode('utf-8'))
-                        
-                        elif command == 'make_move':
-                            print(f"DEBUG SERVER: Player {player_id} attempting make_move in game {player_current_game_id}")
-                            if player_current_game_id and player_current_game_id in self.games:
-                                game = self.games[player_current_game_id]
-                                r_mv,c_mv,num_mv = message.get('row'), message.get('col'), message.get('number')
-                                try:
-                                    success, reason = game.make_move(player_id, r_mv,c_mv,num_mv)
-                                    if not success:
-                                        client_socket.sendall(json.dumps({'command':'move_rejected', 'reason':reason}).encode('utf-8'))
-                                except Exception as e_make_move_call:
-                                    print(f"SERVER CRITICAL ERROR during game.make_move for game {player_current_game_id}, player {player_id}: {e_make_move_call}")
-                                    traceback.print_exc()
-                                    client_socket.sendall(json.dumps({'command':'error', 'message':'Lỗi server khi xử lý nước đi.'}).encode('utf-8'))
-                                    # Cân nhắc break ở đây nếu lỗi nghiêm trọng
-                            else:
-                                print(f"DEBUG SERVER: Player {player_id} tried make_move but not in a valid game (current_game_id: {player_current_game_id}).")
-                                client_socket.sendall(json.dumps({'command':'error', 'message':'Bạn không ở trong game nào hoặc game không hợp lệ.'}).encode('utf-8'))
-
-                        elif command == 'quit': 
-                            print(f"SERVER: Player {player_id} sent quit command.")
-                            break 
-
-                        buffer = buffer[index:].lstrip()
-                    except json.JSONDecodeError:
-                        # print(f"DEBUG SERVER (Player {player_id}): Incomplete JSON in buffer, waiting for more data. Buffer: '{buffer[:100]}...'")
-                        break 
-                    except Exception as e_process_msg:
-                        print(f"SERVER ERROR: Lỗi khi xử lý message từ {player_id}. Message: {message if 'message' in locals() else 'N/A'}. Error: {e_process_msg}")
-                        traceback.print_exc()
-                        # Cân nhắc break nếu lỗi nghiêm trọng
-                        buffer = "" # Xóa buffer để tránh lỗi lặp lại với dữ liệu hỏng
-                        break 
-                
-                if command == 'quit': # Nếu lệnh quit được xử lý bên trong, thoát vòng lặp ngoài
+                message = await read_message(reader, conn.framing)
+                if message is None:
+                    print(f"SERVER: Player {player_id} đã ngắt kết nối.")
                     break
+                if message.get('command') == 'hello':
+                    if not self.negotiate(conn, message):
+                        break
+                    continue
+                print(f"SERVER RECEIVED from {player_id}: {message}")
+                try:
+                    if not await self.handle_message(conn, message):
+                        break
+                except ConnectionError:
+                    raise
+                except Exception as e_process_msg:
+                    print(f"SERVER ERROR: Lỗi khi xử lý message từ {player_id}. Message: {message}. Error: {e_process_msg}")
+                    traceback.print_exc()
+                    conn.send({'command':'error', 'message':'Lỗi server khi xử lý yêu cầu.'})
+                await writer.drain() # Chờ nếu client đọc chậm hơn tốc độ server trả lời
 
-        except ConnectionResetError:
-            print(f"SERVER: Player {player_id} ngắt kết nối đột ngột (ConnectionResetError).")
+        except FrameError as e_frame: # Frame quá lớn hoặc không phải JSON: báo lỗi rồi đóng kết nối
+            print(f"SERVER WARN: Frame không hợp lệ từ Player {player_id}: {e_frame}")
+            try:
+                conn.send({'command':'error', 'message':f'Dữ liệu không hợp lệ: {e_frame}'})
+            except ConnectionError:
+                pass
+        except ConnectionError as e_conn:
+            print(f"SERVER: Player {player_id} ngắt kết nối đột ngột ({e_conn.__class__.__name__}).")
+        except asyncio.CancelledError: # Server đang tắt: ghi log rồi để việc hủy lan tiếp tới người chờ task
+            print(f"SERVER: Đóng kết nối của Player {player_id} do server tắt.")
+            raise
         except Exception as e_handle_client_outer:
-            print(f"SERVER CRITICAL ERROR in outer loop of handle_client for {player_id}: {e_handle_client_outer}")
+            print(f"SERVER CRITICAL ERROR in handle_client for {player_id}: {e_handle_client_outer}")
             traceback.print_exc()
         finally:
-            print(f"SERVER: Bắt đầu dọn dẹp cho Player {player_id}.")
-            
-            # Xử lý rời game
-            if player_current_game_id and player_current_game_id in self.games:
-                game = self.games[player_current_game_id]
-                print(f"SERVER: Player {player_id} is leaving game {player_current_game_id}.")
-                if game.remove_player(player_id): # Nếu game rỗng sau khi player rời
-                    print(f"SERVER: Game {player_current_game_id} rỗng, xóa game.")
-                    if player_current_game_id in self.games: # Kiểm tra lại trước khi del
-                        del self.games[player_current_game_id]
-            
-            if client_socket in self.clients:
-                 del self.clients[client_socket] # Xóa client khỏi danh sách quản lý chung
-                 print(f"SERVER: Player {player_id} (socket) removed from active clients list.")
-
-            try:
-                client_socket.shutdown(socket.SHUT_RDWR) # Thử shutdown trước khi close
-            except OSError: # Bỏ qua lỗi nếu socket đã đóng
-                pass
-            except Exception as e_shutdown:
-                print(f"SERVER WARN: Lỗi khi shutdown socket cho player {player_id}: {e_shutdown}")
-
-            try:
-                client_socket.close()
-                print(f"SERVER: Socket cho Player {player_id} đã đóng.")
-            except Exception as e_close:
-                 print(f"SERVER ERROR: Lỗi khi đóng socket cho player {player_id}: {e_close}")
-            print(f"SERVER: Kết thúc dọn dẹp cho Player {player_id}.")
+            self.disconnect(conn)
+
+    def negotiate(self, conn, message):
+        """
+        Applies a client's hello: switches the connection to the framing it
+        asks for and confirms in that framing. False if the request is refused.
+        """
+        framing = message.get('framing')
+        if message.get('protocol') != PROTOCOL_VERSION or framing not in FRAMINGS:
+            conn.send({'command':'error', 'message':f"Giao thức không được hỗ trợ: {message.get('protocol')}/{framing}"})
+            return False
+        conn.framing = framing
+        conn.send({'command':'hello_ack', 'protocol':PROTOCOL_VERSION, 'framing':framing})
+        return True
+
+    def disconnect(self, conn):
+        player_id = conn.player_id
+        print(f"SERVER: Bắt đầu dọn dẹp cho Player {player_id}.")
+        # Xử lý rời game
+        if conn.game_id and conn.game_id in self.games:
+            game = self.games[conn.game_id]
+            print(f"SERVER: Player {player_id} is leaving game {conn.game_id}.")
+            if game.remove_player(player_id): # Nếu game rỗng sau khi player rời
+                print(f"SERVER: Game {conn.game_id} rỗng, xóa game.")
+                self.games.pop(conn.game_id, None)
+        self.clients.pop(conn, None)
+        conn.writer.close()
+        print(f"SERVER: Kết thúc dọn dẹp cho Player {player_id}.")
+
+    async def handle_message(self, conn, message):
+        """Runs one client command. Returns False when the client quits."""
+        player_id = conn.player_id
+        command = message.get('command')
+        game_id_req = message.get('game_id')
+
+        if command == 'create_game':
+            await self.create_game(conn, message)
+
+        elif command == 'join_game':
+            print(f"DEBUG SERVER: Player {player_id} attempting to join game {game_id_req}")
+            if game_id_req in self.games:
+                game = self.games[game_id_req]
+                if not game.game_started and len(game.players) < MAX_PLAYERS_PER_GAME : # Chỉ cho join nếu game chưa bắt đầu và còn chỗ
+                    if game.add_player(player_id, conn):
+                        conn.game_id = game_id_req
+                        print(f"DEBUG SERVER: Player {player_id} successfully joined game {game_id_req}. Current players in game: {len(game.players)}")
+                    else: # add_player trả về False
+                        print(f"DEBUG SERVER: Player {player_id} failed to join game {game_id_req} (add_player returned False).")
+                        conn.send({'command':'error', 'message':'Lỗi khi tham gia phòng. Có thể đã đầy hoặc bạn đã ở trong phòng.'})
+                else:
+                    error_msg_join = "Phòng đã bắt đầu hoặc đã đầy." if game.game_started else "Phòng đã đầy."
+                    print(f"DEBUG SERVER: Player {player_id} cannot join game {game_id_req}: {error_msg_join}")
+                    conn.send({'command':'error', 'message': error_msg_join})
+            else:
+                print(f"DEBUG SERVER: Player {player_id} tried to join non-existent game {game_id_req}")
+                conn.send({'command':'error', 'message':'Game ID không tồn tại.'})
+
+        elif command == 'make_move':
+            print(f"DEBUG SERVER: Player {player_id} attempting make_move in game {conn.game_id}")
+            if conn.game_id and conn.game_id in self.games:
+                game = self.games[conn.game_id]
+                r_mv,c_mv,num_mv = message.get('row'), message.get('col'), message.get('number')
+                try:
+                    success, reason = game.make_move(player_id, r_mv,c_mv,num_mv)
+                    if not success:
+                        conn.send({'command':'move_rejected', 'reason':reason})
+                except Exception as e_make_move_call:
+                    print(f"SERVER CRITICAL ERROR during game.make_move for game {conn.game_id}, player {player_id}: {e_make_move_call}")
+                    traceback.print_exc()
+                    conn.send({'command':'error', 'message':'Lỗi server khi xử lý nước đi.'})
+            else:
+                print(f"DEBUG SERVER: Player {player_id} tried make_move but not in a valid game (current_game_id: {conn.game_id}).")
+                conn.send({'command':'error', 'message':'Bạn không ở trong game nào hoặc game không hợp lệ.'})
+
+        elif command == 'get_hint': # Chế độ "coach": bước logic tiếp theo, không tự điền
+            if conn.game_id and conn.game_id in self.games:
+                hint = self.games[conn.game_id].get_hint()
+                conn.send({'command':'hint', 'game_id': conn.game_id, 'hint': hint})
+            else:
+                conn.send({'command':'error', 'message':'Bạn không ở trong game nào hoặc game không hợp lệ.'})
+
+        elif command == 'check_puzzle': # Kiểm tra puzzle người dùng gửi, có giới hạn thời gian
+            # PortfolioSolver chờ các tiến trình giải: chạy trên luồng để vòng lặp sự kiện không bị chặn
+            result = await asyncio.get_running_loop().run_in_executor(None, self.check_puzzle, message.get('grid'))
+            conn.send({'command':'puzzle_check', **result})
+
+        elif command == 'get_stats':
+            conn.send({'command':'stats', 'stats': self.get_stats_snapshot()})
+
+        elif command == 'quit': 
+            print(f"SERVER: Player {player_id} sent quit command.")
+            return False
+        return True
+
+    async def create_game(self, conn, message):
+        player_id = conn.player_id
+        difficulty = message.get('difficulty', 'medium')
+        size = message.get('size', 9)
+        variant = message.get('variant', 'classic')
+        if size not in BOX_SHAPES:
+            conn.send({'command':'error', 'message':f'Kích thước bảng {size} không được hỗ trợ.'})
+            return
+        if variant not in VARIANTS:
+            conn.send({'command':'error', 'message':f'Biến thể {variant} không được hỗ trợ.'})
+            return
+        new_game_id = str(uuid.uuid4())[:8] 
+        print(f"DEBUG SERVER: Player {player_id} creating game {new_game_id} with difficulty {difficulty}, size {size}")
+        create_start = time.perf_counter()
+        # Ưu tiên ngân hàng puzzle (O(1)); sau đó PuzzlePool cho 9x9 nếu còn đề sẵn; còn lại tạo trên tiến trình riêng
+        # Biến thể luôn được tạo mới: ngân hàng và PuzzlePool chỉ có đề cổ điển
+        classic = variant == 'classic'
+        in_bank = classic and self.puzzle_bank is not None and self.puzzle_bank.has(difficulty, size)
+        pooled = None
+        if classic and not in_bank and size == self.puzzle_pool.size and self.puzzle_pool.available(difficulty):
+            pooled = self.puzzle_pool.get(difficulty)
+        try:
+            if in_bank or pooled is not None:
+                game = SudokuGameMultiplayer(new_game_id, difficulty, created_by_player_id=player_id,
+                                             puzzle=pooled, size=size, bank=self.puzzle_bank, variant=variant)
+            else:
+                # Tạo đề tốn CPU: chạy trên pool tiến trình, các người chơi khác vẫn được phục vụ
+                puzzle, solution, rules, stats = await asyncio.get_running_loop().run_in_executor(
+                    self.generation_executor, _generate_game_puzzle, difficulty, size, variant)
+                game = SudokuGameMultiplayer(new_game_id, difficulty, created_by_player_id=player_id,
+                                             puzzle=(puzzle, solution), size=size, variant=variant,
+                                             variant_rules=rules, generation_stats=stats)
+        except ValueError as e_variant: # Ví dụ: không tìm được bố cục jigsaw cho kích thước này
+            conn.send({'command':'error', 'message':f'Không tạo được game: {e_variant}'})
+            return
+        self.record_create_game_stats(difficulty, size, time.perf_counter() - create_start, game.generation_stats)
+        if conn.writer.is_closing(): # Người chơi đã rời trong lúc chờ tạo đề
+            return
+        game.add_player(player_id, conn)
+        self.games[new_game_id] = game
+        conn.game_id = new_game_id
+        conn.send({
+            'command':'message',
+            'text': f"Game {new_game_id} đã được tạo. Chờ người chơi khác..."
+        })
+        # Nếu game bắt đầu ngay với 1 người (ví dụ chế độ chờ đặc biệt)
+        # if MAX_PLAYERS_PER_GAME == 1: game.start_game()
 
 
 if __name__ == "__main__":
     server = SudokuServer(HOST, PORT)
-    server.start()
\ No newline at end of file
+    server.start()
@@ -1,45 +1,2335 @@
 # sudoku_logic.py
+import base64
+import hashlib
+import mmap
+import multiprocessing
+import os
 import random
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+from itertools import combinations, permutations
+from queue import Empty
 
-class SudokuGenerator:
+try:
+    import numpy as np # Chỉ cần cho API xử lý theo lô (batch_*)
+except ImportError:
+    np = None
+
+
+# Box shape (rows, cols) per board size; rectangular boxes are wider than tall
+BOX_SHAPES = {4: (2, 2), 6: (2, 3), 8: (2, 4), 9: (3, 3), 10: (2, 5), 12: (3, 4),
+              15: (3, 5), 16: (4, 4), 20: (4, 5), 25: (5, 5)}
+
+
+def box_dimensions(size):
+    """Returns (box_rows, box_cols) for a board of `size` x `size` cells."""
+    if size < 1:
+        raise ValueError(f"Invalid board size: {size}")
+    if size in BOX_SHAPES:
+        return BOX_SHAPES[size]
+    for rows in range(int(size ** 0.5), 0, -1):
+        if size % rows == 0:
+            return rows, size // rows
+
+
+class SearchLimitExceeded(Exception):
+    """Raised when a solver search runs out of its node budget."""
+
+
+class SolverStats:
+    """
+    Counters for one solve/generate call, or an aggregate of many:
+    search nodes visited, backtracks (branches that failed), propagation
+    steps (BitmaskSolver: propagation passes, DLX: column covers) and wall
+    time per phase in seconds. Phase times reported by worker processes are
+    summed, so in parallel generation they can exceed 'total'.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.nodes = 0
+        self.backtracks = 0
+        self.propagations = 0
+        self.phase_times = {} # phase name -> seconds
+
+    def add_time(self, phase, seconds):
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + seconds
+
+    def merge(self, other):
+        """Adds the counters of another SolverStats into this one."""
+        self.calls += other.calls
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.propagations += other.propagations
+        for phase, seconds in other.phase_times.items():
+            self.add_time(phase, seconds)
+        return self
+
+    def as_dict(self):
+        """JSON-friendly view (times in milliseconds)."""
+        return {
+            'calls': self.calls,
+            'nodes': self.nodes,
+            'backtracks': self.backtracks,
+            'propagations': self.propagations,
+            'phase_ms': {phase: round(seconds * 1000, 3) for phase, seconds in self.phase_times.items()},
+        }
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in self.phase_times.items())
+        return (f"SolverStats(calls={self.calls}, nodes={self.nodes}, backtracks={self.backtracks}, "
+                f"propagations={self.propagations}, {phases})")
+
+
+# --- Variant rules ---
+VARIANTS = ("classic", "diagonal", "anti_knight", "jigsaw", "killer", "consecutive")
+KNIGHT_MOVES = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+MAX_CAGE_CELLS = 4          # Largest killer cage made by random_cages
+MAX_JIGSAW_LAYOUTS = 20     # Random region layouts tried before a jigsaw generation gives up
+JIGSAW_LAYOUT_NODES = 300   # Search nodes spent finding a solution for one random layout (a new layout is cheaper)
+
+
+def _orthogonal(cell, size):
+    """Flat indices of the cells left, right, above and below `cell`."""
+    r, c = divmod(cell, size)
+    if r:
+        yield cell - size
+    if r < size - 1:
+        yield cell + size
+    if c:
+        yield cell - 1
+    if c < size - 1:
+        yield cell + 1
+
+
+class SudokuVariant:
+    """
+    Rules of a Sudoku variant, compiled once into the tables the solvers use.
+
+    Units are groups of `size` cells holding every digit once: rows, columns,
+    boxes (or the jigsaw `regions`, a size x size grid of region indices)
+    and, with `diagonals`, both main diagonals. Extra constraints:
+      anti_knight : cells a knight's move apart hold different digits
+      cages       : [(sum, [(r, c), ...])] killer cages, distinct digits adding up to sum
+      consecutive : [((r, c), (r, c))] cell pairs marked with a bar, digits differ by 1
+    Knight moves and cage mates become extra peers, so naked singles handle
+    them like any other peer; cage sums and bars are pruned as bitmasks.
+    Inside the tables cells are flat indices (r * size + c).
+    """
+    def __init__(self, size=9, diagonals=False, regions=None, anti_knight=False, cages=None, consecutive=None,
+                 name="custom"):
+        self.size = size
+        self.name = name
+        self.diagonals = diagonals
+        self.anti_knight = anti_knight
+        cells = size * size
+        if regions is None:
+            box_rows, box_cols = box_dimensions(size)
+            boxes_per_row = size // box_cols
+            self.region_of = tuple((cell // size) // box_rows * boxes_per_row + (cell % size) // box_cols
+                                   for cell in range(cells))
+            self.jigsaw = False
+        else:
+            self.region_of = tuple(region for row in regions for region in row)
+            self.jigsaw = True
+        groups = [[] for _ in range(size)]
+        for cell, region in enumerate(self.region_of):
+            if not 0 <= region < size:
+                raise ValueError(f"Invalid region index {region}")
+            groups[region].append(cell)
+        if len(self.region_of) != cells or any(len(group) != size for group in groups):
+            raise ValueError(f"Every region must have exactly {size} cells")
+
+        units = [[r * size + c for c in range(size)] for r in range(size)]
+        units += [[r * size + c for r in range(size)] for c in range(size)]
+        units += groups
+        if diagonals:
+            units.append([i * size + i for i in range(size)])
+            units.append([i * size + size - 1 - i for i in range(size)])
+        self.units = tuple(tuple(unit) for unit in units)
+        cell_units = [[] for _ in range(cells)]
+        unit_peers = [set() for _ in range(cells)]
+        for u, unit in enumerate(self.units):
+            for cell in unit:
+                cell_units[cell].append(u)
+                unit_peers[cell].update(unit)
+        self.cell_units = tuple(tuple(us) for us in cell_units)
+
+        extra = [set() for _ in range(cells)]
+        if anti_knight:
+            for cell in range(cells):
+                r, c = divmod(cell, size)
+                for dr, dc in KNIGHT_MOVES:
+                    if 0 <= r + dr < size and 0 <= c + dc < size:
+                        extra[cell].add((r + dr) * size + c + dc)
+        self.cages = tuple((total, tuple(r * size + c for r, c in cage)) for total, cage in (cages or ()))
+        self.cage_of = [-1] * cells # cell -> index in self.cages
+        for i, (total, cage) in enumerate(self.cages):
+            for cell in cage:
+                if self.cage_of[cell] >= 0:
+                    raise ValueError(f"Cell ({cell // size}, {cell % size}) is in two cages")
+                self.cage_of[cell] = i
+                extra[cell].update(cage)
+        self.pairs = tuple((a[0] * size + a[1], b[0] * size + b[1]) for a, b in (consecutive or ()))
+        self.partners = [[] for _ in range(cells)] # cell -> cells it shares a bar with
+        for a, b in self.pairs:
+            self.partners[a].append(b)
+            self.partners[b].append(a)
+
+        self.peers = tuple(tuple(sorted((unit_peers[cell] | extra[cell]) - {cell})) for cell in range(cells))
+        self.extra_peers = tuple(tuple(sorted(extra[cell] - unit_peers[cell] - {cell})) for cell in range(cells))
+        self.key = (size, self.region_of, diagonals, anti_knight, self.cages, self.pairs) # Hashable, for caches
+
+    def is_classic(self):
+        return not (self.jigsaw or self.diagonals or self.anti_knight or self.cages or self.pairs)
+
+    def allows(self, grid, r, c, num, extra_only=False):
+        """
+        True if `num` fits at (r, c) of a list-of-lists grid (0 = empty) under
+        these rules; the cell's own value is ignored. With `extra_only`, the
+        unit peers are assumed to be checked already.
+        """
+        size = self.size
+        cell = r * size + c
+        for p in (self.extra_peers if extra_only else self.peers)[cell]:
+            if grid[p // size][p % size] == num:
+                return False
+        for p in self.partners[cell]:
+            other = grid[p // size][p % size]
+            if other and abs(other - num) != 1:
+                return False
+        i = self.cage_of[cell]
+        if i >= 0:
+            total, cage = self.cages[i]
+            placed, empty = num, 0
+            for p in cage:
+                if p != cell:
+                    value = grid[p // size][p % size]
+                    placed += value
+                    empty += not value
+            # Mỗi ô trống còn lại cần ít nhất 1 và nhiều nhất `size`
+            if placed + empty > total or placed + empty * size < total or (not empty and placed != total):
+                return False
+        return True
+
+    def check_grid(self, grid):
+        """True if a complete grid satisfies every rule."""
+        size = self.size
+        return all(grid[r][c] and self.allows(grid, r, c, grid[r][c]) for r in range(size) for c in range(size))
+
+    def to_dict(self):
+        """JSON-friendly description (cells as [r, c]); SudokuVariant.from_dict(d) rebuilds it."""
+        size = self.size
+        return {
+            'name': self.name,
+            'size': size,
+            'diagonals': self.diagonals,
+            'anti_knight': self.anti_knight,
+            'regions': [list(self.region_of[r * size:(r + 1) * size]) for r in range(size)] if self.jigsaw else None,
+            'cages': [[total, [[cell // size, cell % size] for cell in cage]] for total, cage in self.cages],
+            'consecutive': [[[a // size, a % size], [b // size, b % size]] for a, b in self.pairs],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['size'], data.get('diagonals', False), data.get('regions'), data.get('anti_knight', False),
+                   data.get('cages'), data.get('consecutive'), data.get('name', "custom"))
+
+    def __repr__(self):
+        return (f"SudokuVariant({self.name}, {self.size}x{self.size}, {len(self.units)} units, "
+                f"{len(self.cages)} cages, {len(self.pairs)} bars)")
+
+
+def _region_connected(region_of, region, size):
+    cells = [cell for cell, g in enumerate(region_of) if g == region]
+    seen = {cells[0]}
+    stack = [cells[0]]
+    while stack:
+        for nb in _orthogonal(stack.pop(), size):
+            if nb not in seen and region_of[nb] == region:
+                seen.add(nb)
+                stack.append(nb)
+    return len(seen) == len(cells)
+
+
+def random_regions(size=9, swaps=None):
+    """
+    A random jigsaw layout as a size x size grid of region indices: starts
+    from the boxes and trades cells between neighbouring regions, keeping
+    every region connected. Not every layout has a solution (see
+    SudokuGenerator, which retries).
+    """
+    region_of = list(SudokuVariant(size).region_of)
+    cells = size * size
+    for _ in range(swaps or 4 * cells):
+        a = random.randrange(cells)
+        ra = region_of[a]
+        others = [region_of[nb] for nb in _orthogonal(a, size) if region_of[nb] != ra]
+        if not others:
+            continue
+        rb = random.choice(others)
+        back = [cell for cell in range(cells) if region_of[cell] == rb and
+                any(region_of[nb] == ra for nb in _orthogonal(cell, size))]
+        b = random.choice(back)
+        region_of[a], region_of[b] = rb, ra
+        if not (_region_connected(region_of, ra, size) and _region_connected(region_of, rb, size)):
+            region_of[a], region_of[b] = ra, rb
+    return [region_of[r * size:(r + 1) * size] for r in range(size)]
+
+
+def random_cages(solution, max_cells=MAX_CAGE_CELLS):
+    """
+    Splits a solved grid into random connected killer cages of up to
+    `max_cells` cells with distinct digits. Returns [(sum, [(r, c), ...])].
+    """
+    size = len(solution)
+    cells = list(range(size * size))
+    random.shuffle(cells)
+    taken = [False] * (size * size)
+    cages = []
+    for start in cells:
+        if taken[start]:
+            continue
+        taken[start] = True
+        cage = [start]
+        digits = {solution[start // size][start % size]}
+        target = random.randint(2, max_cells)
+        while len(cage) < target:
+            options = [nb for cell in cage for nb in _orthogonal(cell, size)
+                       if not taken[nb] and solution[nb // size][nb % size] not in digits]
+            if not options:
+                break # Ô lẻ còn sót lại thành lồng nhỏ hơn
+            nb = random.choice(options)
+            taken[nb] = True
+            cage.append(nb)
+            digits.add(solution[nb // size][nb % size])
+        cages.append((sum(digits), [(cell // size, cell % size) for cell in cage]))
+    return cages
+
+
+def consecutive_pairs(solution):
+    """Every pair of side-by-side cells whose digits differ by 1: the bars of a consecutive puzzle."""
+    size = len(solution)
+    pairs = []
+    for r in range(size):
+        for c in range(size):
+            if c + 1 < size and abs(solution[r][c] - solution[r][c + 1]) == 1:
+                pairs.append(((r, c), (r, c + 1)))
+            if r + 1 < size and abs(solution[r][c] - solution[r + 1][c]) == 1:
+                pairs.append(((r, c), (r + 1, c)))
+    return pairs
+
+
+class BitmaskSolver:
+    """
+    Constraint-propagation solver working on candidate bitmasks.
+
+    Every cell keeps a mask of the digits still allowed (bit d-1 <=> digit d).
+    Placing a digit strips it from the cell's peers (naked singles) and every
+    unit is scanned for digits that fit in only one cell (hidden singles).
+    When propagation stalls, the search branches on the cell with the fewest
+    candidates left.
+
+    With `reverse` ties between cells go to the last one and digits are tried
+    from high to low: the same search in a different order, which PortfolioSolver
+    races against the default one.
+
+    With a SudokuVariant the unit and peer tables come from the variant, and
+    its cage sums and consecutive bars are pruned once propagation settles.
+    """
+    def __init__(self, size=9, reverse=False, variant=None):
+        self.size = size
+        self.reverse = reverse
+        self.variant = variant
+        self.box_rows, self.box_cols = box_dimensions(size)
+        self.num_cells = size * size
+        self.full_mask = (1 << size) - 1
+        self.stats = None # SolverStats to count into, or None (no instrumentation)
+        self._bit_tables = None
+        if variant is not None:
+            self.units = [list(unit) for unit in variant.units]
+            self.box_of = list(variant.region_of)
+            self.cell_units = variant.cell_units
+            self.peers = variant.peers
+            self.cages = variant.cages
+            self.pairs = variant.pairs
+            self.cell_unit_bits = [sum(1 << u for u in units) for units in self.cell_units]
+            return
+        self.cages = self.pairs = () # Luật cổ điển: không có lồng tổng hay vạch liên tiếp
+
+        # Unit and peer tables, computed once per solver instance
+        rows = [[r * size + c for c in range(size)] for r in range(size)]
+        cols = [[r * size + c for r in range(size)] for c in range(size)]
+        boxes = []
+        for top in range(0, size, self.box_rows):
+            for left in range(0, size, self.box_cols):
+                boxes.append([(top + i) * size + (left + j)
+                              for i in range(self.box_rows) for j in range(self.box_cols)])
+        self.units = rows + cols + boxes
+
+        boxes_per_row = size // self.box_cols
+        self.box_of = [(cell // size) // self.box_rows * boxes_per_row + (cell % size) // self.box_cols
+                       for cell in range(self.num_cells)]
+
+        # Unit ids (row, column, box) of every cell
+        self.cell_units = [(cell // size, size + cell % size, 2 * size + self.box_of[cell])
+                           for cell in range(self.num_cells)]
+        # Same, as a bitmask over unit ids (the "dirty" units of _propagate)
+        self.cell_unit_bits = [sum(1 << u for u in units) for units in self.cell_units]
+
+        peer_sets = [set() for _ in range(self.num_cells)]
+        for unit in self.units:
+            for cell in unit:
+                peer_sets[cell].update(unit)
+        self.peers = [tuple(sorted(p - {cell})) for cell, p in enumerate(peer_sets)]
+
+    # --- Grid <-> candidate masks ---
+    def masks_from_grid(self, grid, exclude=None):
+        """
+        Builds the candidate masks for a list-of-lists grid (0 = empty) and
+        runs the initial propagation. `exclude` = (cell, mask) takes those
+        digits off an empty cell before propagating. Returns None if the
+        givens contradict.
+        """
+        if self.variant is not None:
+            return self._variant_masks(grid, exclude)
+        size = self.size
+        row_used = [0] * size
+        col_used = [0] * size
+        box_used = [0] * size
+        box_of = self.box_of
+        for r in range(size):
+            row = grid[r]
+            for c in range(size):
+                num = row[c]
+                if num:
+                    bit = 1 << (num - 1)
+                    b = box_of[r * size + c]
+                    if (row_used[r] | col_used[c] | box_used[b]) & bit:
+                        return None # Duplicate given
+                    row_used[r] |= bit
+                    col_used[c] |= bit
+                    box_used[b] |= bit
+
+        # Seed every empty cell with the digits its units still allow
+        full = self.full_mask
+        cands = [0] * self.num_cells
+        queue = []
+        for r in range(size):
+            row = grid[r]
+            for c in range(size):
+                cell = r * size + c
+                num = row[c]
+                if num:
+                    cands[cell] = 1 << (num - 1)
+                    continue
+                m = full & ~(row_used[r] | col_used[c] | box_used[box_of[cell]])
+                if exclude is not None and cell == exclude[0]:
+                    m &= ~exclude[1]
+                if not m:
+                    return None
+                cands[cell] = m
+                if not (m & (m - 1)):
+                    queue.append(cell)
+        if not self._propagate(cands, queue):
+            return None
+        return cands
+
+    def _variant_masks(self, grid, exclude=None):
+        # Variant rules: givens reach every kind of peer through the naked-single queue
+        size = self.size
+        cands = [self.full_mask] * self.num_cells
+        queue = []
+        if exclude is not None:
+            cell, mask = exclude
+            cands[cell] &= ~mask
+            if not (cands[cell] & (cands[cell] - 1)):
+                queue.append(cell)
+        for r in range(size):
+            row = grid[r]
+            for c in range(size):
+                if row[c]:
+                    cands[r * size + c] = 1 << (row[c] - 1)
+                    queue.append(r * size + c)
+        if not self._propagate(cands, queue):
+            return None # Hai ô cho trước trùng số, hoặc luật phụ không thỏa được
+        return cands
+
+    def grid_from_masks(self, cands):
+        """Converts fully solved candidate masks back into a list-of-lists grid."""
+        size = self.size
+        return [[cands[r * size + c].bit_length() for c in range(size)] for r in range(size)]
+
+    # --- Propagation ---
+    def _propagate(self, cands, queue, dirty=None):
+        """
+        Applies naked and hidden singles until nothing changes.
+        `queue` holds cells that were just reduced to a single candidate and
+        `dirty` a bitmask of the unit ids whose candidates changed (None = all
+        units), so only those units are rescanned for hidden singles.
+        Returns False as soon as a contradiction is found.
+        """
+        if self.stats is not None:
+            self.stats.propagations += 1
+        peers = self.peers
+        units = self.units
+        cell_unit_bits = self.cell_unit_bits
+        full = self.full_mask
+        if dirty is None:
+            dirty = (1 << len(units)) - 1
+        while True:
+            # Naked singles: remove a solved cell's digit from all its peers
+            while queue:
+                cell = queue.pop()
+                bit = cands[cell]
+                for p in peers[cell]:
+                    m = cands[p]
+                    if m & bit:
+                        m &= ~bit
+                        if not m:
+                            return False
+                        cands[p] = m
+                        dirty |= cell_unit_bits[p]
+                        if not (m & (m - 1)):
+                            queue.append(p)
+            if not dirty:
+                if not (self.cages or self.pairs):
+                    return True
+                dirty = self._prune_extra(cands, queue)
+                if dirty is None:
+                    return False
+                if not (queue or dirty):
+                    return True
+                continue
+
+            # Hidden singles: a digit that fits in only one cell of a unit
+            scan, dirty = dirty, 0
+            while scan:
+                low = scan & -scan
+                scan ^= low
+                unit = units[low.bit_length() - 1]
+                once = twice = 0
+                for cell in unit:
+                    m = cands[cell]
+                    twice |= once & m
+                    once |= m
+                if once != full:
+                    return False # Some digit has no place left in this unit
+                hidden = once & ~twice
+                if hidden:
+                    for cell in unit:
+                        m = cands[cell]
+                        h = m & hidden
+                        if h and h != m:
+                            if h & (h - 1):
+                                return False # Two digits need the same cell
+                            cands[cell] = h
+                            queue.append(cell)
+                            dirty |= cell_unit_bits[cell]
+
+    def _prune_extra(self, cands, queue):
+        """
+        Variant constraints as mask operations: a barred pair keeps only digits
+        one apart from the other cell's candidates, and a cage cell keeps only
+        digits that the min/max sums of its cage mates leave room for.
+        Cells left with one digit go to `queue`. Returns the bitmask of units
+        whose candidates changed, or None on a contradiction.
+        """
+        size = self.size
+        cell_unit_bits = self.cell_unit_bits
+        changed = []
+        for a, b in self.pairs:
+            ma, mb = cands[a], cands[b]
+            na = ma & ((mb << 1) | (mb >> 1))
+            nb = mb & ((na << 1) | (na >> 1))
+            if not (na and nb):
+                return None
+            if na != ma:
+                cands[a] = na
+                changed.append(a)
+            if nb != mb:
+                cands[b] = nb
+                changed.append(b)
+        for total, cage in self.cages:
+            low = high = 0
+            for cell in cage:
+                m = cands[cell]
+                low += (m & -m).bit_length()
+                high += m.bit_length()
+            if low > total or high < total:
+                return None
+            for cell in cage:
+                m = cands[cell]
+                if not (m & (m - 1)):
+                    continue
+                # Digits d with rest_low <= total - d <= rest_high
+                lo_d = max(1, total - (high - m.bit_length()))
+                hi_d = min(size, total - (low - (m & -m).bit_length()))
+                if lo_d > hi_d:
+                    return None
+                nm = m & ((1 << hi_d) - 1) & ~((1 << (lo_d - 1)) - 1)
+                if not nm:
+                    return None
+                if nm != m:
+                    cands[cell] = nm
+                    changed.append(cell)
+        dirty = 0
+        for cell in changed:
+            m = cands[cell]
+            dirty |= cell_unit_bits[cell]
+            if not (m & (m - 1)):
+                queue.append(cell)
+        return dirty
+
+    # --- Search ---
+    def _pick_cell(self, cands):
+        """Returns the unsolved cell with the fewest candidates, or -1 if solved."""
+        best, best_count = -1, self.size + 1
+        if self.reverse:
+            for cell in range(self.num_cells - 1, -1, -1):
+                m = cands[cell]
+                if m & (m - 1):
+                    n = m.bit_count()
+                    if n < best_count:
+                        best, best_count = cell, n
+                        if n == 2:
+                            break
+            return best
+        for cell, m in enumerate(cands):
+            if m & (m - 1):
+                n = m.bit_count()
+                if n < best_count:
+                    best, best_count = cell, n
+                    if n == 2:
+                        break
+        return best
+
+    def _search(self, cands, randomize, limit, solutions, budget=None):
+        if budget is not None:
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise SearchLimitExceeded()
+        stats = self.stats
+        if stats is not None:
+            stats.nodes += 1
+        cell = self._pick_cell(cands)
+        if cell < 0:
+            solutions.append(cands)
+            return len(solutions) >= limit
+
+        m = cands[cell]
+        bits = []
+        while m:
+            bit = m & -m
+            bits.append(bit)
+            m ^= bit
+        if randomize:
+            random.shuffle(bits) # Randomize number choice for varied solutions
+        elif self.reverse:
+            bits.reverse()
+
+        for bit in bits:
+            child = cands[:]
+            child[cell] = bit
+            if self._propagate(child, [cell], self.cell_unit_bits[cell]) and self._search(child, randomize, limit, solutions, budget):
+                return True
+            if stats is not None:
+                stats.backtracks += 1
+        return False
+
+    def solve(self, grid, randomize=False, budget=None):
+        """
+        Solves a list-of-lists grid without modifying it.
+        Returns the solved grid, or None if the grid has no solution.
+        `budget` is an optional one-item list of search nodes left; the search
+        raises SearchLimitExceeded when it runs out.
+        """
+        cands = self.masks_from_grid(grid)
+        if cands is None:
+            return None
+        solutions = []
+        self._search(cands, randomize, 1, solutions, budget)
+        return self.grid_from_masks(solutions[0]) if solutions else None
+
+    def count_solutions(self, grid, limit=2):
+        """Counts the solutions of a grid, stopping once `limit` are found."""
+        cands = self.masks_from_grid(grid)
+        if cands is None:
+            return 0
+        solutions = []
+        self._search(cands, False, limit, solutions)
+        return len(solutions)
+
+    def has_alternative(self, grid, r, c, num, node_limit=None):
+        """
+        Returns True if `grid` (with cell (r, c) empty) has a solution where
+        (r, c) holds something other than `num`. When the grid is known to
+        be solvable with `num` there, this answers "is it still unique?" with
+        a single search that stops at the first hit.
+        With `node_limit`, a search that runs out of nodes also returns True,
+        so callers err on the side of keeping the clue.
+        """
+        try:
+            return self.find_alternative(grid, r, c, num, node_limit) is not None
+        except SearchLimitExceeded:
+            return True
+
+    def find_alternative(self, grid, r, c, num, node_limit=None):
+        """
+        Like has_alternative, but returns the candidate masks of the solution
+        found (one bit per cell), or None. Raises SearchLimitExceeded when the
+        search runs out of `node_limit` nodes.
+        """
+        # Loại `num` trước khi lan truyền: mâu thuẫn (trường hợp thường gặp) lộ ra sớm hơn
+        cands = self.masks_from_grid(grid, (r * self.size + c, 1 << (num - 1)))
+        if cands is None:
+            return None
+        solutions = []
+        self._search(cands, False, 1, solutions, [node_limit] if node_limit else None)
+        return solutions[0] if solutions else None
+
+    def find_alternative_from(self, cands, cell, mask, node_limit=None):
+        """
+        find_alternative for candidate masks that masks_from_grid already
+        propagated: takes `mask` off `cell` and propagates from that cell
+        alone. Several checks on the same grid share one full propagation.
+        `cands` is not modified.
+        """
+        m = cands[cell] & ~mask
+        if not m:
+            return None
+        child = cands[:]
+        child[cell] = m
+        if not self._propagate(child, [] if m & (m - 1) else [cell], self.cell_unit_bits[cell]):
+            return None
+        solutions = []
+        self._search(child, False, 1, solutions, [node_limit] if node_limit else None)
+        return solutions[0] if solutions else None
+
+    def place(self, cands, cell, bit):
+        """Puts digit `bit` in `cell` of propagated candidate masks, in place. False on a contradiction."""
+        cands[cell] = bit
+        return self._propagate(cands, [cell], self.cell_unit_bits[cell])
+
+    def bit_tables(self):
+        """
+        (peer_masks, cell_unit_masks): per cell, its peers and each of its
+        units as bitmasks over flat cell indices. Built on first use.
+        """
+        if self._bit_tables is None:
+            unit_masks = [sum(1 << cell for cell in unit) for unit in self.units]
+            self._bit_tables = ([sum(1 << p for p in peers) for peers in self.peers],
+                                [tuple(unit_masks[u] for u in units) for units in self.cell_units])
+        return self._bit_tables
+
+    def is_solvable(self, grid, node_limit=None):
+        """
+        True if `grid` has at least one solution, False if it has none.
+        With `node_limit`, returns None when the search runs out of nodes first.
+        """
+        cands = self.masks_from_grid(grid)
+        if cands is None:
+            return False
+        solutions = []
+        try:
+            self._search(cands, False, 1, solutions, [node_limit] if node_limit else None)
+        except SearchLimitExceeded:
+            return None
+        return bool(solutions)
+
+
+class DancingLinksSolver:
+    """
+    Exact-cover solver (Knuth's Algorithm X with Dancing Links).
+
+    Each (row, col, digit) choice is a matrix row covering four constraints:
+    the cell is filled, the digit appears once in the row, in the column and
+    in the box. The search always branches on the constraint with the fewest
+    remaining options, so its cost does not depend on the cell order that
+    trips up plain backtracking.
+    """
     def __init__(self, size=9):
         self.size = size
-        self.grid = [[0 for _ in range(size)] for _ in range(size)]
-        self.solution = [[0 for _ in range(size)] for _ in range(size)]
+        self.box_rows, self.box_cols = box_dimensions(size)
+        self.num_cells = size * size
+        self.num_columns = 4 * self.num_cells
+
+        # Column ids of the four constraints for every candidate (r, c, d)
+        n, cells = size, self.num_cells
+        br, bc = self.box_rows, self.box_cols
+        self.row_columns = []
+        for r in range(n):
+            for c in range(n):
+                box = (r // br) * (n // bc) + c // bc
+                for d in range(n):
+                    self.row_columns.append((
+                        r * n + c,
+                        cells + r * n + d,
+                        2 * cells + c * n + d,
+                        3 * cells + box * n + d,
+                    ))
+        self.stats = None # SolverStats to count into, or None (no instrumentation)
+
+    def _build(self):
+        """Builds a fresh linked matrix. Node 0 is the root, 1..num_columns are headers."""
+        ncols = self.num_columns
+        total = 1 + ncols + 4 * len(self.row_columns)
+        L = [0] * total
+        R = [0] * total
+        U = list(range(total))
+        D = list(range(total))
+        C = [0] * total
+        S = [0] * (ncols + 1)
+        row_of = [0] * total
+        row_first = []
+
+        for i in range(ncols + 1):
+            L[i] = i - 1
+            R[i] = i + 1
+        L[0] = ncols
+        R[ncols] = 0
+
+        node = ncols + 1
+        for row_id, cols in enumerate(self.row_columns):
+            first = node
+            row_first.append(first)
+            for k, col in enumerate(cols):
+                header = col + 1
+                C[node] = header
+                row_of[node] = row_id
+                # Append at the bottom of the column
+                U[node] = U[header]
+                D[node] = header
+                D[U[header]] = node
+                U[header] = node
+                S[header] += 1
+                # Circular row links
+                L[node] = node - 1 if k else first + 3
+                R[node] = node + 1 if k < 3 else first
+                node += 1
+        return L, R, U, D, C, S, row_of, row_first
+
+    @staticmethod
+    def _cover(c, L, R, U, D, C, S):
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    @staticmethod
+    def _uncover(c, L, R, U, D, C, S):
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def _search(self, links, chosen, randomize, limit, solutions, budget=None):
+        if budget is not None:
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise SearchLimitExceeded()
+        L, R, U, D, C, S, row_of, _ = links
+        stats = self.stats
+        if stats is not None:
+            stats.nodes += 1
+        if R[0] == 0:
+            solutions.append(chosen[:])
+            return len(solutions) >= limit
+
+        # Column with the fewest remaining rows
+        c = R[0]
+        best, best_size = c, S[c]
+        while c != 0:
+            if S[c] < best_size:
+                best, best_size = c, S[c]
+                if best_size <= 1:
+                    break
+            c = R[c]
+        if best_size == 0:
+            return False
+
+        rows = []
+        i = D[best]
+        while i != best:
+            rows.append(i)
+            i = D[i]
+        if randomize:
+            random.shuffle(rows)
+
+        cover, uncover = self._cover, self._uncover
+        cover(best, L, R, U, D, C, S)
+        covered = 1
+        for i in rows:
+            chosen.append(row_of[i])
+            j = R[i]
+            while j != i:
+                cover(C[j], L, R, U, D, C, S)
+                covered += 1
+                j = R[j]
+            done = self._search(links, chosen, randomize, limit, solutions, budget)
+            j = L[i]
+            while j != i:
+                uncover(C[j], L, R, U, D, C, S)
+                j = L[j]
+            chosen.pop()
+            if done:
+                uncover(best, L, R, U, D, C, S)
+                if stats is not None:
+                    stats.propagations += covered
+                return True
+            if stats is not None:
+                stats.backtracks += 1
+        uncover(best, L, R, U, D, C, S)
+        if stats is not None:
+            stats.propagations += covered
+        return False
+
+    def _run(self, grid, randomize, limit, budget=None):
+        links = self._build()
+        L, R, U, D, C, S, row_of, row_first = links
+        n = self.size
+        chosen = []
+        covered = set()
+        for r in range(n):
+            for c in range(n):
+                num = grid[r][c]
+                if num:
+                    row_id = (r * n + c) * n + num - 1
+                    for col in self.row_columns[row_id]:
+                        if col in covered:
+                            return [], n # Two givens clash
+                        covered.add(col)
+                    node = row_first[row_id]
+                    for k in range(4):
+                        self._cover(C[node + k], L, R, U, D, C, S)
+                    chosen.append(row_id)
+        solutions = []
+        self._search(links, chosen, randomize, limit, solutions, budget)
+        return solutions, n
+
+    def solve(self, grid, randomize=False, budget=None):
+        """
+        Solves a list-of-lists grid without modifying it.
+        Returns the solved grid, or None if the grid has no solution.
+        `budget` works as in BitmaskSolver.solve.
+        """
+        solutions, n = self._run(grid, randomize, 1, budget)
+        if not solutions:
+            return None
+        solved = [[0] * n for _ in range(n)]
+        for row_id in solutions[0]:
+            cell, d = divmod(row_id, n)
+            solved[cell // n][cell % n] = d + 1
+        return solved
+
+    def count_solutions(self, grid, limit=2):
+        """Counts the solutions of a grid, stopping once `limit` are found."""
+        solutions, _ = self._run(grid, False, limit)
+        return len(solutions)
+
+
+# Solver backends selectable through SudokuGenerator(solver=...)
+SOLVER_BACKENDS = {
+    "bitmask": BitmaskSolver,
+    "dlx": DancingLinksSolver,
+}
+
+
+def compare_solvers(puzzles, backends=None, size=9):
+    """
+    Times every backend on the same list of puzzles.
+    Returns {backend_name: {'solved', 'total_ms', 'max_ms'}} so slow
+    worst cases stand out next to the totals.
+    """
+    results = {}
+    for name in (backends or SOLVER_BACKENDS):
+        solver = SOLVER_BACKENDS[name](size)
+        solved = 0
+        total = worst = 0.0
+        for puzzle in puzzles:
+            start = time.perf_counter()
+            if solver.solve(puzzle) is not None:
+                solved += 1
+            elapsed = (time.perf_counter() - start) * 1000
+            total += elapsed
+            worst = max(worst, elapsed)
+        results[name] = {'solved': solved, 'total_ms': total, 'max_ms': worst}
+    return results
+
+
+# --- Portfolio solving ---
+# Strategy name -> (backend class, constructor kwargs, randomize)
+PORTFOLIO_STRATEGIES = {
+    "bitmask": (BitmaskSolver, {}, False),                   # MRV, digits low -> high, naked + hidden singles
+    "bitmask-reverse": (BitmaskSolver, {'reverse': True}, False), # Same propagation, opposite cell/digit order
+    "dlx": (DancingLinksSolver, {}, False),                  # Exact cover, no propagation besides covering
+    "random": (BitmaskSolver, {}, True),                     # Random restart: shuffled digits, own seed per copy
+}
+PORTFOLIO_DEFAULT = ("bitmask", "bitmask-reverse", "dlx", "random")
+PORTFOLIO_TIMEOUT = 1.0        # Giây tối đa cho một lần PortfolioSolver.solve
+PORTFOLIO_NODE_LIMIT = 200000  # Search nodes one strategy may spend before giving up
+PORTFOLIO_CHECK_INTERVAL = 256 # Nodes between two deadline/cancel checks in a worker
+PORTFOLIO_CANCEL_SLOTS = 64    # Concurrent solve() calls one PortfolioSolver can tell apart
+
+_portfolio_cancel = None # Per slot, the generation of the live solve() call (0: none); shared with the parent
+_portfolio_solvers = {}  # (size, strategy) -> solver, one set per worker process
+
+
+class _PortfolioBudget:
+    """
+    Node budget of one portfolio strategy. Works like the one-item budget
+    list the solvers take, but every PORTFOLIO_CHECK_INTERVAL nodes it also
+    checks the deadline and whether its call's slot still holds the call's
+    generation, and drops to -1 (so the search raises SearchLimitExceeded)
+    once the deadline passed or the call is over.
+    """
+    def __init__(self, nodes, deadline, slot, generation):
+        self.nodes = nodes
+        self.deadline = deadline
+        self.slot = slot
+        self.generation = generation
+        self.expired = False # True if stopped by the deadline or a cancel rather than the node budget
+
+    def __getitem__(self, index):
+        return self.nodes
+
+    def __setitem__(self, index, value):
+        if value % PORTFOLIO_CHECK_INTERVAL == 0 and (_portfolio_cancel[self.slot] != self.generation
+                                                      or time.monotonic() > self.deadline):
+            self.expired = True
+            value = -1
+        self.nodes = value
+
+
+def _portfolio_init(cancel):
+    global _portfolio_cancel
+    _portfolio_cancel = cancel
+
+
+def _portfolio_job(size, strategy, grid, slot, generation, deadline, node_limit, seed):
+    """
+    Worker entry point for PortfolioSolver: runs one strategy on `grid` for
+    the solve() call `generation`, which owns cancel slot `slot` while it
+    runs. Returns (status, solution, nodes) with status 'solved',
+    'unsolvable', 'limit' (node budget used up) or 'cancelled' (deadline
+    passed, or the call is over: another strategy already answered).
+    """
+    if _portfolio_cancel[slot] != generation or time.monotonic() > deadline:
+        return 'cancelled', None, 0 # Đã có kết quả (hoặc ô đã thuộc lần gọi khác) trước khi việc này được chạy
+    key = (size, strategy)
+    solver = _portfolio_solvers.get(key)
+    backend, options, randomize = PORTFOLIO_STRATEGIES[strategy]
+    if solver is None:
+        solver = _portfolio_solvers[key] = backend(size, **options)
+    random.seed(seed)
+    budget = _PortfolioBudget(node_limit, deadline, slot, generation)
+    try:
+        solution = solver.solve(grid, randomize, budget)
+    except SearchLimitExceeded:
+        return ('cancelled' if budget.expired else 'limit'), None, node_limit - max(0, budget.nodes)
+    return ('solved' if solution is not None else 'unsolvable'), solution, node_limit - budget.nodes
+
+
+class PortfolioSolver:
+    """
+    Races several search strategies (see PORTFOLIO_STRATEGIES; repeat
+    "random" for more restarts) on the same puzzle in worker processes and
+    returns the first definite answer. Each call takes a cancel slot and
+    stores its own generation number there; once it returns, the losing
+    strategies (and jobs of the call still queued) see that the slot no
+    longer holds their generation within PORTFOLIO_CHECK_INTERVAL nodes and
+    stop. A slot reused by a later call therefore never revives them.
+    Every call is bounded by a deadline and a per-strategy node budget, so a
+    puzzle that is pathological for one search order cannot stall the caller.
+    Concurrent solve() calls from several threads are allowed.
+    """
+    def __init__(self, size=9, strategies=None, workers=None):
+        strategies = tuple(strategies or PORTFOLIO_DEFAULT)
+        for strategy in strategies:
+            if strategy not in PORTFOLIO_STRATEGIES:
+                raise ValueError(f"Unknown portfolio strategy '{strategy}'. Choose from: {', '.join(PORTFOLIO_STRATEGIES)}")
+        self.size = size
+        self.strategies = strategies
+        self.wins = {} # strategy -> number of calls it answered first
+        self._cancel = multiprocessing.RawArray('q', PORTFOLIO_CANCEL_SLOTS)
+        self._next_slot = 0
+        self._generation = 0 # Số thứ tự của lần gọi solve() gần nhất
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(max_workers=workers or len(strategies),
+                                             initializer=_portfolio_init, initargs=(self._cancel,))
+
+    def solve(self, grid, timeout=PORTFOLIO_TIMEOUT, node_limit=PORTFOLIO_NODE_LIMIT):
+        """
+        Solves `grid` (list of lists or SudokuBoard) within `timeout` seconds.
+        Returns {'status', 'solution', 'strategy', 'seconds'}, where status is
+        'solved', 'unsolvable', 'limit' (every strategy used up `node_limit`
+        nodes) or 'timeout'; solution and strategy are None unless solved.
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % PORTFOLIO_CANCEL_SLOTS
+            self._generation += 1
+            generation = self._cancel[slot] = self._generation
+        grid = [list(row) for row in grid]
+        strategy_of = {self._executor.submit(_portfolio_job, self.size, strategy, grid, slot, generation, deadline,
+                                             node_limit, random.getrandbits(64)): strategy
+                       for strategy in self.strategies}
+        pending = set(strategy_of)
+        status, solution, winner, limited = 'timeout', None, None, 0
+        try:
+            while pending and winner is None:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    break # Hết thời gian: các chiến lược còn lại bị hủy
+                for future in done:
+                    job_status, job_solution, _ = future.result()
+                    if job_status in ('solved', 'unsolvable'):
+                        status, solution, winner = job_status, job_solution, strategy_of[future]
+                        break
+                    if job_status == 'limit':
+                        limited += 1
+            if winner is None and not pending and limited == len(self.strategies):
+                status = 'limit'
+        finally:
+            with self._lock:
+                if self._cancel[slot] == generation: # Ô chưa bị lần gọi mới hơn lấy lại
+                    self._cancel[slot] = 0
+            for future in pending:
+                future.cancel()
+        if winner is not None:
+            with self._lock:
+                self.wins[winner] = self.wins.get(winner, 0) + 1
+        return {'status': status, 'solution': solution, 'strategy': winner, 'seconds': time.monotonic() - start}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-    def _is_valid(self, grid, r, c, num):
-        # Check row
-        for x in range(self.size):
-            if grid[r][x] == num:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# --- Parallel search for large grids ---
+PARALLEL_MIN_SIZE = 16        # SudokuGenerator with workers > 1 splits searches from this board size up
+PARALLEL_SPLIT_FACTOR = 4     # Subproblems made up front per worker
+PARALLEL_CHECK_INTERVAL = 256 # Nodes between two cancel/steal checks in a worker
+PARALLEL_POLL = 0.01          # Giây giữa hai lần tiến trình cha xem kết quả và việc được nhường
+
+_parallel_state = None  # (call id, hungry flag, donation queue) shared with the parent, set by _parallel_init
+_parallel_solver = None # BitmaskSolver of this worker process
+
+
+def _parallel_init(call, hungry, donations, size, variant):
+    global _parallel_state, _parallel_solver
+    _parallel_state = (call, hungry, donations)
+    _parallel_solver = BitmaskSolver(size, variant=variant)
+
+
+def _parallel_job(call_id, cands, limit, randomize, seed):
+    """
+    Worker entry point for ParallelSolver: depth-first search of one subtree.
+    While the parent's hungry flag is up, the shallowest half of the pending
+    branches is handed to the donation queue for an idle worker.
+    Returns (count, solution masks or None, nodes, donations); a job whose
+    call has ended (enough solutions found elsewhere) stops early.
+    """
+    call, hungry, donations = _parallel_state
+    solver = _parallel_solver
+    cell_unit_bits = solver.cell_unit_bits
+    random.seed(seed)
+    stack = [cands]
+    count, solution, nodes, donated = 0, None, 0, 0
+    while stack:
+        nodes += 1
+        if nodes % PARALLEL_CHECK_INTERVAL == 0:
+            if call.value != call_id:
+                break # Lần gọi đã kết thúc: tiến trình khác đã đủ lời giải
+            if hungry.value and len(stack) > 1:
+                hungry.value = 0
+                # Đáy ngăn xếp là các nhánh nông nhất, tức các cây con lớn nhất
+                half = len(stack) // 2
+                donations.put((call_id, stack[:half]))
+                del stack[:half]
+                donated += 1
+        cands = stack.pop()
+        cell = solver._pick_cell(cands)
+        if cell < 0:
+            count += 1
+            if solution is None:
+                solution = cands
+            if count >= limit:
+                break
+            continue
+        m = cands[cell]
+        bits = []
+        while m:
+            bit = m & -m
+            bits.append(bit)
+            m ^= bit
+        if randomize:
+            random.shuffle(bits)
+        for bit in reversed(bits): # Pushed in reverse so the first digit is searched first
+            child = cands[:]
+            child[cell] = bit
+            if solver._propagate(child, [cell], cell_unit_bits[cell]):
+                stack.append(child)
+    return count, solution, nodes, donated
+
+
+class ParallelSolver(BitmaskSolver):
+    """
+    BitmaskSolver whose solve() and count_solutions() split the search tree
+    across worker processes, for 16x16 and 25x25 boards where one unlucky
+    branch can keep a single search busy for minutes.
+
+    The tree is expanded breadth-first into about `split_factor` subproblems
+    per worker, handed out by the pool as workers free up. Once no work is
+    queued and a worker sits idle, the parent raises a hungry flag and the
+    next busy job to see it donates the shallowest half of its pending
+    branches (work stealing). The first solution ends the call and the other
+    jobs stop within PARALLEL_CHECK_INTERVAL nodes; counting adds up the
+    disjoint subtrees until `limit`.
+    The other BitmaskSolver methods run in-process. One parallel search runs
+    at a time per instance; concurrent calls wait for each other.
+    """
+    def __init__(self, size=16, workers=None, variant=None, split_factor=PARALLEL_SPLIT_FACTOR):
+        super().__init__(size, variant=variant)
+        self.workers = workers or os.cpu_count() or 1
+        self.split_factor = split_factor
+        self.last_run = None # {'jobs', 'steals', 'nodes', 'seconds'} of the last parallel search
+        self._call = multiprocessing.RawValue('q', 0)
+        self._hungry = multiprocessing.RawValue('b', 0)
+        self._donations = multiprocessing.Queue()
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_parallel_init,
+                                             initargs=(self._call, self._hungry, self._donations, size, variant))
+
+    def _split(self, cands, jobs, limit, randomize):
+        """
+        Expands `cands` breadth-first into at least `jobs` subproblems (fewer
+        if the tree is smaller). Returns (subproblems, solutions met on the way).
+        """
+        frontier = deque([cands])
+        solutions = []
+        while frontier and len(frontier) < jobs and len(solutions) < limit:
+            cands = frontier.popleft()
+            cell = self._pick_cell(cands)
+            if cell < 0:
+                solutions.append(cands)
+                continue
+            m = cands[cell]
+            bits = []
+            while m:
+                bit = m & -m
+                bits.append(bit)
+                m ^= bit
+            if randomize:
+                random.shuffle(bits)
+            for bit in bits:
+                child = cands[:]
+                child[cell] = bit
+                if self._propagate(child, [cell], self.cell_unit_bits[cell]):
+                    frontier.append(child)
+        return list(frontier), solutions
+
+    def _run(self, grid, limit, randomize):
+        """Parallel search: (number of solutions up to `limit`, masks of one solution or None)."""
+        start = time.monotonic()
+        cands = self.masks_from_grid(grid)
+        if cands is None:
+            return 0, None
+        subproblems, solutions = self._split(cands, self.workers * self.split_factor, limit, randomize)
+        count = len(solutions)
+        solution = solutions[0] if solutions else None
+        jobs, steals, nodes = 0, 0, 0
+        with self._lock:
+            self._call.value += 1
+            call_id = self._call.value
+            pending = set()
+            announced = received = 0 # Donations reported by finished jobs / taken from the queue
+            try:
+                if count < limit:
+                    for state in subproblems:
+                        pending.add(self._executor.submit(_parallel_job, call_id, state, limit, randomize,
+                                                          random.getrandbits(64)))
+                    jobs = len(pending)
+                while count < limit and (pending or received < announced):
+                    done = ()
+                    if pending:
+                        done, pending = wait(pending, timeout=PARALLEL_POLL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_count, job_solution, job_nodes, donated = future.result()
+                        count += job_count
+                        nodes += job_nodes
+                        announced += donated
+                        if solution is None:
+                            solution = job_solution
+                    if count >= limit:
+                        break
+                    # Việc được nhường: mỗi nhánh thành một việc mới trong pool
+                    block = not pending # Chỉ còn chờ các nhánh đang trên đường tới hàng đợi
+                    try:
+                        while True:
+                            donor_call, states = self._donations.get(block, PARALLEL_POLL)
+                            block = False
+                            if donor_call != call_id:
+                                continue # Của một lần gọi trước đã kết thúc
+                            received += 1
+                            steals += 1
+                            for state in states:
+                                pending.add(self._executor.submit(_parallel_job, call_id, state, limit, randomize,
+                                                                  random.getrandbits(64)))
+                            jobs += len(states)
+                    except Empty:
+                        pass
+                    self._hungry.value = 1 if len(pending) < self.workers else 0
+            finally:
+                self._call.value += 1 # Báo các việc còn chạy dừng lại
+                self._hungry.value = 0
+                for future in pending:
+                    future.cancel()
+        if self.stats is not None:
+            self.stats.nodes += nodes
+        self.last_run = {'jobs': jobs, 'steals': steals, 'nodes': nodes, 'seconds': time.monotonic() - start}
+        return min(count, limit), solution
+
+    def solve(self, grid, randomize=False, budget=None):
+        """
+        Solves a list-of-lists grid on the process pool; returns the solved
+        grid or None. With a node `budget` the search runs in-process, as in
+        BitmaskSolver.solve.
+        """
+        if budget is not None:
+            return BitmaskSolver.solve(self, grid, randomize, budget)
+        _, solution = self._run(grid, 1, randomize)
+        return self.grid_from_masks(solution) if solution is not None else None
+
+    def count_solutions(self, grid, limit=2):
+        """Counts the solutions of a grid across the process pool, stopping once `limit` are found."""
+        return self._run(grid, limit, False)[0]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._donations.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def random_transform(size=9):
+    """
+    Draws a random validity-preserving symmetry: digit relabeling, row swaps
+    within bands, band swaps, column/stack swaps, transposition and rotation
+    (the last two only for square boxes).
+    Returns (digit_map, row_order, col_order, transpose).
+    """
+    box_rows, box_cols = box_dimensions(size)
+
+    def line_order(width):
+        blocks = list(range(size // width))
+        random.shuffle(blocks)
+        order = []
+        for b in blocks:
+            inner = list(range(b * width, b * width + width))
+            random.shuffle(inner)
+            order.extend(inner)
+        return order
+
+    digits = list(range(1, size + 1))
+    random.shuffle(digits)
+    digit_map = [0] + digits # 0 (ô trống) giữ nguyên
+    row_order = line_order(box_rows)
+    col_order = line_order(box_cols)
+    square = box_rows == box_cols
+    transpose = square and random.random() < 0.5
+    if square and random.random() < 0.5:
+        # Rotation by 90 degrees = transpose + reversed column order
+        transpose = not transpose
+        col_order.reverse()
+    return digit_map, row_order, col_order, transpose
+
+
+def apply_transform(grid, transform):
+    """Applies a transform from random_transform() to a list-of-lists grid."""
+    digit_map, row_order, col_order, transpose = transform
+    if transpose:
+        return [[digit_map[grid[c][r]] for c in col_order] for r in row_order]
+    return [[digit_map[grid[r][c]] for c in col_order] for r in row_order]
+
+
+# --- Canonical form & fingerprints ---
+# Two puzzles are the same puzzle if a validity-preserving symmetry (digit
+# relabeling, row/band and column/stack permutations, transposition for square
+# boxes) maps one onto the other. The canonical form is the smallest image
+# under the order "row by row: givens pattern first (empty cells first), then
+# relabeled digits (in order of first appearance)". It is found row by row:
+# every level keeps only the partial transforms that reach the smallest row,
+# and columns that are still interchangeable stay grouped instead of being
+# enumerated. Rows and columns are first ordered by invariant keys (what their
+# box segments share with the other bands/stacks), which splits most ties
+# before any branching, so a typical puzzle keeps a single candidate after a
+# few rows, and partial transforms that leave the same remaining problem are
+# merged. Grids with many symmetries of their own (a single filled row, the
+# shifted-row pattern grid) still tie on far more orderings than that, so no
+# list of tied partial transforms (or orderings of one row) ever grows past
+# CANONICAL_MAX_TIES: the later ones are dropped. The search therefore never
+# carries more than CANONICAL_MAX_TIES transforms from one row to the next,
+# whatever the grid. A grid that hits the cap still gets a valid image of
+# itself (the cache stays correct), but its symmetric copies may not all
+# share it; generated puzzles stay far below the cap.
+FINGERPRINT_BYTES = 16
+CANONICAL_MAX_TIES = 16 # Tied partial transforms kept at any point of canonical_form()
+
+
+def _canon_segment(bits, stack):
+    """Givens pattern of one stack for a row (`bits`): empty cells first in every column group."""
+    seg = 0
+    for group, group_bits in stack:
+        seg = (seg << len(group)) | ((1 << (bits & group_bits).bit_count()) - 1)
+    return seg
+
+
+def _canon_row_shape(bits, structure, width):
+    """Smallest givens pattern a row can take under a column structure."""
+    shape = 0
+    for stacks in structure:
+        if len(stacks) == 1:
+            shape = (shape << width) | _canon_segment(bits, stacks[0])
+        else:
+            for seg in sorted(_canon_segment(bits, stack) for stack in stacks):
+                shape = (shape << width) | seg
+    return shape
+
+
+def _canon_refine_stack(row, stack, partial):
+    """
+    Appends one stack of `row` to every partial result (labels, structure,
+    digit_map, next_label). Inside a column group the empty cells stay grouped,
+    known digits are ordered by label and new digits are tried in every order.
+    """
+    out = []
+    for labels, structure, digit_map, next_label in partial:
+        if len(out) >= CANONICAL_MAX_TIES:
+            break
+        branch = [(labels, (), digit_map, next_label)]
+        for group in stack:
+            cols, group_bits = group
+            zeros = tuple(c for c in cols if not row[c])
+            if len(zeros) == len(cols):
+                branch = [(l, g + (group,), d, n) for l, g, d, n in branch]
+                continue
+            zero_group = ((zeros, sum(1 << c for c in zeros)),) if zeros else ()
+            new_branch = []
+            for l, g, d, n in branch:
+                known = sorted((d[row[c]], c) for c in cols if row[c] in d)
+                new = [c for c in cols if row[c] and row[c] not in d]
+                l = l + tuple(label for label, _ in known)
+                g = g + zero_group + tuple(((c,), 1 << c) for _, c in known)
+                if not new:
+                    new_branch.append((l, g, d, n))
+                    continue
+                for order in permutations(new):
+                    if len(new_branch) >= CANONICAL_MAX_TIES:
+                        break # Mọi thứ tự của số mới cho cùng nhãn: giữ vài cái đầu
+                    d2 = dict(d)
+                    for i, c in enumerate(order):
+                        d2[row[c]] = n + i
+                    new_branch.append((l + tuple(range(n, n + len(order))),
+                                       g + tuple(((c,), 1 << c) for c in order), d2, n + len(order)))
+            branch = new_branch[:CANONICAL_MAX_TIES]
+        for l, g, d, n in branch:
+            out.append((l, structure + ((g,),), d, n))
+    return out[:CANONICAL_MAX_TIES]
+
+
+def _canon_refine(row, bits, structure, digit_map, next_label):
+    """
+    All smallest orderings of `row` under a column structure (a tuple of
+    groups of interchangeable stacks, each stack a tuple of column groups).
+    Returns [(labels, structure, digit_map, next_label)].
+    """
+    results = [((), (), digit_map, next_label)]
+    for stacks in structure:
+        if len(stacks) == 1:
+            classes = ((_canon_segment(bits, stacks[0]), stacks),)
+        else:
+            by_seg = {}
+            for stack in stacks:
+                by_seg.setdefault(_canon_segment(bits, stack), []).append(stack)
+            classes = sorted(by_seg.items())
+        for seg, same in classes:
+            if seg == 0:
+                # Stack trống ở hàng này: vẫn hoán đổi được cho nhau
+                results = [(l, st + (tuple(same),), d, n) for l, st, d, n in results]
+                continue
+            new_results = []
+            for order in (permutations(same) if len(same) > 1 else (same,)):
+                if len(new_results) >= CANONICAL_MAX_TIES:
+                    break
+                partial = results
+                for stack in order:
+                    partial = _canon_refine_stack(row, stack, partial)
+                new_results.extend(partial)
+            if len(new_results) > 1:
+                best = min(r[0] for r in new_results)
+                new_results = [r for r in new_results if r[0] == best]
+            results = new_results[:CANONICAL_MAX_TIES]
+    return results
+
+
+def _canon_discrete(structure):
+    """True once every column has its own place (no interchangeable stacks or columns left)."""
+    for stacks in structure:
+        if len(stacks) > 1:
+            return False
+        for group in stacks[0]:
+            if len(group[0]) > 1:
                 return False
-        # Check column
-        for x in range(self.size):
-            if grid[x][c] == num:
+    return True
+
+
+def _canon_image(row, cols, digit_map, next_label):
+    """
+    What _canon_refine() gives for `row` under a discrete column order
+    `cols`, without its machinery: (givens pattern, labels, digit_map,
+    next_label). `digit_map` is only copied when the row has new digits.
+    """
+    shape = 0
+    labels = []
+    copied = False
+    for c in cols:
+        v = row[c]
+        shape <<= 1
+        if v:
+            shape |= 1
+            label = digit_map.get(v)
+            if label is None:
+                if not copied:
+                    digit_map, copied = dict(digit_map), True
+                label = digit_map[v] = next_label
+                next_label += 1
+            labels.append(label)
+    return shape, tuple(labels), digit_map, next_label
+
+
+def _canon_line_keys(lines, seg_len, group_len):
+    """
+    A key per line that no validity-preserving symmetry changes: for every
+    box segment of the line, how many givens it holds and how many digits it
+    shares with each line of the other groups (stacks for columns, bands for
+    rows) in that segment, as a sorted tuple of one int per segment (the
+    count above a histogram of the shared counts, 5 bits per bucket).
+    """
+    n = len(lines)
+    masks = []
+    for line in lines:
+        m = [0] * (n // seg_len)
+        for j, v in enumerate(line):
+            if v:
+                m[j // seg_len] |= 1 << v
+        masks.append(m)
+    shift = 5 * (seg_len + 1)
+    keys = []
+    for i, own in enumerate(masks):
+        g = i // group_len
+        others = masks[:g * group_len] + masks[(g + 1) * group_len:]
+        segs = []
+        for j, m in enumerate(own):
+            if not m:
+                segs.append(0)
+                continue
+            hist = 0
+            for other in others:
+                hist += 1 << 5 * (m & other[j]).bit_count()
+            segs.append(m.bit_count() << shift | hist)
+        segs.sort()
+        keys.append(tuple(segs))
+    return keys
+
+
+def _canon_state_key(grids, state, box_rows):
+    """
+    What the rest of the search depends on for one partial transform: the
+    column structure and the rows still to place, as they read under it
+    (digits not labeled yet get codes in order of appearance). States with
+    the same key end in the same canonical grid, so one of them is enough.
+    """
+    t, rows, band_left, structure, digit_map, _ = state
+    grid = grids[t]
+    size = len(grid)
+    cols = [c for stacks in structure for stack in stacks for group, _ in stack for c in group]
+    shape = tuple(tuple(tuple(len(group) for group, _ in stack) for stack in stacks) for stacks in structure)
+    used = {r // box_rows for r in rows}
+    bands = [band_left] + [range(b * box_rows, (b + 1) * box_rows) for b in range(size // box_rows) if b not in used]
+    # Nhãn tạm cho số chưa có nhãn: thứ tự xuất hiện sau khi xếp các hàng theo phần đã có nhãn
+    plain = lambda r: tuple(digit_map.get(grid[r][c], -1) if grid[r][c] else 0 for c in cols)
+    bands = [sorted(band, key=plain) for band in bands]
+    bands[1:] = sorted(bands[1:], key=lambda band: [plain(r) for r in band])
+    codes = {}
+    for band in bands:
+        for r in band:
+            for c in cols:
+                v = grid[r][c]
+                if v and v not in digit_map and v not in codes:
+                    codes[v] = size + 1 + len(codes)
+    image = lambda r: tuple(digit_map.get(grid[r][c]) or codes[grid[r][c]] if grid[r][c] else 0 for c in cols)
+    return shape, tuple(sorted(map(image, bands[0]))), tuple(sorted(tuple(sorted(map(image, band))) for band in bands[1:]))
+
+
+def _canon_search(grids, row_bits, col_keys, row_keys):
+    """
+    The row-by-row search of canonical_form() with the given line keys.
+    Returns the final state (transposed, row order, _, column structure,
+    digit map, next label). States that leave the same remaining problem
+    are merged, so grids with symmetries keep few of them.
+    """
+    size = len(grids[0])
+    box_rows, box_cols = box_dimensions(size)
+    starts, first_rows, band_keys = [], [], []
+    for t in range(len(grids)):
+        keys = col_keys[t]
+        by_key = {}
+        for s in range(size // box_cols):
+            cols = sorted(range(s * box_cols, (s + 1) * box_cols), key=keys.__getitem__)
+            groups = []
+            for c in cols:
+                if groups and keys[groups[-1][0]] == keys[c]:
+                    groups[-1].append(c)
+                else:
+                    groups.append([c])
+            stack = tuple((tuple(g), sum(1 << c for c in g)) for g in groups)
+            by_key.setdefault(tuple(keys[c] for c in cols), []).append(stack)
+        starts.append(tuple(tuple(stacks) for _, stacks in sorted(by_key.items())))
+        keys = row_keys[t]
+        bands = [range(b * box_rows, (b + 1) * box_rows) for b in range(size // box_rows)]
+        band_keys.append([sorted(keys[r] for r in band) for band in bands])
+        first_rows.append([[r for r in band if keys[r] == min(keys[x] for x in band)] for band in bands])
+    # state: (transposed, rows so far, rows left in the current band, column structure, digit map, next label)
+    states = [(t, (), (), starts[t], {}, 1) for t in range(len(grids))]
+    for level in range(size):
+        new_band = level % box_rows == 0
+        choices = []
+        for state in states:
+            t, rows, band_left = state[:3]
+            keys = row_keys[t]
+            if new_band:
+                # Khối hàng có khóa nhỏ nhất trước, trong đó hàng có khóa nhỏ nhất
+                used = {r // box_rows for r in rows}
+                free = [b for b in range(size // box_rows) if b not in used]
+                low = min(band_keys[t][b] for b in free)
+                choices.append([r for b in free if band_keys[t][b] == low for r in first_rows[t][b]])
+            else:
+                low = min(keys[r] for r in band_left)
+                choices.append([r for r in band_left if keys[r] == low])
+
+        def left_after(band_left, r):
+            if new_band:
+                band_start = r - r % box_rows
+                return tuple(x for x in range(band_start, band_start + box_rows) if x != r)
+            return tuple(x for x in band_left if x != r)
+
+        if all(_canon_discrete(state[3]) for state in states):
+            # Mọi cột đã có chỗ riêng: ảnh của một hàng đọc thẳng ra, không cần _canon_refine
+            best, new_states = None, []
+            for (t, rows, band_left, structure, digit_map, next_label), rs in zip(states, choices):
+                cols = [group[0][0] for stacks in structure for group in stacks[0]]
+                for r in rs:
+                    shape, labels, d, n = _canon_image(grids[t][r], cols, digit_map, next_label)
+                    if best is None or (shape, labels) < best:
+                        best, new_states = (shape, labels), []
+                    if (shape, labels) == best:
+                        new_states.append((t, rows + (r,), left_after(band_left, r), structure, d, n))
+            states = new_states
+        else:
+            best_shape, candidates = None, []
+            for state, rs in zip(states, choices):
+                t, structure = state[0], state[3]
+                for r in rs:
+                    shape = _canon_row_shape(row_bits[t][r], structure, box_cols)
+                    if best_shape is None or shape < best_shape:
+                        best_shape, candidates = shape, [(state, r)]
+                    elif shape == best_shape:
+                        candidates.append((state, r))
+
+            best_labels, states = None, []
+            for (t, rows, band_left, structure, digit_map, next_label), r in candidates:
+                left = left_after(band_left, r)
+                for labels, st, d, n in _canon_refine(grids[t][r], row_bits[t][r], structure, digit_map, next_label):
+                    if best_labels is None or labels < best_labels:
+                        best_labels, states = labels, []
+                    if labels == best_labels:
+                        states.append((t, rows + (r,), left, st, d, n))
+        if len(states) > 1:
+            del states[CANONICAL_MAX_TIES:]
+            # Các phép biến đổi dẫn tới cùng một bài toán còn lại (thường do đối xứng của lưới) chỉ giữ một
+            seen = set()
+            states = [state for state in states
+                      if not ((key := _canon_state_key(grids, state, box_rows)) in seen or seen.add(key))]
+    return states[0]
+
+
+def canonical_form(grid):
+    """
+    Returns (canonical_grid, transform) where transform is in the format of
+    random_transform() and apply_transform(grid, transform) == canonical_grid.
+    Equivalent puzzles have the same canonical grid.
+    """
+    size = len(grid)
+    box_rows, box_cols = box_dimensions(size)
+    grids = [grid]
+    if box_rows == box_cols:
+        grids.append([list(col) for col in zip(*grid)])
+    row_bits = [[sum(1 << c for c, v in enumerate(row) if v) for row in g] for g in grids]
+    # Khóa bất biến của cột và hàng chia nhỏ các trường hợp hòa; hàng của lưới chuyển vị là cột của lưới gốc
+    col_keys = [_canon_line_keys(list(zip(*g)), box_rows, box_cols) for g in grids]
+    row_keys = col_keys[::-1] if len(grids) == 2 else [_canon_line_keys(grid, box_cols, box_rows)]
+    state = _canon_search(grids, row_bits, col_keys, row_keys)
+    t, row_order, _, structure, found, next_label = state
+    col_order = [c for stacks in structure for stack in stacks for cols, _ in stack for c in cols]
+    # Chữ số không có trong đề nhận các nhãn còn lại theo thứ tự tăng dần
+    digit_map = [0] * (size + 1)
+    for num in range(1, size + 1):
+        if num in found:
+            digit_map[num] = found[num]
+        else:
+            digit_map[num] = next_label
+            next_label += 1
+    transform = (digit_map, list(row_order), col_order, bool(t))
+    return apply_transform(grid, transform), transform
+
+
+def invert_transform(transform):
+    """Returns the transform that undoes `transform` (both in the format of random_transform())."""
+    digit_map, row_order, col_order, transpose = transform
+    inverse_digits = [0] * len(digit_map)
+    for num, mapped in enumerate(digit_map):
+        inverse_digits[mapped] = num
+    inverse_rows = [0] * len(row_order)
+    for i, r in enumerate(row_order):
+        inverse_rows[r] = i
+    inverse_cols = [0] * len(col_order)
+    for i, c in enumerate(col_order):
+        inverse_cols[c] = i
+    if transpose:
+        return inverse_digits, inverse_cols, inverse_rows, True
+    return inverse_digits, inverse_rows, inverse_cols, False
+
+
+def grid_fingerprint(canonical_grid):
+    """128-bit fingerprint of an already canonical grid."""
+    data = bytes([len(canonical_grid)]) + bytes(v for row in canonical_grid for v in row)
+    return hashlib.blake2b(data, digest_size=FINGERPRINT_BYTES).digest()
+
+
+def puzzle_fingerprint(grid):
+    """Stable 128-bit fingerprint shared by all symmetric variants of a puzzle."""
+    return grid_fingerprint(canonical_form(grid)[0])
+
+
+CANONICAL_CACHE_SIZE = 4096 # Puzzles remembered by a CanonicalCache before the oldest is dropped
+CANONICAL_MAX_FILLED = 0.75  # Grids filled above this fraction skip the cache (solving them is cheaper)
+
+
+class CanonicalCache:
+    """
+    Solve and rating results keyed by puzzle fingerprint, so any symmetric
+    variant of a puzzle seen before is answered without a search. Solutions
+    are stored in canonical form and mapped back through the inverse
+    transform. Safe to share between threads (e.g. all games of the server).
+
+    Grids filled above `max_filled` (a board deep into a game, a complete
+    grid) are solved and rated directly: they are cheaper to search than to
+    canonicalize and rarely come back, so they would only crowd the cache.
+    """
+    def __init__(self, max_entries=CANONICAL_CACHE_SIZE, max_filled=CANONICAL_MAX_FILLED):
+        self.max_entries = max_entries
+        self.max_filled = max_filled
+        self._entries = {} # fingerprint -> {'solution': canonical solution or None, 'rating': dict}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key, field):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and field in entry:
+                self.hits += 1
+                return True, entry[field]
+            self.misses += 1
+            return False, None
+
+    def _store(self, key, field, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))] # Bỏ mục cũ nhất
+                entry = self._entries[key] = {}
+            entry[field] = value
+
+    def _bypass(self, grid):
+        size = len(grid)
+        filled = sum(1 for row in grid for v in row if v)
+        return filled > self.max_filled * size * size
+
+    def solve(self, grid, solve):
+        """Returns solve(grid) (a solved copy or None), reusing the solution of any known variant."""
+        if self._bypass(grid):
+            return solve(grid)
+        canonical, transform = canonical_form(grid)
+        key = grid_fingerprint(canonical)
+        found, solution = self._lookup(key, 'solution')
+        if found:
+            return None if solution is None else apply_transform(solution, invert_transform(transform))
+        solution = solve(grid)
+        self._store(key, 'solution', None if solution is None else apply_transform(solution, transform))
+        return solution
+
+    def rate(self, grid, rate):
+        """Returns rate(grid) (a DifficultyRater result), reusing the rating of any known variant."""
+        if self._bypass(grid):
+            return rate(grid)
+        key = puzzle_fingerprint(grid)
+        found, rating = self._lookup(key, 'rating')
+        if found:
+            return dict(rating, counts=dict(rating['counts']))
+        rating = rate(grid)
+        self._store(key, 'rating', dict(rating, counts=dict(rating['counts'])))
+        return rating
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+SEED_REFRESH_INTERVAL = 50 # Do a real solve every N seed-based solutions to add variety
+MAX_SEED_GRIDS = 32
+
+
+# DifficultyRater score band [low, high] each difficulty has to land in
+DEFAULT_RATING_BANDS = {
+    "very_easy": (1.0, 1.0),  # Naked singles only
+    "easy": (1.0, 1.2),       # Singles
+    "medium": (1.2, 2.9),     # Hidden singles up to locked candidates
+    "hard": (3.0, 5.9),       # Subsets and fish
+    "expert": (6.0, 10.0),    # Chains or guessing
+}
+DEFAULT_GENERATION_TIMEOUT = 2.0 # Seconds before generate_puzzle settles for its best candidate
+MINIMAL_GENERATION_TIMEOUT = 0.1 # Default for minimal puzzles, whose carve tries every clue
+CANDIDATE_BUDGET = 0.04          # Seconds after which generate_puzzle starts no fresh candidate (default timeout)
+CARVE_TIME_SHARE = 0.75          # Share of a candidate's remaining time its carve may use (the rest is for rating)
+MAX_BAND_ADJUSTMENTS = 40        # Remove/restore steps tried on one candidate before starting over
+MAX_BAND_CANDIDATES = 100        # Candidates tried before giving up on an unreachable band
+UNIQUENESS_NODES_PER_SIZE = 1    # Search nodes per uniqueness check on grids above 9x9 (times size)
+
+# Per-process generators reused by _rated_candidate_job
+_worker_generators = {}
+
+
+def _rated_candidate_job(size, solver, bands, difficulty, time_budget, seed, collect_stats=False, variant=None,
+                         symmetry=None, minimal=False):
+    """
+    Worker-process entry point: searches one candidate for `difficulty`.
+    Returns (candidate, SolverStats or None).
+    """
+    key = (size, solver, variant.key if isinstance(variant, SudokuVariant) else variant)
+    generator = _worker_generators.get(key)
+    if generator is None:
+        generator = _worker_generators[key] = SudokuGenerator(size, solver, variant=variant)
+    generator.rating_bands = bands
+    generator.collect_stats = collect_stats
+    generator.symmetry = symmetry
+    generator.minimal = minimal
+    random.seed(seed)
+    stats = generator._begin_stats()
+    try:
+        candidate = generator._search_rated_candidate(difficulty, time.monotonic() + time_budget)
+    finally:
+        if stats is not None:
+            generator._end_stats(stats)
+    return candidate, stats
+
+
+def _pool_job(size, solver, difficulty, seed, collect_stats=False):
+    """Worker entry point for PuzzlePool: one (puzzle, solution, SolverStats or None)."""
+    key = ("pool", size, solver)
+    generator = _worker_generators.get(key)
+    if generator is None:
+        generator = _worker_generators[key] = SudokuGenerator(size, solver)
+    generator.collect_stats = collect_stats
+    random.seed(seed)
+    puzzle, solution = generator.generate_puzzle(difficulty, timeout=generator.timeout) # Nền: không cần ngân sách ngắn
+    return puzzle, solution, generator.last_stats
+
+
+def _factory_job(size, solver, difficulty, seed, fingerprint=False):
+    """
+    Worker entry point for iter_puzzles: one (puzzle, solution, rating, seed)
+    from one seed, plus the puzzle fingerprint if `fingerprint` is set.
+    """
+    key = ("factory", size, solver)
+    generator = _worker_generators.get(key)
+    if generator is None:
+        # Không dùng lưới mẫu: mỗi puzzle chỉ phụ thuộc vào seed của nó, không vào tiến trình đã tạo nó
+        generator = _worker_generators[key] = SudokuGenerator(size, solver, use_seed_grids=False)
+    random.seed(seed)
+    puzzle, solution = generator.generate_puzzle(difficulty, timeout=generator.timeout)
+    if fingerprint:
+        return puzzle, solution, generator.last_rating['score'], seed, puzzle_fingerprint(puzzle)
+    return puzzle, solution, generator.last_rating['score'], seed
+
+
+def iter_puzzles(difficulty="medium", seed=None, size=9, solver="bitmask", workers=1, max_pending=None, executor=None,
+                 fingerprints=False):
+    """
+    Lazily yields (puzzle, solution, rating, seed) for `difficulty`, without
+    end; stop with break or itertools.islice. Each puzzle is generated from its
+    own seed, drawn from `seed`, so a run can be repeated (unless the
+    generation timeout cuts a search short).
+    With workers > 1 (or a given `executor`) puzzles are made on a process
+    pool with at most `max_pending` (default 2 * workers) jobs in flight: new
+    jobs are only submitted as the consumer takes results.
+    With `fingerprints` every item also carries puzzle_fingerprint(puzzle),
+    computed by the worker that made the puzzle.
+    """
+    seeds = random.Random(seed)
+    if executor is None and workers <= 1:
+        while True:
+            state = random.getstate() # Giữ nguyên trạng thái random của tiến trình gọi
+            try:
+                item = _factory_job(size, solver, difficulty, seeds.getrandbits(64), fingerprints)
+            finally:
+                random.setstate(state)
+            yield item
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    max_pending = max_pending or 2 * max(1, workers)
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < max_pending:
+                pending.append(executor.submit(_factory_job, size, solver, difficulty, seeds.getrandbits(64),
+                                               fingerprints))
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+SYMMETRIES = ("rotational", "mirror") # Clue symmetries generate_puzzle can keep
+
+
+def symmetry_orbits(size, symmetry=None):
+    """
+    Cells that are removed and restored together, as tuples of (r, c):
+    single cells without symmetry, else each cell with its partner under a
+    180 degree rotation ("rotational") or a left-right mirror ("mirror").
+    """
+    if symmetry is not None and symmetry not in SYMMETRIES:
+        raise ValueError(f"Unknown symmetry '{symmetry}'. Choose from: {', '.join(SYMMETRIES)}")
+    orbits = []
+    for r in range(size):
+        for c in range(size):
+            if symmetry == "rotational":
+                partner = (size - 1 - r, size - 1 - c)
+            elif symmetry == "mirror":
+                partner = (r, size - 1 - c)
+            else:
+                partner = (r, c)
+            if partner > (r, c):
+                orbits.append(((r, c), partner))
+            elif partner == (r, c):
+                orbits.append(((r, c),))
+    return orbits
+
+
+class UniquenessChecker:
+    """
+    Incremental "is it still unique?" checks while clues are removed from a
+    puzzle whose solution is known.
+
+    Every alternative solution a search turns up is kept as an unavoidable
+    set: the cells where it differs from the solution (as a bitmask). A
+    puzzle can only be unique if it keeps a clue in every unavoidable set,
+    and a set stays valid for every puzzle of the same solution, so later
+    removals that would empty one are refused without a search. A clue that
+    is the only one left in some set is proven necessary, which is what
+    makes is_minimal() cheap after a minimal carve.
+
+    Before searching, each removed cell is tested against the remaining
+    clues alone (bitmasks of the cells every digit's clues see): if all of
+    them are naked or hidden singles there, the puzzle is still unique.
+    Early in a carve that settles most removals without a search. Only the
+    cells that are not get a search, all starting from one propagation of
+    the grid.
+
+    With `digit_swaps` (only for rules where every unit holds each digit
+    once and nothing else constrains a pair of digits) the two-digit
+    unavoidable sets are known up front: the cells of digits a and b that
+    are tied together through shared units can swap a and b. These small
+    sets (4 and 6 cells mostly) are what most refused removals of a minimal
+    carve run into.
+    """
+    def __init__(self, solver, solution, node_limit=None, digit_swaps=False):
+        self.solver = solver
+        self.size = len(solution)
+        self.solution = solution
+        self.node_limit = node_limit
+        self.solution_masks = [1 << (v - 1) for row in solution for v in row]
+        self.unavoidable = [] # Bitmasks over flat cell indices
+        self.peer_masks, self.cell_unit_masks = solver.bit_tables()
+        self.searches = 0
+        self.shortcuts = 0 # Checks answered by an unavoidable set
+        self.forced = 0    # Checks answered by singles on the clues
+        if digit_swaps:
+            self.unavoidable.extend(sorted(self._digit_swap_sets(), key=int.bit_count))
+
+    def _digit_swap_sets(self):
+        """
+        Unavoidable sets of two digits a, b under classic rules. Every row
+        holds one a and one b, so a set is a group of rows: rows are joined
+        when a column or box has its a in one and its b in the other.
+        """
+        size = self.size
+        box_rows, box_cols = box_dimensions(size)
+        boxes_per_row = size // box_cols
+        col_row = [[0] * size for _ in range(size + 1)] # col_row[d][c]: hàng chứa số d ở cột c
+        box_row = [[0] * size for _ in range(size + 1)] # box_row[d][k]: hàng chứa số d trong khối k
+        row_col = [[0] * size for _ in range(size + 1)] # row_col[d][r]: cột chứa số d ở hàng r
+        for r, row in enumerate(self.solution):
+            for c, d in enumerate(row):
+                col_row[d][c] = r
+                box_row[d][(r // box_rows) * boxes_per_row + c // box_cols] = r
+                row_col[d][r] = c
+        sets = []
+        for a in range(1, size + 1):
+            for b in range(a + 1, size + 1):
+                parent = list(range(size))
+                for links in (zip(col_row[a], col_row[b]), zip(box_row[a], box_row[b])):
+                    for ra, rb in links:
+                        while parent[ra] != ra:
+                            ra = parent[ra]
+                        while parent[rb] != rb:
+                            rb = parent[rb]
+                        if ra != rb:
+                            parent[ra] = rb
+                groups = {}
+                for r in range(size):
+                    root = r
+                    while parent[root] != root:
+                        root = parent[root]
+                    groups[root] = groups.get(root, 0) | 1 << (r * size + row_col[a][r]) | 1 << (r * size + row_col[b][r])
+                sets.extend(groups.values())
+        return sets
+
+    def _clue_mask(self, grid):
+        size = self.size
+        mask = 0
+        for r in range(size):
+            row = grid[r]
+            for c in range(size):
+                if row[c]:
+                    mask |= 1 << (r * size + c)
+        return mask
+
+    def _unforced(self, grid, clues, cells):
+        """The cells of `cells` that are neither a naked nor a hidden single given only the clues of `grid`."""
+        size = self.size
+        peer_masks = self.peer_masks
+        seen = [0] * (size + 1) # seen[d]: cells that see a clue of digit d
+        for r in range(size):
+            row = grid[r]
+            for c in range(size):
+                if row[c]:
+                    seen[row[c]] |= peer_masks[r * size + c]
+        unforced = []
+        for r, c in cells:
+            cell = r * size + c
+            bit = 1 << cell
+            num = self.solution[r][c]
+            if all(seen[d] & bit for d in range(1, size + 1) if d != num):
+                continue # Naked single
+            free = ~clues & ~seen[num] & ~bit
+            if not any(not (unit & free) for unit in self.cell_unit_masks[cell]):
+                unforced.append((r, c))
+        return unforced
+
+    def is_unique_without(self, grid, cells):
+        """
+        True if `grid`, in which the clues at `cells` [(r, c)] were just
+        cleared, still has exactly one solution. A search that runs out of
+        node_limit nodes counts as "not unique", so the clues are kept.
+        """
+        clues = self._clue_mask(grid)
+        for unavoidable in self.unavoidable:
+            if not unavoidable & clues:
+                self.shortcuts += 1
+                return False
+        unforced = self._unforced(grid, clues, cells)
+        if not unforced:
+            self.forced += 1
+            return True
+        size = self.size
+        solver = self.solver
+        work = [row[:] for row in grid]
+        for r, c in cells:
+            if (r, c) not in unforced:
+                work[r][c] = self.solution[r][c] # Ô bị ép thì lời giải nào cũng giữ nguyên
+        cands = solver.masks_from_grid(work)
+        # Lời giải khác phải khác ở ít nhất một ô chưa bị ép: ô thứ i khác, các ô trước nó giữ nguyên
+        for i, (r, c) in enumerate(unforced):
+            cell = r * size + c
+            bit = self.solution_masks[cell]
+            self.searches += 1
+            try:
+                alternative = solver.find_alternative_from(cands, cell, bit, self.node_limit)
+            except SearchLimitExceeded:
                 return False
-        # Check 3x3 subgrid (assuming size 9)
-        if self.size == 9:
-            start_row, start_col = r - r % 3, c - c % 3
-            for i in range(3):
-                for j in range(3):
-                    if grid[i + start_row][j + start_col] == num:
-                        return False
+            if alternative is not None:
+                self.unavoidable.append(sum(1 << cell for cell, m in enumerate(alternative)
+                                            if m != self.solution_masks[cell]))
+                return False
+            if i + 1 < len(unforced):
+                solver.place(cands, cell, bit)
+        return True
+
+    def is_minimal(self, grid):
+        """
+        True if `grid` (a unique puzzle of this solution) loses uniqueness
+        whatever single clue is removed. Clues already pinned down by an
+        unavoidable set cost no search.
+        """
+        size = self.size
+        clues = self._clue_mask(grid)
+        pinned = 0
+        for unavoidable in self.unavoidable:
+            hit = unavoidable & clues
+            if not (hit & (hit - 1)):
+                pinned |= hit
+        work = [row[:] for row in grid]
+        for cell in range(size * size):
+            if clues >> cell & 1 and not pinned >> cell & 1:
+                r, c = divmod(cell, size)
+                work[r][c] = 0
+                unique = self.is_unique_without(work, [(r, c)])
+                work[r][c] = self.solution[r][c]
+                if unique:
+                    return False
+        return True
+
+
+class SudokuGenerator:
+    def __init__(self, size=9, solver="bitmask", rating_bands=None, workers=1, timeout=DEFAULT_GENERATION_TIMEOUT,
+                 use_seed_grids=True, reuse_templates=False, collect_stats=False, bank=None, cache=None, variant=None):
+        if solver not in SOLVER_BACKENDS:
+            raise ValueError(f"Unknown solver backend '{solver}'. Choose from: {', '.join(SOLVER_BACKENDS)}")
+        self.size = size
+        self.box_rows, self.box_cols = box_dimensions(size)
+        self.grid = [[0 for _ in range(size)] for _ in range(size)]
+        self.solution = [[0 for _ in range(size)] for _ in range(size)]
+        self.solver_name = solver
+
+        # Variant rules: a name from VARIANTS, or a SudokuVariant with fixed rules. Jigsaw, killer and
+        # consecutive get their regions/cages/bars per puzzle; self.variant holds those of the last puzzle.
+        self.variant_spec = variant
+        if isinstance(variant, SudokuVariant):
+            self.variant_name, base = variant.name, variant
+        else:
+            self.variant_name = variant or "classic"
+            if self.variant_name not in VARIANTS:
+                raise ValueError(f"Unknown variant '{self.variant_name}'. Choose from: {', '.join(VARIANTS)}")
+            base = {"diagonal": lambda: SudokuVariant(size, diagonals=True, name="diagonal"),
+                    "anti_knight": lambda: SudokuVariant(size, anti_knight=True, name="anti_knight")}.get(self.variant_name)
+            base = base() if base else None
+        self.base_variant = base
+        if self.variant_name != "classic":
+            if solver != "bitmask":
+                raise ValueError(f"Variant '{self.variant_name}' needs the bitmask solver")
+            # Đề ngân hàng/cache là đề cổ điển; phép đối xứng cũng không giữ được luật biến thể
+            bank = cache = None
+            reuse_templates = False
+            use_seed_grids = use_seed_grids and base is None
+        self.variant = base
+        self.solver = BitmaskSolver(size, variant=base) if base is not None else SOLVER_BACKENDS[solver](size)
+        self.rater = None # DifficultyRater, created on first use
+        self.rating_bands = dict(rating_bands or DEFAULT_RATING_BANDS)
+        self.workers = workers # >1: search candidates on a process pool
+        self.timeout = timeout
+        self.last_rating = None
+        self._executor = None
+        self.parallel = None # ParallelSolver for solve()/count_solutions() on large boards, created on first use
+        # Lưới lớn: giới hạn số nút cho mỗi lần kiểm tra tính duy nhất (vượt quá thì giữ lại ô)
+        self.uniqueness_node_limit = None if size <= 9 else UNIQUENESS_NODES_PER_SIZE * size
+        self.uniqueness = None # UniquenessChecker of the solution being carved
+        # Options of the puzzle being generated (see generate_puzzle)
+        self.symmetry = None
+        self.minimal = False
+
+        # Fast path: new solutions are random symmetries of stored seed grids
+        self.use_seed_grids = use_seed_grids
+        self.seed_grids = [] # Lưới đầu tiên là một lần giải ngẫu nhiên, không phải lưới mẫu dịch hàng
+        self._solutions_since_refresh = 0
+        # Optional: reuse an in-band carved puzzle per difficulty under a fresh transform
+        self.reuse_templates = reuse_templates
+        self.templates = {} # difficulty -> (puzzle, solution, rating)
+
+        # Optional PuzzleBank (or path to one): generate_puzzle draws from it when it has the level
+        self.bank = PuzzleBank(bank) if isinstance(bank, str) else bank
+
+        # Optional CanonicalCache: solve() and rate_puzzle() answer symmetric variants of known puzzles from it
+        self.cache = cache
+
+        # Optional instrumentation: SolverStats of the last public call and of all calls so far
+        self.collect_stats = collect_stats
+        self.last_stats = None
+        self.total_stats = SolverStats()
+        self._active_stats = None
+
+    def close(self):
+        """Shuts down the candidate process pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def _use_variant(self, variant):
+        """Switches the solver (and rater) to the rules of the puzzle being made."""
+        if variant is self.variant:
+            return
+        self.variant = variant
+        self.solver = (BitmaskSolver(self.size, variant=variant) if variant is not None
+                       else SOLVER_BACKENDS[self.solver_name](self.size))
+        self.solver.stats = self._active_stats
+        self.rater = None
+        self.uniqueness = None
+
+    # --- Instrumentation ---
+    def _begin_stats(self):
+        """Starts counting into a fresh SolverStats (None if stats are disabled)."""
+        if not self.collect_stats or self._active_stats is not None:
+            return None # Tắt thống kê, hoặc đang nằm trong một lần gọi đã được đo
+        stats = SolverStats()
+        stats.calls = 1
+        self._active_stats = stats
+        self.solver.stats = stats
+        if self.rater is not None:
+            self.rater.solver.stats = stats
+        return stats
+
+    def _end_stats(self, stats):
+        self._active_stats = None
+        self.solver.stats = None
+        if self.rater is not None:
+            self.rater.solver.stats = None
+        self.last_stats = stats
+        self.total_stats.merge(stats)
+
+    def _timed(self, phase, func, *args):
+        """Calls func(*args), adding its wall time to `phase` while stats are collected."""
+        stats = self._active_stats
+        if stats is None:
+            return func(*args)
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats.add_time(phase, time.perf_counter() - start)
+
+    def _measured(self, phase, func, *args):
+        """Runs a public call under a fresh SolverStats (stored in self.last_stats)."""
+        stats = self._begin_stats()
+        if stats is None:
+            return func(*args)
+        try:
+            return self._timed(phase, func, *args)
+        finally:
+            self._end_stats(stats)
+
+    def _solve_sudoku(self, grid):
+        """Fills `grid` in place with a random solution. Returns False if unsolvable."""
+        solved = self.solver.solve(grid, randomize=True)
+        if solved is None:
+            return False
+        for r in range(self.size):
+            grid[r][:] = solved[r]
         return True
 
-    def _solve_sudoku(self, grid):
-        for r in range(self.size):
-            for c in range(self.size):
-                if grid[r][c] == 0:
-                    nums = list(range(1, self.size + 1))
-                    random.shuffle(nums) # Randomize number choice for varied solutions
-                    for num in nums:
-                        if self._is_valid(grid, r, c, num):
-                            grid[r][c] = num
-                            if self._solve_sudoku(grid):
-                                return True
-                            grid[r][c] = 0 # Backtrack
-                    return False
-        return True
-    
+    def solve(self, board):
+        """Returns a solved copy of `board` using the selected backend, or None."""
+        if self.cache is not None:
+            return self.cache.solve(board, self._solve_board)
+        return self._solve_board(board)
+
+    def _solve_board(self, board):
+        return self._measured("solve", self._search_solver().solve, board)
+
+    def count_solutions(self, board, limit=2):
+        """Counts solutions of `board` with the selected backend, up to `limit`."""
+        return self._measured("count", self._search_solver().count_solutions, board, limit)
+
+    def _search_solver(self):
+        """
+        Solver for solve() and count_solutions(): with workers > 1 and the
+        bitmask backend, boards from PARALLEL_MIN_SIZE up are split across a
+        ParallelSolver's processes.
+        """
+        if self.workers <= 1 or self.size < PARALLEL_MIN_SIZE or self.solver_name != "bitmask":
+            return self.solver
+        if self.parallel is None or self.parallel.variant is not self.variant:
+            if self.parallel is not None:
+                self.parallel.close()
+            self.parallel = ParallelSolver(self.size, self.workers, self.variant)
+        self.parallel.stats = self._active_stats
+        return self.parallel
+
+    def rate_puzzle(self, board):
+        """Rates `board` by human techniques. See DifficultyRater.rate."""
+        if self.cache is not None:
+            return self.cache.rate(board, self._rate_board)
+        return self._rate_board(board)
+
+    def _rate_board(self, board, stalls=False, deadline=None, solution=None):
+        # Generation rates many one-off candidates: it calls this directly, past the cache
+        if self.rater is None:
+            self.rater = DifficultyRater(self.size, self.variant)
+            self.rater.solver.stats = self._active_stats
+        return self._timed("rate", self.rater.rate, board, stalls, deadline, solution)
+
     def check_board_state(self, board, solution_board):
         """
         Checks if the board is complete AND correct.
@@ -68,10 +2358,221 @@ class SudokuGenerator:
                     return False
         return True
 
-    def generate_puzzle(self, difficulty="medium"):
-        self.grid = [[0 for _ in range(self.size)] for _ in range(self.size)] 
-        self._solve_sudoku(self.grid)
-        self.solution = [row[:] for row in self.grid] 
+    def generate_puzzle(self, difficulty="medium", timeout=None, workers=None, symmetry=None, minimal=False):
+        """
+        Generates a uniquely solvable puzzle whose DifficultyRater score lies in
+        the band configured for `difficulty`. Candidates are searched until
+        `timeout` seconds pass; then the closest one found so far is returned.
+        With workers > 1 the candidates are searched on a process pool.
+        With a puzzle bank configured, a random banked puzzle of that level is
+        returned instead (under a random symmetry), in O(1).
+        With collect_stats enabled, the call's SolverStats end up in self.last_stats.
+        With a variant, the puzzle's rules (regions, cages, bars) are in self.variant.
+        `symmetry` ("rotational" or "mirror") removes clues in symmetric
+        pairs, so the clue pattern keeps that symmetry. `minimal` makes every
+        clue necessary: removing any one (any symmetric pair, with symmetry)
+        would give a second solution. Such puzzles skip the bank and the
+        templates, and are never adjusted by restoring clues. Without a
+        `timeout` they get MINIMAL_GENERATION_TIMEOUT; a carve the deadline
+        cuts short is unique but not minimal, and ranks behind any finished one.
+        Without a `timeout`, no fresh candidate is started after
+        CANDIDATE_BUDGET seconds: the closest one so far is returned, which
+        may lie outside the band. Background generation (PuzzlePool workers,
+        iter_puzzles) passes the full timeout to stay in band.
+        Returns (puzzle, solution).
+        """
+        return self._measured("total", self._generate_puzzle, difficulty, timeout, workers, symmetry, minimal)
+
+    def _generate_puzzle(self, difficulty, timeout, workers, symmetry=None, minimal=False):
+        difficulty = difficulty.lower()
+        if difficulty not in self.rating_bands:
+            difficulty = "medium" # Mặc định là medium nếu không tìm thấy độ khó
+        symmetry_orbits(self.size, symmetry) # Kiểm tra tên đối xứng trước khi tạo
+        self.symmetry, self.minimal = symmetry, minimal
+        plain = symmetry is None and not minimal # Đề trong ngân hàng/mẫu không giữ được đối xứng hay tính tối thiểu
+        if plain and self.bank is not None and self.bank.has(difficulty, self.size):
+            return self._timed("bank", self._draw_from_bank, difficulty)
+        if plain and self.reuse_templates and difficulty in self.templates:
+            puzzle, solution, rating = self.templates[difficulty]
+            transform = random_transform(self.size)
+            self.grid = apply_transform(puzzle, transform)
+            self.solution = apply_transform(solution, transform)
+            self.last_rating = rating
+            return self.grid, self.solution
+        budgeted = timeout is None
+        if timeout is None:
+            timeout = min(self.timeout, MINIMAL_GENERATION_TIMEOUT) if minimal else self.timeout
+        workers = self.workers if workers is None else workers
+        start = time.monotonic()
+        deadline = start + timeout
+        # Hết ngân sách: không bắt đầu ứng viên mới, lấy ứng viên gần dải nhất (ứng viên đang dở vẫn tới deadline)
+        budget_end = start + min(timeout, CANDIDATE_BUDGET) if budgeted else deadline
+
+        if workers > 1:
+            best = self._search_rated_parallel(difficulty, deadline, workers)
+        else:
+            best = None
+            for _ in range(MAX_BAND_CANDIDATES):
+                candidate = self._search_rated_candidate(difficulty, deadline)
+                if best is None or candidate[3] < best[3]:
+                    best = candidate
+                if best[3] == 0 or time.monotonic() >= budget_end:
+                    break
+
+        self.grid, self.solution, self.last_rating = best[0], best[1], best[2]
+        self._use_variant(best[4]) # Luật (vùng/lồng/vạch) của đề được chọn
+        if plain and self.reuse_templates and best[3] == 0:
+            self.templates[difficulty] = ([row[:] for row in self.grid], [row[:] for row in self.solution], self.last_rating)
+        return self.grid, self.solution
+
+    def _draw_from_bank(self, difficulty):
+        puzzle, solution, score, _ = self.bank.random(difficulty)
+        transform = random_transform(self.size) # Cùng một bản ghi nhưng mỗi lần một biến thể khác
+        self.grid = apply_transform(puzzle, transform)
+        self.solution = apply_transform(solution, transform)
+        self.last_rating = {'score': score, 'hardest': None, 'counts': {}, 'solved': True}
+        return self.grid, self.solution
+
+    def add_seed_grid(self, grid):
+        """Adds a solved grid to the seeds used by new_solution_grid()."""
+        self.seed_grids.append([row[:] for row in grid])
+        if len(self.seed_grids) > MAX_SEED_GRIDS:
+            self.seed_grids.pop(0) # Bỏ lưới cũ nhất
+
+    def new_solution_grid(self):
+        """
+        Returns a fresh random solved grid. With seed grids enabled this is a
+        random transform of a stored seed; the first call and then every
+        SEED_REFRESH_INTERVAL calls a real randomized solve adds a new seed
+        so grids stay varied.
+        """
+        if self.use_seed_grids and self.seed_grids and self._solutions_since_refresh < SEED_REFRESH_INTERVAL:
+            self._solutions_since_refresh += 1
+            return apply_transform(random.choice(self.seed_grids), random_transform(self.size))
+        grid = [[0 for _ in range(self.size)] for _ in range(self.size)]
+        if not self._solve_sudoku(grid):
+            raise ValueError(f"No {self.size}x{self.size} grid satisfies the '{self.variant_name}' rules")
+        if self.use_seed_grids:
+            self.add_seed_grid(grid)
+            self._solutions_since_refresh = 0
+        return grid
+
+    def _band_distance(self, difficulty, rating):
+        low, high = self.rating_bands[difficulty]
+        score = rating['score']
+        if score < low:
+            return low - score
+        if score > high:
+            return score - high
+        return 0
+
+    def in_band(self, difficulty):
+        """Whether the last generated puzzle's rating lies in the band of `difficulty`."""
+        difficulty = difficulty.lower()
+        if difficulty not in self.rating_bands:
+            difficulty = "medium"
+        return self.last_rating is not None and self._band_distance(difficulty, self.last_rating) == 0
+
+    def _search_rated_candidate(self, difficulty, deadline):
+        """
+        Carves one puzzle, then removes clues while it rates too easy. While
+        it rates too hard, clues the rater stalled on (cells still open when
+        it first needed a technique above the band) are put back one at a
+        time; one that makes the puzzle too easy is taken out again and not
+        tried twice. Stops when it lands in the band, runs out of stall
+        cells, steps or time, so a hopeless candidate gives way to the next
+        one. A minimal carve is taken as it is. Returns (puzzle, solution, rating, distance,
+        variant), variant being the puzzle's SudokuVariant (None = classic).
+        Carving and rating stop at `deadline` too, so a large board returns a
+        unique but easier, partly rated candidate instead of running over.
+        """
+        carve_deadline = time.monotonic()
+        carve_deadline += max(0.0, deadline - carve_deadline) * CARVE_TIME_SHARE
+        carved = self._carve_new_puzzle(difficulty, carve_deadline)
+        rating = self._rate_board(self.grid, True, deadline, self.solution)
+        distance = self._band_distance(difficulty, rating)
+        if self.minimal and not carved:
+            distance += 10.0 # Chưa tối thiểu: xếp sau mọi đề đã xóa xong (khoảng cách tới dải điểm luôn dưới 10)
+        best = ([row[:] for row in self.grid], self.solution, rating, distance, self.variant)
+        low, _ = self.rating_bands[difficulty]
+        tried = set() # Ô kẹt đã trả lại mà làm đề quá dễ
+
+        for _ in range(0 if self.minimal else MAX_BAND_ADJUSTMENTS):
+            if distance == 0 or time.monotonic() >= deadline:
+                break
+            if rating['score'] < low:
+                if not self._timed("adjust", self._remove_one_clue, deadline):
+                    break # Đã tối thiểu, không thể khó hơn
+                rating = self._rate_board(self.grid, True, deadline, self.solution)
+            else:
+                orbits = [orbit for orbit in self._stall_orbits(difficulty, rating) if orbit not in tried]
+                if not orbits:
+                    break # Không còn ô kẹt nào để thử: nhường cho ứng viên kế tiếp
+                orbit = random.choice(orbits)
+                for r, c in orbit:
+                    self.grid[r][c] = self.solution[r][c]
+                trial = self._rate_board(self.grid, True, deadline, self.solution)
+                if trial.get('timed_out'):
+                    break # Điểm chưa đủ tin cậy để quyết định giữ hay bỏ ô vừa trả lại
+                if trial['score'] < low:
+                    for r, c in orbit:
+                        self.grid[r][c] = 0 # Quá tay: bỏ lại ô đó, thử ô kẹt khác
+                    tried.add(orbit)
+                    continue
+                rating = trial
+            distance = self._band_distance(difficulty, rating)
+            if distance < best[3]:
+                best = ([row[:] for row in self.grid], self.solution, rating, distance, self.variant)
+        return best
+
+    def _search_rated_parallel(self, difficulty, deadline, workers):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        best = None
+        pending = set()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                while remaining > 0 and len(pending) < workers:
+                    pending.add(self._executor.submit(
+                        _rated_candidate_job, self.size, self.solver_name, self.rating_bands,
+                        difficulty, remaining, random.getrandbits(64), self._active_stats is not None,
+                        self.variant_spec, self.symmetry, self.minimal))
+                if not pending:
+                    break
+                done, pending = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        candidate, worker_stats = future.result()
+                    except Exception as e:
+                        print(f"SudokuGenerator ERROR: worker failed: {e}")
+                        continue
+                    if worker_stats is not None:
+                        worker_stats.calls = 0 # Vẫn là một lần gọi generate_puzzle
+                        self._active_stats.merge(worker_stats)
+                    if best is None or candidate[3] < best[3]:
+                        best = candidate
+                if (best is not None and best[3] == 0) or time.monotonic() >= deadline:
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+        if best is None: # Pool produced nothing in time: one candidate in-process
+            best = self._search_rated_candidate(difficulty, deadline)
+        return best
+
+    def _carve_new_puzzle(self, difficulty, deadline=None):
+        """
+        Builds a random solution in self.solution and carves self.grid from it.
+        Removal attempts stop at `deadline`; the clues kept so far still give
+        a unique puzzle (but a minimal carve cut short is not minimal).
+        Returns False if the deadline cut the carve short.
+        """
+        if self.variant_name in ("jigsaw", "killer", "consecutive"):
+            self.grid = self._timed("solution", self._new_variant_solution)
+        else:
+            self.grid = self._timed("solution", self.new_solution_grid)
+        self.solution = [row[:] for row in self.grid]
 
         # Điều chỉnh số ô cần xóa dựa trên độ khó
         num_cells_to_remove_map = {
@@ -85,25 +2586,172 @@ class SudokuGenerator:
         num_to_remove = num_cells_to_remove_map.get(difficulty.lower(), self.size * self.size * 40 // 81)
 
         cells_removed_count = 0
-        all_cells = []
-        for r_idx in range(self.size):
-            for c_idx in range(self.size):
-                all_cells.append((r_idx, c_idx))
-        random.shuffle(all_cells)
-
-        for r_coord, c_coord in all_cells:
-            if cells_removed_count >= num_to_remove:
+        failed_streak = 0
+        orbits = symmetry_orbits(self.size, self.symmetry) # Ô đơn, hoặc cặp ô đối xứng xóa cùng lúc
+        random.shuffle(orbits)
+        if difficulty.lower() == "expert":
+            # Xóa hết ô của một số rồi mới tới số kế tiếp: ra mức expert nhiều hơn ~1.5 lần (cả đề thường lẫn tối thiểu)
+            rank = random.sample(range(self.size), self.size)
+            orbits.sort(key=lambda orbit: min(rank[self.solution[r][c] - 1] for r, c in orbit))
+        # Tối thiểu: kiểm tra chính xác (không giới hạn số nút), nếu không một ô giữ lại có thể xóa được
+        node_limit = None if self.minimal else self.uniqueness_node_limit
+        # Tập hoán đổi hai chữ số: chỉ đáng dựng khi xóa tới (gần) tối thiểu, và chỉ đúng với luật cổ điển
+        digit_swaps = (self.minimal or difficulty.lower() in ("hard", "expert")) and self.variant is None
+        self.uniqueness = (UniquenessChecker(self.solver, self.solution, node_limit, digit_swaps=digit_swaps)
+                           if hasattr(self.solver, 'find_alternative') else None)
+
+        carve_start = time.perf_counter()
+        finished = True
+        for orbit in orbits:
+            # Tối thiểu: thử xóa mọi ô. Ô đã bị từ chối không bao giờ xóa được nữa (bớt ô chỉ thêm lời giải),
+            # nên sau một lượt đề đã tối thiểu
+            if not self.minimal and cells_removed_count >= num_to_remove:
                 break
-            if self.grid[r_coord][c_coord] != 0:
-                # temp_val = self.grid[r_coord][c_coord] # Giữ lại để kiểm tra tính duy nhất nếu cần
-                self.grid[r_coord][c_coord] = 0
-                # TODO: Thêm logic kiểm tra tính duy nhất của lời giải nếu muốn tạo puzzle chuẩn
-                cells_removed_count += 1
-        
-        return self.grid, self.solution
+            if deadline is not None and time.monotonic() >= deadline:
+                finished = False
+                break
+            # Chỉ giữ lại các ô xóa mà lời giải vẫn duy nhất
+            if self._remove_orbit(orbit):
+                cells_removed_count += len(orbit)
+                failed_streak = 0
+            else:
+                failed_streak += 1
+                # Lưới lớn: gần tối thiểu thì mỗi lần thử đều tốn kém, dừng sớm
+                if self.size > 9 and not self.minimal and failed_streak >= self.size:
+                    break
+        if self._active_stats is not None:
+            self._active_stats.add_time("carve", time.perf_counter() - carve_start)
+        return finished
+
+    def _new_variant_solution(self):
+        """
+        Per-puzzle rules and a solution that fits them: random jigsaw regions
+        (retried until one has a solution), or killer cages / consecutive
+        bars read off a random classic solution.
+        """
+        size = self.size
+        if self.variant_name == "jigsaw":
+            for _ in range(MAX_JIGSAW_LAYOUTS):
+                self._use_variant(SudokuVariant(size, regions=random_regions(size), name="jigsaw"))
+                try:
+                    solved = self.solver.solve([[0] * size for _ in range(size)], True, [JIGSAW_LAYOUT_NODES])
+                except SearchLimitExceeded:
+                    continue # Bố cục khó tìm lời giải: thử bố cục khác
+                if solved is not None:
+                    return solved
+            raise ValueError(f"No solvable {size}x{size} jigsaw layout found in {MAX_JIGSAW_LAYOUTS} tries")
+        self._use_variant(None)
+        grid = self.new_solution_grid()
+        if self.variant_name == "killer":
+            self._use_variant(SudokuVariant(size, cages=random_cages(grid), name="killer"))
+        else:
+            self._use_variant(SudokuVariant(size, consecutive=consecutive_pairs(grid), name="consecutive"))
+        return grid
+
+    def _remove_orbit(self, orbit):
+        """Clears the clues of `orbit` if the puzzle stays unique without them; else leaves them."""
+        for r, c in orbit:
+            self.grid[r][c] = 0
+        if len(orbit) == 1:
+            (r, c), = orbit
+            unique = self._is_unique_without(r, c, self.solution[r][c])
+        elif self.uniqueness is not None:
+            unique = self.uniqueness.is_unique_without(self.grid, orbit)
+        else:
+            unique = self.solver.count_solutions(self.grid, 2) == 1
+        if not unique:
+            for r, c in orbit:
+                self.grid[r][c] = self.solution[r][c]
+        return unique
+
+    def _remove_one_clue(self, deadline=None):
+        """
+        Clears one random clue (or symmetric pair) that keeps the solution
+        unique. False if none can go, or none was found before `deadline`.
+        """
+        orbits = [orbit for orbit in symmetry_orbits(self.size, self.symmetry) if self.grid[orbit[0][0]][orbit[0][1]]]
+        random.shuffle(orbits)
+        if self.size > 9:
+            orbits = orbits[:self.size] # Lưới lớn: chỉ thử một số ô, mỗi lần kiểm tra khá tốn kém
+        for orbit in orbits:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if self._remove_orbit(orbit):
+                return True
+        return False
+
+    def _stall_orbits(self, difficulty, rating):
+        """
+        Removed orbits holding a cell that was still open when the rater first
+        needed a technique above the band of `difficulty`; giving one of
+        them away can take out the step that made the puzzle too hard.
+        """
+        _, high = self.rating_bands[difficulty]
+        open_at = rating.get('open_at', {})
+        stalled = [cells for name, weight in DifficultyRater.TECHNIQUES
+                   if weight > high and name in open_at for cells in (open_at[name],)]
+        if not stalled:
+            return []
+        cells = set(max(stalled, key=len)) # Lần kẹt sớm nhất còn nhiều ô trống nhất
+        return [orbit for orbit in symmetry_orbits(self.size, self.symmetry)
+                if not self.grid[orbit[0][0]][orbit[0][1]] and any(r * self.size + c in cells for r, c in orbit)]
+
+    def is_minimal(self, puzzle=None):
+        """
+        True if no single clue of `puzzle` (default: the last generated one)
+        can be removed without losing uniqueness. Reuses the unavoidable
+        sets found while carving it, so checking a fresh minimal puzzle
+        needs (almost) no search.
+        """
+        puzzle = self.grid if puzzle is None else puzzle
+        solution = self.solution if puzzle is self.grid else self.solver.solve(puzzle)
+        checker = self.uniqueness
+        if checker is None or checker.solution != solution:
+            checker = UniquenessChecker(self.solver, solution)
+        return checker.is_minimal(puzzle)
+
+    def _is_unique_without(self, r, c, num):
+        """
+        Checks that self.grid, whose cell (r, c) was just cleared from `num`,
+        still has exactly one solution.
+        """
+        # Nhanh: nếu các ô cùng hàng/cột/khối đã loại hết các số khác thì chắc chắn duy nhất
+        grid, size = self.grid, self.size
+        if self.variant is not None:
+            seen = {grid[p // size][p % size] for p in self.variant.peers[r * size + c]}
+        else:
+            seen = set(grid[r])
+            seen.update(grid[x][c] for x in range(size))
+            br, bc = r - r % self.box_rows, c - c % self.box_cols
+            for i in range(br, br + self.box_rows):
+                seen.update(grid[i][bc:bc + self.box_cols])
+        seen.discard(0)
+        if len(seen) == size - 1:
+            return True
+
+        if self.uniqueness is not None:
+            return self.uniqueness.is_unique_without(self.grid, [(r, c)])
+        has_alternative = getattr(self.solver, 'has_alternative', None)
+        if has_alternative:
+            return not has_alternative(self.grid, r, c, num, self.uniqueness_node_limit)
+        return self.solver.count_solutions(self.grid, 2) == 1
 
-    def check_move(self, board, r, c, num, solution_board):
-        """Kiểm tra xem nước đi có đúng với bảng giải không."""
+    def check_move(self, board, r, c, num, solution_board=None):
+        """
+        Kiểm tra xem nước đi có đúng với bảng giải không.
+        Không có bảng giải (đề tự nhập, nhiều lời giải...): đúng = không trùng số trong hàng/cột/khối.
+        """
+        if 0 < num <= self.size and solution_board is None and self.variant is not None:
+            return self.variant.allows(board, r, c, num)
+        if 0 < num <= self.size and solution_board is None:
+            start_row, start_col = r - r % self.box_rows, c - c % self.box_cols
+            for i in range(self.size):
+                if (i != c and board[r][i] == num) or (i != r and board[i][c] == num):
+                    return False
+                rr, cc = start_row + i // self.box_cols, start_col + i % self.box_cols
+                if (rr, cc) != (r, c) and board[rr][cc] == num:
+                    return False
+            return True
         if 0 < num <= self.size:
              return solution_board[r][c] == num
         if num == 0: # Xóa ô không được coi là "đúng" so với số trong bảng giải
@@ -152,6 +2800,1788 @@ class SudokuGenerator:
         # Nếu không có ô trống và không có ô sai (tức là bảng đã hoàn thành đúng)
         return None
 
+SOLVABLE_NODE_LIMIT = 2000 # Search nodes BoardTracker.check_move may spend on "is the board still solvable?"
+_shared_solvers = {}       # size -> BitmaskSolver used by BoardTracker.check_move
+
+
+class BoardTracker:
+    """
+    Running totals for a board that is being filled in, so completion,
+    correctness and conflict checks cost O(1) per move instead of a scan.
+
+    The tracker works on `board` in place: every change has to go through
+    set()/clear() for the totals to stay in sync. `solution` is optional;
+    without it correctness means "complete and no conflicts", and
+    check_move() validates moves by the rules alone (plus, optionally, a
+    bounded "still solvable?" search). An attached HintEngine is kept in
+    step with every change as well. With a SudokuVariant its units are
+    counted and its extra rules (knight moves, cages, bars) are checked too.
+    """
+    def __init__(self, board, solution=None, hint_engine=None, variant=None):
+        size = len(board)
+        self.board = board
+        # SudokuBoard: đọc/ghi thẳng bytearray phẳng, không tạo memoryview mỗi lần
+        self.values = board.values if isinstance(board, SudokuBoard) else None
+        self.solution = solution
+        self.hint_engine = hint_engine
+        self.variant = variant
+        self.cell_units = variant.cell_units if variant is not None else None
+        self.solver = None # BitmaskSolver theo luật biến thể, tạo khi check_move cần
+        self.size = size
+        self.box_rows, self.box_cols = box_dimensions(size)
+        self.boxes_per_row = size // self.box_cols
+        self.filled = 0
+        self.mismatches = 0 # Filled cells that differ from the solution
+        self.conflicts = 0  # Extra copies of a digit within a row/column/box
+        self.digit_counts = [0] * (size + 1)
+        # unit_counts[u][d]: copies of digit d in unit u (rows, then columns, then boxes, then variant units)
+        self.unit_counts = [[0] * (size + 1) for _ in range(len(variant.units) if variant is not None else 3 * size)]
+        for r in range(size):
+            row = board[r] if self.values is None else self.values[r * size:(r + 1) * size]
+            for c in range(size):
+                if row[c]:
+                    self._add(r, c, row[c])
+
+    def _units(self, r, c):
+        if self.cell_units is not None:
+            return self.cell_units[r * self.size + c]
+        size = self.size
+        return (r, size + c, 2 * size + (r // self.box_rows) * self.boxes_per_row + c // self.box_cols)
+
+    def _add(self, r, c, num):
+        self.filled += 1
+        self.digit_counts[num] += 1
+        if self.solution is not None and self.solution[r][c] != num:
+            self.mismatches += 1
+        for u in self._units(r, c):
+            counts = self.unit_counts[u]
+            if counts[num]:
+                self.conflicts += 1
+            counts[num] += 1
+
+    def _remove(self, r, c, num):
+        self.filled -= 1
+        self.digit_counts[num] -= 1
+        if self.solution is not None and self.solution[r][c] != num:
+            self.mismatches -= 1
+        for u in self._units(r, c):
+            counts = self.unit_counts[u]
+            counts[num] -= 1
+            if counts[num]:
+                self.conflicts -= 1
+
+    def set(self, r, c, num):
+        """Writes `num` (0 = empty) into (r, c) and updates the totals. Returns the old value."""
+        values = self.values
+        old = self.board[r][c] if values is None else values[r * self.size + c]
+        if old != num:
+            if old:
+                self._remove(r, c, old)
+            if values is None:
+                self.board[r][c] = num
+            else:
+                values[r * self.size + c] = num
+            if num:
+                self._add(r, c, num)
+            if self.hint_engine is not None:
+                self.hint_engine.set(r, c, num)
+        return old
+
+    def clear(self, r, c):
+        return self.set(r, c, 0)
+
+    def is_complete(self):
+        return self.filled == self.size * self.size
+
+    def is_correct(self):
+        """True when the board is complete and matches the solution (or has no conflicts)."""
+        if not self.is_complete():
+            return False
+        if self.solution is not None:
+            return self.mismatches == 0
+        return self.conflicts == 0 and (self.variant is None or self.variant.check_grid(self.board))
+
+    def check_board_state(self):
+        """Same (is_complete, is_correct_if_complete) tuple as SudokuGenerator.check_board_state."""
+        return self.is_complete(), self.is_correct()
+
+    def remaining(self, num):
+        """How many more times `num` has to be placed."""
+        return self.size - self.digit_counts[num]
+
+    def has_conflict(self, r, c):
+        """True if the digit at (r, c) also appears elsewhere in its row, column or box."""
+        num = self.board[r][c] if self.values is None else self.values[r * self.size + c]
+        if not num:
+            return False
+        unit_counts = self.unit_counts
+        if any(unit_counts[u][num] > 1 for u in self._units(r, c)):
+            return True
+        return self.variant is not None and not self.variant.allows(self.board, r, c, num, extra_only=True)
+
+    def would_conflict(self, r, c, num):
+        """True if writing `num` into (r, c) would repeat a digit of its row, column or box."""
+        if not num:
+            return False
+        old = self.board[r][c] if self.values is None else self.values[r * self.size + c]
+        own = 1 if old == num else 0
+        unit_counts = self.unit_counts
+        if any(unit_counts[u][num] > own for u in self._units(r, c)):
+            return True
+        return self.variant is not None and not self.variant.allows(self.board, r, c, num, extra_only=True)
+
+    def cells_with(self, r, c, nums):
+        """
+        (row, col) of the cells in the row, column and box of (r, c) holding
+        one of `nums`: the only cells whose conflict state a move there can change.
+        With a variant: all its peers holding one of `nums`, plus every filled
+        cell sharing a bar or cage with it.
+        """
+        board, values = self.board, self.values
+        size = self.size
+        value = (lambda p: board[p // size][p % size]) if values is None else values.__getitem__ # Theo chỉ số phẳng
+        nums = {num for num in nums if num} # 0 (ô trống) không bao giờ xung đột
+        if self.variant is not None:
+            # Ô chung vạch/lồng đổi trạng thái theo bất kỳ số nào (hiệu, tổng), không chỉ khi trùng số
+            variant = self.variant
+            cell = r * size + c
+            linked = set(variant.partners[cell])
+            if variant.cage_of[cell] >= 0:
+                linked.update(variant.cages[variant.cage_of[cell]][1])
+            linked.discard(cell)
+            return {(p // size, p % size) for p in linked.union(variant.peers[cell])
+                    if value(p) in nums or (p in linked and value(p))}
+        top, left = r - r % self.box_rows, c - c % self.box_cols
+        cells = set()
+        for i in range(size):
+            if value(r * size + i) in nums:
+                cells.add((r, i))
+            if value(i * size + c) in nums:
+                cells.add((i, c))
+            rr, cc = top + i // self.box_cols, left + i % self.box_cols
+            if value(rr * size + cc) in nums:
+                cells.add((rr, cc))
+        return cells
+
+    def check_move(self, r, c, num, solvable=False, node_limit=SOLVABLE_NODE_LIMIT):
+        """
+        Validates a move without the solution. Returns (ok, reason): reason is
+        "conflict" when `num` repeats a digit of the row/column/box (or breaks a variant rule), or
+        "unsolvable" when `solvable` is set and the board would have no
+        solution. A search that runs out of `node_limit` nodes lets the move through.
+        """
+        if self.would_conflict(r, c, num):
+            return False, "conflict"
+        if solvable and num:
+            grid = [list(row) for row in self.board]
+            grid[r][c] = num
+            if self.variant is not None:
+                if self.solver is None:
+                    self.solver = BitmaskSolver(self.size, variant=self.variant)
+                solver = self.solver
+            else:
+                solver = _shared_solvers.get(self.size)
+                if solver is None:
+                    solver = _shared_solvers[self.size] = BitmaskSolver(self.size)
+            if solver.is_solvable(grid, node_limit) is False:
+                return False, "unsolvable"
+        return True, None
+
+
+_hint_raters = {} # size -> DifficultyRater whose tables and techniques the HintEngines share
+MAX_HINT_STEPS = 50 # Elimination steps tried on a stuck board before giving up on a logical hint
+
+
+class HintEngine:
+    """
+    Next logical step for a board being solved, for hints and a "coach" mode.
+
+    Keeps the candidates of every empty cell (digits not yet used in its row,
+    column or box) while digits are placed and erased: a change recomputes
+    only the cell and its peers. Cells with one candidate left (naked
+    singles) and (unit, digit) pairs with one place left (hidden singles) are
+    tracked on the way, so a single is found without a scan. Only when there
+    is none are the rater's elimination techniques run on a scratch copy.
+    The answer is cached until the board changes. With a SudokuVariant its
+    extra units and peers count as well; cage sums and bars are not used.
+
+    hint() returns a dict {'cell': (r, c), 'digit', 'technique', 'unit',
+    'eliminations'}: 'technique' is the hardest technique needed, 'unit' the
+    (kind, index) of a hidden single and 'eliminations' the (r, c, digit,
+    technique) removals that lead to the single. A board with an empty cell
+    that has no candidate left gets {'cell', 'digit': None, 'technique':
+    'contradiction'}; None means no logical step was found.
+    """
+    UNIT_KINDS = ("row", "column", "box", "diagonal")
+
+    def __init__(self, board, variant=None):
+        size = len(board)
+        self.size = size
+        if variant is not None:
+            rater = DifficultyRater(size, variant) # Luật biến thể: bảng đơn vị/ô liên quan riêng cho mỗi đề
+        else:
+            rater = _hint_raters.get(size)
+            if rater is None:
+                rater = _hint_raters[size] = DifficultyRater(size)
+        self.rater = rater
+        solver = rater.solver
+        self.units = solver.units
+        self.cell_units = solver.cell_units
+        self.peers = solver.peers
+        self.extra_peers = variant.extra_peers if variant is not None else None
+        self.full_mask = solver.full_mask
+
+        cells = size * size
+        self.values = [board[r][c] for r in range(size) for c in range(size)]
+        self.cands = [0] * cells
+        # unit_counts[u][d]: copies of digit d in unit u; unit_used[u]: mask of the digits present
+        self.unit_counts = [[0] * (size + 1) for _ in self.units]
+        self.unit_used = [0] * len(self.units)
+        # places[u][d]: cells of unit u that still have digit d+1 as a candidate
+        self.places = [[0] * size for _ in self.units]
+        self.naked = set()  # Empty cells with exactly one candidate
+        self.hidden = set() # (unit, digit index) with exactly one place left
+        self.dead = set()   # Empty cells without any candidate (the board has a mistake)
+        self.changed = set() # Cells whose value or candidates changed since take_changed()
+        self._hint = None
+        self._hint_ready = False
+        for cell, num in enumerate(self.values):
+            if num:
+                self._count(cell, num, 1)
+        for cell in range(cells):
+            self._refresh(cell)
+        self.changed.clear()
+
+    def _count(self, cell, num, step):
+        bit = 1 << (num - 1)
+        for u in self.cell_units[cell]:
+            counts = self.unit_counts[u]
+            counts[num] += step
+            if counts[num]:
+                self.unit_used[u] |= bit
+            else:
+                self.unit_used[u] &= ~bit
+
+    def _refresh(self, cell):
+        """Recomputes the candidates of one cell and the singles that depend on them."""
+        if self.values[cell]:
+            new = 0
+            self.dead.discard(cell)
+        else:
+            used = self.unit_used
+            if self.extra_peers is None:
+                u_row, u_col, u_box = self.cell_units[cell]
+                taken = used[u_row] | used[u_col] | used[u_box]
+            else:
+                taken = 0
+                for u in self.cell_units[cell]:
+                    taken |= used[u]
+                for p in self.extra_peers[cell]: # Mã/lồng: ô liên quan không chung đơn vị
+                    if self.values[p]:
+                        taken |= 1 << (self.values[p] - 1)
+            new = self.full_mask & ~taken
+            if new:
+                self.dead.discard(cell)
+            else:
+                self.dead.add(cell)
+        old = self.cands[cell]
+        if old == new:
+            return
+        self.cands[cell] = new
+        self.changed.add(cell)
+        if new and not (new & (new - 1)):
+            self.naked.add(cell)
+        else:
+            self.naked.discard(cell)
+        changed = old ^ new
+        units = self.cell_units[cell]
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            d = bit.bit_length() - 1
+            step = 1 if new & bit else -1
+            for u in units:
+                places = self.places[u]
+                places[d] += step
+                if places[d] == 1:
+                    self.hidden.add((u, d))
+                else:
+                    self.hidden.discard((u, d))
+
+    def set(self, r, c, num):
+        """Mirrors a change of the board: `num` (0 = empty) now stands in (r, c)."""
+        cell = r * self.size + c
+        old = self.values[cell]
+        if old == num:
+            return
+        if old:
+            self._count(cell, old, -1)
+        self.values[cell] = num
+        if num:
+            self._count(cell, num, 1)
+        self.changed.add(cell)
+        self._refresh(cell)
+        for p in self.peers[cell]:
+            self._refresh(p)
+        self._hint_ready = False
+
+    def candidates(self, r, c):
+        """Candidate mask of (r, c) (bit d-1 <=> digit d); 0 for filled cells."""
+        return self.cands[r * self.size + c]
+
+    def candidate_digits(self, r, c):
+        """Candidates of (r, c) as a set of digits, the form the UI draws pencil marks from."""
+        m = self.cands[r * self.size + c]
+        digits = set()
+        while m:
+            bit = m & -m
+            digits.add(bit.bit_length())
+            m ^= bit
+        return digits
+
+    def take_changed(self):
+        """Returns the (r, c) cells changed since the last call (at most a cell and its peers per move)."""
+        size = self.size
+        cells = [divmod(cell, size) for cell in self.changed]
+        self.changed.clear()
+        return cells
+
+    def hint(self):
+        """The next logical step (see the class docstring), cached until the board changes."""
+        if not self._hint_ready:
+            self._hint = self._find_hint()
+            self._hint_ready = True
+        return self._hint
+
+    def _cell(self, cell):
+        return divmod(cell, self.size)
+
+    def _single(self, cands, naked, hidden):
+        """(cell, digit, technique, unit) of a naked or hidden single, or None."""
+        if naked:
+            cell = min(naked)
+            return cell, cands[cell].bit_length(), "naked_single", None
+        if hidden:
+            u, d = min(hidden)
+            bit = 1 << d
+            for cell in self.units[u]:
+                if cands[cell] & bit:
+                    size = self.size
+                    return cell, d + 1, "hidden_single", (self.UNIT_KINDS[u // size], u % size)
+        return None
+
+    def _find_hint(self):
+        if self.dead:
+            return {'cell': self._cell(min(self.dead)), 'digit': None, 'technique': "contradiction",
+                    'unit': None, 'eliminations': []}
+        if 0 not in self.values:
+            return None
+        single = self._single(self.cands, self.naked, self.hidden)
+        if single is not None:
+            cell, digit, technique, unit = single
+            return {'cell': self._cell(cell), 'digit': digit, 'technique': technique, 'unit': unit,
+                    'eliminations': []}
+
+        # Không còn ô đơn: dùng các kỹ thuật loại trừ của bộ chấm độ khó trên một bản sao
+        rater = self.rater
+        values = self.values[:]
+        cands = self.cands[:]
+        eliminations = []
+        hardest, hardest_weight = None, 0.0
+        steps = rater.elimination_steps() # Ô đơn đã xét ở trên
+        for _ in range(MAX_HINT_STEPS):
+            for name, step in steps:
+                before = cands[:]
+                if step(values, cands):
+                    break
+            else:
+                return None # Không kỹ thuật nào tiến triển được
+            for cell, old in enumerate(before):
+                removed = old & ~cands[cell]
+                while removed:
+                    bit = removed & -removed
+                    removed ^= bit
+                    eliminations.append(self._cell(cell) + (bit.bit_length(), name))
+            if rater.weights[name] > hardest_weight:
+                hardest, hardest_weight = name, rater.weights[name]
+
+            naked = [cell for cell, m in enumerate(cands) if m and not (m & (m - 1))]
+            hidden = []
+            if not naked:
+                for u, unit in enumerate(self.units):
+                    once = twice = 0
+                    for cell in unit:
+                        twice |= once & cands[cell]
+                        once |= cands[cell]
+                    single_bits = once & ~twice
+                    while single_bits:
+                        bit = single_bits & -single_bits
+                        single_bits ^= bit
+                        hidden.append((u, bit.bit_length() - 1))
+            single = self._single(cands, naked, hidden)
+            if single is not None:
+                cell, digit, _, unit = single
+                return {'cell': self._cell(cell), 'digit': digit, 'technique': hardest, 'unit': unit,
+                        'eliminations': eliminations}
+        return None
+
+
+class SudokuBoard:
+    """
+    Compact board state: values in a flat bytearray, pencil marks as one
+    bitmask per cell (bit d-1 <=> digit d) in an array('H'), and fixed
+    cells / error flags as integer bitsets.
+
+    board[r] is a writable memoryview of row r, so board[r][c] reads and
+    writes work like a list-of-lists grid. Each board[r] builds a new view,
+    so hot paths use get()/set() or the flat `values` instead.
+    copy() duplicates two flat buffers; to_bytes()/from_bytes() give a
+    compact serialized form, the same on every platform.
+    """
+    __slots__ = ("size", "values", "pencil", "fixed_bits", "error_bits")
+
+    def __init__(self, size=9):
+        self.size = size
+        self.values = bytearray(size * size)
+        self.pencil = array('H' if size <= 16 else 'I', bytes(0)) # 'I': 25x25 cần hơn 16 bit; 'L' là 8 byte trên Linux, 4 byte trên Windows
+        self.pencil.frombytes(bytes(self.pencil.itemsize * size * size))
+        self.fixed_bits = 0
+        self.error_bits = 0
+
+    @classmethod
+    def from_grid(cls, grid, fixed_mask=None, pencil_data=None, error_cells=None):
+        """
+        Builds a board from the list-based representation: a list-of-lists
+        grid, an optional fixed mask (default: every non-zero cell), a
+        {(r, c): set} pencil dict and a set of (r, c) error cells.
+        """
+        size = len(grid)
+        board = cls(size)
+        values = board.values
+        fixed_bits = 0
+        for r in range(size):
+            row = grid[r]
+            for c in range(size):
+                idx = r * size + c
+                values[idx] = row[c]
+                if (fixed_mask[r][c] if fixed_mask is not None else row[c]):
+                    fixed_bits |= 1 << idx
+        board.fixed_bits = fixed_bits
+        for (r, c), marks in (pencil_data or {}).items():
+            mask = 0
+            for num in marks:
+                mask |= 1 << (num - 1)
+            board.pencil[r * size + c] = mask
+        for r, c in (error_cells or ()):
+            board.error_bits |= 1 << (r * size + c)
+        return board
+
+    # --- List-like access ---
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, r):
+        size = self.size
+        return memoryview(self.values)[r * size:(r + 1) * size]
+
+    def __iter__(self):
+        view, size = memoryview(self.values), self.size
+        for r in range(size):
+            yield view[r * size:(r + 1) * size]
+
+    def get(self, r, c):
+        return self.values[r * self.size + c]
+
+    def set(self, r, c, num):
+        self.values[r * self.size + c] = num
+
+    # --- Fixed cells and error flags ---
+    def is_fixed(self, r, c):
+        return self.fixed_bits >> (r * self.size + c) & 1 == 1
+
+    def is_error(self, r, c):
+        return self.error_bits >> (r * self.size + c) & 1 == 1
+
+    def set_error(self, r, c, flag=True):
+        bit = 1 << (r * self.size + c)
+        if flag:
+            self.error_bits |= bit
+        else:
+            self.error_bits &= ~bit
+
+    # --- Pencil marks ---
+    def pencil_mask(self, r, c):
+        return self.pencil[r * self.size + c]
+
+    def pencil_marks(self, r, c):
+        """Pencil marks of (r, c) as a set of digits (what the UI displays)."""
+        mask = self.pencil[r * self.size + c]
+        return {d + 1 for d in range(self.size) if mask >> d & 1}
+
+    def toggle_pencil(self, r, c, num):
+        self.pencil[r * self.size + c] ^= 1 << (num - 1)
+
+    def clear_pencil(self, r, c):
+        self.pencil[r * self.size + c] = 0
+
+    # --- Copies and export ---
+    def copy(self):
+        board = SudokuBoard.__new__(SudokuBoard)
+        board.size = self.size
+        board.values = self.values[:]
+        board.pencil = self.pencil[:]
+        board.fixed_bits = self.fixed_bits
+        board.error_bits = self.error_bits
+        return board
+
+    def values_view(self):
+        """Zero-copy read/write view of the flat values (row-major)."""
+        return memoryview(self.values)
+
+    def to_bytes(self):
+        """Serialized form: values, pencil masks (little-endian), fixed bitset, error bitset."""
+        num_cells = self.size * self.size
+        bitset_len = (num_cells + 7) // 8
+        pencil = self.pencil
+        if array('H', b'\x01\x00')[0] != 1: # Máy big-endian: đổi thứ tự byte khi xuất
+            pencil = pencil[:]
+            pencil.byteswap()
+        return b"".join((bytes(self.values), pencil.tobytes(),
+                         self.fixed_bits.to_bytes(bitset_len, "little"),
+                         self.error_bits.to_bytes(bitset_len, "little")))
+
+    @classmethod
+    def from_bytes(cls, data, size=9):
+        board = cls(size)
+        num_cells = size * size
+        bitset_len = (num_cells + 7) // 8
+        pencil_len = board.pencil.itemsize * num_cells
+        data = memoryview(data)
+        board.values[:] = data[:num_cells]
+        pencil = array(board.pencil.typecode)
+        pencil.frombytes(data[num_cells:num_cells + pencil_len])
+        if array('H', b'\x01\x00')[0] != 1:
+            pencil.byteswap()
+        board.pencil = pencil
+        offset = num_cells + pencil_len
+        board.fixed_bits = int.from_bytes(data[offset:offset + bitset_len], "little")
+        board.error_bits = int.from_bytes(data[offset + bitset_len:offset + 2 * bitset_len], "little")
+        return board
+
+    # --- Save files (main.py's classic game save) ---
+    def to_save(self):
+        """Save-file fields of the board: to_bytes() in base64 and the size."""
+        return {'board_bytes': base64.b64encode(self.to_bytes()).decode('ascii'), 'size': self.size}
+
+    @classmethod
+    def from_save(cls, data):
+        """
+        (board, other fields) of a saved game dict. Reads the compact form
+        (see to_save) and the older list-based one: 'board_data', 'fixed_mask',
+        a pencil dict keyed "r,c" and a list of [r, c] error cells. The board
+        is None if the dict has neither.
+        """
+        data = dict(data)
+        if data.get('board_bytes'):
+            board = cls.from_bytes(base64.b64decode(data.pop('board_bytes')), data.get('size', 9))
+        elif data.get('board_data'):
+            pencil_data = {tuple(map(int, k.split(','))): set(v) for k, v in data.pop('pencil_data', {}).items()}
+            error_cells = set(map(tuple, data.pop('error_cells', [])))
+            board = cls.from_grid(data.pop('board_data'), data.pop('fixed_mask', None), pencil_data, error_cells)
+        else:
+            return None, data
+        return board, data
+
+    # --- Conversions back to the list-based representation ---
+    def to_grid(self):
+        size, values = self.size, self.values
+        return [list(values[r * size:(r + 1) * size]) for r in range(size)]
+
+    def fixed_mask(self):
+        size = self.size
+        return [[self.is_fixed(r, c) for c in range(size)] for r in range(size)]
+
+    def error_cells(self):
+        size = self.size
+        return {divmod(idx, size) for idx in range(size * size) if self.error_bits >> idx & 1}
+
+    def pencil_dict(self):
+        size = self.size
+        return {divmod(idx, size): self.pencil_marks(*divmod(idx, size))
+                for idx in range(size * size) if self.pencil[idx]}
+
+
+class _RatingTrack:
+    """
+    What changed during one DifficultyRater.rate() call. Every candidate
+    change marks the cell's units and the removed digits as changed. Each
+    technique keeps a bitmask of the units, box/line intersections or
+    digits it has still to scan: it clears a bit when it scans that item,
+    and changes made since are folded into every technique's mask (flush())
+    the next time one asks for its own, so an item stays skipped while
+    nothing there has changed. Cells that drop to one candidate are queued
+    for the naked singles.
+
+    Once a technique first asks for the digit positions of the units
+    (DifficultyRater._places), every later change also clears the cell's
+    bit in them, so they never have to be recomputed.
+    """
+    __slots__ = ("cell_unit_bits", "cell_slots", "unit_inters", "changed_units", "changed_digits",
+                 "units_todo", "inters_todo", "digits_todo", "singles", "open", "places")
+
+    def __init__(self, cell_unit_bits, cell_slots, unit_inters, open_cells):
+        self.cell_unit_bits = cell_unit_bits # Ô -> bitmask các đơn vị chứa ô
+        self.cell_slots = cell_slots # Ô -> (đơn vị, bit vị trí của ô trong đơn vị)
+        self.unit_inters = unit_inters # technique -> per unit, the intersections that unit can wake up
+        self.changed_units = 0  # Đổi từ lần flush() trước
+        self.changed_digits = 0
+        self.units_todo = {}    # technique -> bitmask of the units it has still to scan
+        self.inters_todo = {}   # ... of the box/line intersections
+        self.digits_todo = {}   # ... of the digits
+        self.singles = []       # Ô vừa còn đúng một ứng viên
+        self.open = open_cells  # Số ô còn trống
+        self.places = None      # DifficultyRater._places(), giữ cập nhật sau lần tính đầu
+
+    def flush(self):
+        """Adds what changed since the last flush to every technique's mask."""
+        changed = self.changed_units
+        if changed:
+            self.changed_units = 0
+            todo = self.units_todo
+            for name in todo:
+                todo[name] |= changed
+            todo = self.inters_todo
+            for name in todo:
+                inters, unit_inters, rest = 0, self.unit_inters[name], changed
+                while rest:
+                    low = rest & -rest
+                    rest ^= low
+                    inters |= unit_inters[low.bit_length() - 1]
+                todo[name] |= inters
+        changed = self.changed_digits
+        if changed:
+            self.changed_digits = 0
+            todo = self.digits_todo
+            for name in todo:
+                todo[name] |= changed
+
+    def take(self, todo, name, everything):
+        """
+        Items (bitmask) technique `name` has still to scan, from one of the
+        *_todo tables; everything on its first call. Its mask is emptied: the
+        technique puts back (|=) whatever it stops before scanning.
+        """
+        self.flush()
+        mask = todo.get(name, everything)
+        todo[name] = 0
+        return mask
+
+    def narrowed(self, cell, mask, removed):
+        """Cell `cell` now has candidates `mask`, after losing the digits in `removed`."""
+        self.changed_units |= self.cell_unit_bits[cell]
+        self.changed_digits |= removed
+        places = self.places
+        if places is not None:
+            while removed:
+                bit = removed & -removed
+                removed ^= bit
+                d = bit.bit_length() - 1
+                for u, pos in self.cell_slots[cell]:
+                    places[u][d] &= ~pos
+        if mask and not (mask & (mask - 1)):
+            self.singles.append(cell)
+
+
+class DifficultyRater:
+    """
+    Rates a puzzle by solving it the way a person would.
+
+    The solver climbs a ladder of techniques, always using the easiest one
+    that makes progress and restarting from the bottom afterwards. The score
+    is driven by the hardest technique needed, plus a small bonus for how
+    often non-single techniques were required. If the ladder gets stuck, one
+    cell is filled from the real solution and counted as a "guess".
+
+    Within one rate() call the passes are incremental (see _RatingTrack):
+    naked singles come from a queue, and every other technique keeps, across
+    stalls, the units, intersections or digits that changed since it last
+    scanned them, and rescans only those; the digit positions of every unit,
+    once a technique needs them, are kept up to date instead of recomputed.
+    Called without a track (as HintEngine does), every technique scans the
+    whole board. Hard and expert puzzles still cost the most: each technique
+    scans everything the first time it is reached, and the run of placements
+    after a stall changes nearly every unit.
+    """
+    # (technique, weight) in ladder order
+    TECHNIQUES = (
+        ("naked_single", 1.0),
+        ("hidden_single", 1.2),
+        ("variant_rule", 2.0), # Killer cages and consecutive bars (only in those variants' ladders)
+        ("pointing_pair", 2.6),
+        ("box_line_reduction", 2.8),
+        ("naked_pair", 3.0),
+        ("hidden_pair", 3.4),
+        ("naked_triple", 3.6),
+        ("hidden_triple", 4.0),
+        ("x_wing", 4.2),
+        ("swordfish", 5.0),
+        ("chain", 6.0),
+        ("guess", 9.0),
+    )
+
+    def __init__(self, size=9, variant=None):
+        self.size = size
+        self.solver = BitmaskSolver(size, variant=variant)
+        self.units = self.solver.units
+        self.rows = self.units[:size]
+        self.cols = self.units[size:2 * size]
+        self.boxes = self.units[2 * size:3 * size] # Khối, hoặc vùng jigsaw; đường chéo (nếu có) nằm sau
+        self.peers = self.solver.peers
+        self.peer_masks = self.solver.bit_tables()[0]
+        # Per cell: (unit id, bit of the cell's position in that unit), for _RatingTrack
+        self.cell_slots = tuple(tuple((u, 1 << self.units[u].index(cell)) for u in units)
+                                for cell, units in enumerate(self.solver.cell_units))
+        self.cell_unit_bits = tuple(sum(1 << u for u in units) for units in self.solver.cell_units)
+        # Peers outside the units (knight moves, cage mates), None under classic rules
+        self.extra_peers = variant.extra_peers if variant is not None and any(variant.extra_peers) else None
+        self.weights = dict(self.TECHNIQUES)
+        self._steps = (
+            ("naked_single", self._naked_singles),
+            ("hidden_single", self._hidden_singles),
+            ("pointing_pair", self._pointing),
+            ("box_line_reduction", self._box_line),
+            ("naked_pair", lambda v, c, t=None: self._naked_subset(c, 2, t)),
+            ("hidden_pair", lambda v, c, t=None: self._hidden_subset(c, 2, t)),
+            ("naked_triple", lambda v, c, t=None: self._naked_subset(c, 3, t)),
+            ("hidden_triple", lambda v, c, t=None: self._hidden_subset(c, 3, t)),
+            ("x_wing", lambda v, c, t=None: self._fish(c, 2, t)),
+            ("swordfish", lambda v, c, t=None: self._fish(c, 3, t)),
+            ("chain", self._simple_coloring),
+        )
+        if self.solver.cages or self.solver.pairs:
+            self._steps = self._steps[:2] + (("variant_rule", self._variant_rules),) + self._steps[2:]
+
+        # Box/line intersections used by pointing pairs and box-line reduction,
+        # with the unit ids of the box and the line
+        size = self.size
+        self.intersections = []
+        for b, box in enumerate(self.boxes):
+            box_set = set(box)
+            for line_id, line in enumerate(self.rows + self.cols):
+                common = box_set.intersection(line)
+                if common:
+                    self.intersections.append((
+                        tuple(common),
+                        tuple(c for c in box if c not in common),
+                        tuple(c for c in line if c not in common),
+                        2 * size + b,
+                        line_id,
+                    ))
+        # Per unit: bitmask of the intersections it is the box of, and the line of (for _RatingTrack).
+        # Pointing only finds something new once the box changed: changes elsewhere in the line just
+        # remove candidates it would have eliminated. Box-line reduction likewise waits for the line
+        box_inters, line_inters = [0] * len(self.units), [0] * len(self.units)
+        for i, item in enumerate(self.intersections):
+            box_inters[item[3]] |= 1 << i
+            line_inters[item[4]] |= 1 << i
+        self.unit_inters = {"pointing_pair": tuple(box_inters), "box_line_reduction": tuple(line_inters)}
+        # Everything, as the bitmasks the techniques scan
+        self.all_units = (1 << len(self.units)) - 1
+        self.all_inters = (1 << len(self.intersections)) - 1
+        self.all_digits = self.solver.full_mask
+
+    def rate(self, grid, stalls=False, deadline=None, solution=None):
+        """
+        Rates a list-of-lists puzzle.
+        Returns a dict: {'score', 'hardest', 'counts', 'solved'}; 'solved' is
+        False (and score None) when the puzzle has no solution. With `stalls`
+        it also has 'open_at': technique -> flat indices of the cells still
+        empty the first time that technique (above singles) was needed.
+        Once time.monotonic() passes `deadline` the ladder stops where it is:
+        the score covers the steps taken so far (a lower bound) and the dict
+        gets 'timed_out': True. `solution`, when the caller knows it (the
+        puzzle must then be unique), saves the solve the first guess needs.
+        """
+        unsolvable = {'score': None, 'hardest': None, 'counts': {}, 'solved': False}
+        size = self.size
+        values = [grid[r][c] for r in range(size) for c in range(size)]
+        full = self.solver.full_mask
+        unit_used = []
+        for unit in self.units:
+            used = 0
+            for cell in unit:
+                if values[cell]:
+                    bit = 1 << (values[cell] - 1)
+                    if used & bit:
+                        return unsolvable # Duplicate given
+                    used |= bit
+            unit_used.append(used)
+        cell_units, extra_peers = self.solver.cell_units, self.extra_peers
+        cands = [0] * len(values)
+        for cell, num in enumerate(values):
+            used = 0
+            for u in cell_units[cell]:
+                used |= unit_used[u]
+            if extra_peers is not None:
+                for p in extra_peers[cell]:
+                    if values[p]:
+                        used |= 1 << (values[p] - 1)
+            if num:
+                if extra_peers is not None and any(values[p] == num for p in extra_peers[cell]):
+                    return unsolvable # Duplicate given (knight move or cage mate)
+            else:
+                cands[cell] = full & ~used
+
+        counts = {}
+        open_at = {} # Kỹ thuật (trên mức single) -> các ô còn trống lần đầu cần đến nó
+        steps = self._steps
+        # `solution` is only computed if a guess is needed
+        track = _RatingTrack(self.cell_unit_bits, self.cell_slots, self.unit_inters, values.count(0))
+        track.singles = [cell for cell, m in enumerate(cands) if m and not (m & (m - 1))]
+        timed_out = False
+        while track.open:
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+                break
+            for name, step in steps:
+                n = step(values, cands, track)
+                if n:
+                    if stalls and name not in counts and name not in ("naked_single", "hidden_single"):
+                        open_at[name] = [cell for cell, v in enumerate(values) if not v]
+                    counts[name] = counts.get(name, 0) + n
+                    break
+            else:
+                # Không kỹ thuật nào tiến triển: đoán ô ít ứng viên nhất theo lời giải
+                if solution is None:
+                    solution = self.solver.solve(grid)
+                    if solution is None:
+                        return unsolvable
+                best, best_count = -1, size + 1
+                for cell, m in enumerate(cands):
+                    if m and m.bit_count() < best_count:
+                        best, best_count = cell, m.bit_count()
+                if best < 0:
+                    return unsolvable # Ô trống không còn ứng viên nào
+                if stalls and "guess" not in counts:
+                    open_at["guess"] = [cell for cell, v in enumerate(values) if not v]
+                self._place(values, cands, best, solution[best // size][best % size], track)
+                counts["guess"] = counts.get("guess", 0) + 1
+
+        hardest, hardest_weight = None, 0.0
+        for name, _ in counts.items():
+            if self.weights[name] > hardest_weight:
+                hardest, hardest_weight = name, self.weights[name]
+        advanced = sum(n for name, n in counts.items() if self.weights[name] > 1.2)
+        score = round(hardest_weight + min(0.9, 0.05 * advanced), 2)
+        rating = {'score': score, 'hardest': hardest, 'counts': counts, 'solved': True}
+        if stalls:
+            rating['open_at'] = open_at
+        if timed_out:
+            rating['timed_out'] = True
+        return rating
+
+    def elimination_steps(self):
+        """
+        The (technique, step) pairs of the ladder above the singles, easiest
+        first. step(values, cands) works on flat lists, narrows `cands` in
+        place and returns how many cells it changed (0: nothing found).
+        """
+        return tuple((name, step) for name, step in self._steps if name not in ("naked_single", "hidden_single"))
+
+    # --- Helpers ---
+    def _place(self, values, cands, cell, num, track=None):
+        values[cell] = num
+        old = cands[cell]
+        cands[cell] = 0
+        bit = 1 << (num - 1)
+        if track is None:
+            for p in self.peers[cell]:
+                cands[p] &= ~bit
+            return
+        # Như track.narrowed() cho ô và mọi ô liên quan, gộp các đơn vị đổi vào một mặt nạ (đường nóng)
+        track.open -= 1
+        unit_bits, singles, places = track.cell_unit_bits, track.singles, track.places
+        changed = unit_bits[cell]
+        track.changed_digits |= old | bit
+        if places is not None:
+            while old:
+                low = old & -old
+                old ^= low
+                d = low.bit_length() - 1
+                for u, pos in track.cell_slots[cell]:
+                    places[u][d] &= ~pos
+        d = num - 1
+        for p in self.peers[cell]:
+            m = cands[p]
+            if m & bit:
+                m ^= bit
+                cands[p] = m
+                changed |= unit_bits[p]
+                if places is not None:
+                    for u, pos in track.cell_slots[p]:
+                        places[u][d] &= ~pos
+                if m and not (m & (m - 1)):
+                    singles.append(p)
+        track.changed_units |= changed
+
+    def _eliminate(self, cands, cells, mask, track=None):
+        """Removes `mask` from `cells`; returns how many cells changed."""
+        changed = 0
+        for cell in cells:
+            m = cands[cell]
+            if m & mask:
+                cands[cell] = m & ~mask
+                if track is not None:
+                    track.narrowed(cell, m & ~mask, m & mask)
+                changed += 1
+        return changed
+
+    # --- Techniques: each returns the number of placements/eliminations made ---
+    def _naked_singles(self, values, cands, track=None):
+        placed = 0
+        if track is not None:
+            singles = track.singles
+            while singles:
+                cell = singles.pop()
+                m = cands[cell]
+                if m and not (m & (m - 1)) and not values[cell]:
+                    self._place(values, cands, cell, m.bit_length(), track)
+                    placed += 1
+            return placed
+        for cell, m in enumerate(cands):
+            if m and not (m & (m - 1)):
+                self._place(values, cands, cell, m.bit_length())
+                placed += 1
+        return placed
+
+    def _hidden_singles(self, values, cands, track=None):
+        placed = 0
+        units = self.units
+        todo = self.all_units if track is None else track.take(track.units_todo, "hidden_single", self.all_units)
+        while todo:
+            low = todo & -todo
+            todo ^= low
+            unit = units[low.bit_length() - 1]
+            once = twice = 0
+            for cell in unit:
+                m = cands[cell]
+                twice |= once & m
+                once |= m
+            hidden = once & ~twice
+            if hidden:
+                before = placed
+                for cell in unit:
+                    h = cands[cell] & hidden
+                    if h and not (h & (h - 1)):
+                        self._place(values, cands, cell, h.bit_length(), track)
+                        placed += 1
+                if track is not None and placed > before:
+                    # Đơn vị phía sau vừa đổi thì quét luôn trong lượt này; phía trước để lượt sau
+                    track.flush()
+                    later = track.units_todo["hidden_single"] & -(low << 1)
+                    track.units_todo["hidden_single"] ^= later
+                    todo |= later
+        return placed
+
+    def _variant_rules(self, values, cands, track=None):
+        # Bounds from the variant's extra rules, as in BitmaskSolver._prune_extra:
+        # a barred cell keeps digits one apart from its partner's, a cage cell
+        # keeps digits its cage mates' min/max sums leave room for. One pass over all of them
+        size = self.size
+        changed = 0
+        for a, b in self.solver.pairs:
+            ma = cands[a] or 1 << (values[a] - 1)
+            mb = cands[b] or 1 << (values[b] - 1)
+            for cell, m, other in ((a, ma, mb), (b, mb, ma)):
+                keep = m & ((other << 1) | (other >> 1))
+                if not values[cell] and keep and keep != m:
+                    changed += self._eliminate(cands, (cell,), m & ~keep, track)
+        for total, cage in self.solver.cages:
+            low = high = 0
+            for cell in cage:
+                m = cands[cell] or 1 << (values[cell] - 1)
+                low += (m & -m).bit_length()
+                high += m.bit_length()
+            for cell in cage:
+                m = cands[cell]
+                if values[cell] or not (m & (m - 1)):
+                    continue
+                lo_d = max(1, total - (high - m.bit_length()))
+                hi_d = min(size, total - (low - (m & -m).bit_length()))
+                if lo_d > hi_d:
+                    continue
+                keep = m & ((1 << hi_d) - 1) & ~((1 << (lo_d - 1)) - 1)
+                if keep and keep != m:
+                    changed += self._eliminate(cands, (cell,), m & ~keep, track)
+        return changed
+
+    def _pointing(self, values, cands, track=None):
+        # Digit confined to one line inside a box -> remove it from the rest of the line
+        intersections = self.intersections
+        todo = self.all_inters if track is None else track.take(track.inters_todo, "pointing_pair", self.all_inters)
+        while todo:
+            low = todo & -todo
+            todo ^= low
+            common, rest_box, rest_line, _, _ = intersections[low.bit_length() - 1]
+            inside = 0
+            for cell in common:
+                inside |= cands[cell]
+            outside = 0
+            for cell in rest_box:
+                outside |= cands[cell]
+            pointing = inside & ~outside
+            if pointing and self._eliminate(cands, rest_line, pointing, track):
+                if track is not None:
+                    track.inters_todo["pointing_pair"] |= todo # Phần chưa quét
+                return 1
+        return 0
+
+    def _box_line(self, values, cands, track=None):
+        # Digit confined to one box inside a line -> remove it from the rest of the box
+        intersections = self.intersections
+        todo = self.all_inters if track is None else track.take(track.inters_todo, "box_line_reduction", self.all_inters)
+        while todo:
+            low = todo & -todo
+            todo ^= low
+            common, rest_box, rest_line, _, _ = intersections[low.bit_length() - 1]
+            inside = 0
+            for cell in common:
+                inside |= cands[cell]
+            outside = 0
+            for cell in rest_line:
+                outside |= cands[cell]
+            claiming = inside & ~outside
+            if claiming and self._eliminate(cands, rest_box, claiming, track):
+                if track is not None:
+                    track.inters_todo["box_line_reduction"] |= todo # Phần chưa quét
+                return 1
+        return 0
+
+    def _unit_places(self, cands, unit_ids):
+        """places[i][d]: bitmask of the positions in unit unit_ids[i] where digit d+1 can still go."""
+        size = self.size
+        units = self.units
+        places = []
+        for u in unit_ids:
+            positions = [0] * size
+            for idx, cell in enumerate(units[u]):
+                m = cands[cell]
+                while m:
+                    bit = m & -m
+                    positions[bit.bit_length() - 1] |= 1 << idx
+                    m ^= bit
+            places.append(positions)
+        return places
+
+    def _places(self, cands, track):
+        """_unit_places() of every unit; with a track, computed once and then kept up to date by the track."""
+        if track is None:
+            return self._unit_places(cands, range(len(self.units)))
+        if track.places is None:
+            track.places = self._unit_places(cands, range(len(self.units)))
+        return track.places
+
+    def _naked_subset(self, cands, k, track=None):
+        units = self.units
+        todo = self.all_units if track is None else track.take(track.units_todo, ("naked", k), self.all_units)
+        while todo:
+            low = todo & -todo
+            todo ^= low
+            unit = units[low.bit_length() - 1]
+            open_cells = [cell for cell in unit if cands[cell]]
+            if len(open_cells) <= k:
+                continue
+            small = [cell for cell in open_cells if cands[cell].bit_count() <= k]
+            if len(small) < k:
+                continue
+            for combo in combinations(small, k):
+                union = 0
+                for cell in combo:
+                    union |= cands[cell]
+                if union.bit_count() == k:
+                    others = [cell for cell in open_cells if cell not in combo]
+                    if self._eliminate(cands, others, union, track):
+                        if track is not None:
+                            track.units_todo[("naked", k)] |= todo
+                        return 1
+        return 0
+
+    def _hidden_subset(self, cands, k, track=None):
+        units = self.units
+        todo = self.all_units if track is None else track.take(track.units_todo, ("hidden", k), self.all_units)
+        places = self._places(cands, track)
+        while todo:
+            low = todo & -todo
+            todo ^= low
+            u = low.bit_length() - 1
+            unit = units[u]
+            positions = places[u] # positions[d] = bitmask of unit indices where digit d+1 can go
+            digits = [d for d, w in enumerate(positions) if w & (w - 1) and w.bit_count() <= k]
+            if len(digits) < k:
+                continue
+            for combo in combinations(digits, k):
+                where = 0
+                for d in combo:
+                    where |= positions[d]
+                if where.bit_count() == k:
+                    keep = 0
+                    for d in combo:
+                        keep |= 1 << d
+                    changed = 0
+                    for idx, cell in enumerate(unit):
+                        if where >> idx & 1 and cands[cell] & ~keep:
+                            if track is not None:
+                                track.narrowed(cell, cands[cell] & keep, cands[cell] & ~keep)
+                            cands[cell] &= keep
+                            changed += 1
+                    if changed:
+                        if track is not None:
+                            track.units_todo[("hidden", k)] |= todo
+                        return 1
+        return 0
+
+    def _fish(self, cands, k, track=None):
+        size = self.size
+        places = self._places(cands, track) # Hàng rồi cột, rồi các đơn vị khác
+        for orientation, (bases, covers) in enumerate(((self.rows, self.cols), (self.cols, self.rows))):
+            name = ("fish", k, orientation)
+            todo = self.all_digits if track is None else track.take(track.digits_todo, name, self.all_digits)
+            base_places = places[orientation * size:(orientation + 1) * size]
+            while todo:
+                bit = todo & -todo
+                todo ^= bit
+                d = bit.bit_length() - 1
+                lines = [(i, w) for i, w in enumerate([positions[d] for positions in base_places])
+                         if w & (w - 1) and w.bit_count() <= k]
+                if len(lines) < k:
+                    continue
+                for combo in combinations(lines, k):
+                    where = 0
+                    for _, w in combo:
+                        where |= w
+                    if where.bit_count() != k:
+                        continue
+                    base_ids = {i for i, _ in combo}
+                    changed = 0
+                    for idx in range(size):
+                        if where >> idx & 1:
+                            for j, cell in enumerate(covers[idx]):
+                                if j not in base_ids and cands[cell] & bit:
+                                    cands[cell] &= ~bit
+                                    if track is not None:
+                                        track.narrowed(cell, cands[cell], bit)
+                                    changed += 1
+                    if changed:
+                        if track is not None:
+                            track.digits_todo[name] |= todo
+                        return 1
+        return 0
+
+    def _simple_coloring(self, values, cands, track=None):
+        """Single-digit chains built from conjugate pairs (simple coloring)."""
+        size = self.size
+        peer_masks = self.peer_masks
+        todo = self.all_digits if track is None else track.take(track.digits_todo, "chain", self.all_digits)
+        places = self._places(cands, track) if todo else None
+        while todo:
+            bit = todo & -todo
+            todo ^= bit
+            d = bit.bit_length() - 1
+            links = {}
+            for unit, positions in zip(self.units, places):
+                where = positions[d]
+                if where.bit_count() == 2:
+                    low = where & -where
+                    a, b = unit[low.bit_length() - 1], unit[(where ^ low).bit_length() - 1]
+                    links.setdefault(a, []).append(b)
+                    links.setdefault(b, []).append(a)
+            if len(links) < 3:
+                continue
+            holders = None # Bitmask các ô còn ứng viên d, tính khi cần (quy tắc 2)
+            colored = {}
+            for start in links:
+                if start in colored:
+                    continue
+                # 2-color one connected chain
+                colored[start] = 0
+                chain = [start]
+                stack = [start]
+                while stack:
+                    cell = stack.pop()
+                    for nxt in links[cell]:
+                        if nxt not in colored:
+                            colored[nxt] = 1 - colored[cell]
+                            chain.append(nxt)
+                            stack.append(nxt)
+                if len(chain) < 3:
+                    continue
+                groups = ([c for c in chain if colored[c] == 0], [c for c in chain if colored[c] == 1])
+                # Peers of each color, as bitmasks over cells
+                sees = [0, 0]
+                for color, group in enumerate(groups):
+                    for c in group:
+                        sees[color] |= peer_masks[c]
+                # Rule 1: two cells of one color see each other -> that color is false
+                for color, group in enumerate(groups):
+                    if any(sees[color] >> c & 1 for c in group):
+                        if self._eliminate(cands, group, bit, track):
+                            if track is not None:
+                                track.digits_todo["chain"] |= todo
+                            return 1
+                # Rule 2: a cell seeing both colors cannot hold the digit
+                both = sees[0] & sees[1]
+                if not both:
+                    continue
+                if holders is None:
+                    holders = 0
+                    for r, positions in enumerate(places[:size]): # Hàng r: vị trí thứ c là ô r * size + c
+                        holders |= positions[d] << (r * size)
+                for c in chain:
+                    both &= ~(1 << c)
+                both &= holders
+                targets = []
+                while both:
+                    low = both & -both
+                    both ^= low
+                    p = low.bit_length() - 1
+                    if cands[p] & bit:
+                        targets.append(p)
+                if targets and self._eliminate(cands, targets, bit, track):
+                    if track is not None:
+                        track.digits_todo["chain"] |= todo
+                    return 1
+        return 0
+
+
+# --- NumPy batch API: (N, size, size) arrays of boards ---
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The batch API needs NumPy: pip install numpy")
+
+
+def _as_board_array(boards):
+    _require_numpy()
+    boards = np.asarray(boards, dtype=np.int16)
+    if boards.ndim == 2:
+        boards = boards[None]
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError(f"Expected an (N, size, size) array of boards, got shape {boards.shape}")
+    return boards
+
+
+def batch_is_complete(boards):
+    """(N,) bool array: True where a board has no empty cell."""
+    boards = _as_board_array(boards)
+    return (boards != 0).all(axis=(1, 2))
+
+
+def batch_is_correct(boards, solutions):
+    """(N,) bool array: True where a board is complete and equal to its solution."""
+    boards = _as_board_array(boards)
+    solutions = _as_board_array(solutions)
+    return batch_is_complete(boards) & (boards == solutions).all(axis=(1, 2))
+
+
+def batch_conflict_counts(boards):
+    """
+    (N,) int array: number of duplicate digits over all rows, columns and
+    boxes of each board (0 means no rule is broken). Empty cells are ignored.
+    """
+    boards = _as_board_array(boards)
+    n, size, _ = boards.shape
+    box_rows, box_cols = box_dimensions(size)
+    onehot = boards[..., None] == np.arange(1, size + 1, dtype=boards.dtype) # (N, size, size, digits)
+    row_counts = onehot.sum(axis=2, dtype=np.int16)
+    col_counts = onehot.sum(axis=1, dtype=np.int16)
+    box_counts = onehot.reshape(n, size // box_rows, box_rows, size // box_cols, box_cols, size).sum(axis=(2, 4), dtype=np.int16)
+    conflicts = np.zeros(n, dtype=np.int64)
+    for counts in (row_counts, col_counts, box_counts):
+        conflicts += np.clip(counts - 1, 0, None).reshape(n, -1).sum(axis=1)
+    return conflicts
+
+
+def batch_check_boards(boards, solutions=None):
+    """
+    Vectorized audit of many boards at once. Returns a dict of (N,) arrays:
+    'complete', 'conflicts' and, when solutions are given, 'correct'.
+    """
+    boards = _as_board_array(boards)
+    result = {'complete': batch_is_complete(boards), 'conflicts': batch_conflict_counts(boards)}
+    if solutions is not None:
+        result['correct'] = batch_is_correct(boards, solutions)
+    return result
+
+
+def batch_apply_random_transforms(puzzles, solutions):
+    """
+    Applies an independent random symmetry to every (puzzle, solution) pair
+    using fancy indexing. Both inputs are (N, size, size) arrays.
+    """
+    _require_numpy()
+    n, size, _ = puzzles.shape
+    box_rows, box_cols = box_dimensions(size)
+    rng = np.random.default_rng(random.getrandbits(64))
+
+    def line_orders(width):
+        groups = size // width
+        blocks = np.argsort(rng.random((n, groups)), axis=1)
+        inner = np.argsort(rng.random((n, groups, width)), axis=2)
+        return (blocks[:, :, None] * width + np.take_along_axis(inner, blocks[:, :, None], axis=1)).reshape(n, size)
+
+    rows = line_orders(box_rows)
+    cols = line_orders(box_cols)
+    transpose = (rng.random(n) < 0.5) & (box_rows == box_cols)
+    puzzles = np.where(transpose[:, None, None], puzzles.transpose(0, 2, 1), puzzles)
+    solutions = np.where(transpose[:, None, None], solutions.transpose(0, 2, 1), solutions)
+    idx = np.arange(n)[:, None, None]
+    puzzles = puzzles[idx, rows[:, :, None], cols[:, None, :]]
+    solutions = solutions[idx, rows[:, :, None], cols[:, None, :]]
+
+    digit_maps = np.zeros((n, size + 1), dtype=puzzles.dtype)
+    digit_maps[:, 1:] = np.argsort(rng.random((n, size)), axis=1) + 1
+    return np.take_along_axis(digit_maps, puzzles.reshape(n, -1), axis=1).reshape(puzzles.shape), \
+        np.take_along_axis(digit_maps, solutions.reshape(n, -1), axis=1).reshape(solutions.shape)
+
+
+def generate_puzzle_batch(n, difficulty="medium", generator=None, base_puzzles=None):
+    """
+    Returns (puzzles, solutions) as (n, size, size) int8 arrays, one
+    generated puzzle per entry.
+    Opt-in shortcut: with `base_puzzles`, only that many puzzles are
+    generated and the batch is filled with random symmetries of them. Those
+    keep uniqueness and rating but are the same puzzles: the batch then holds
+    only `base_puzzles` distinct puzzles under puzzle_fingerprint().
+    """
+    _require_numpy()
+    generator = generator or SudokuGenerator()
+    bases = n if base_puzzles is None else max(1, min(n, base_puzzles))
+    base_p, base_s = [], []
+    for _ in range(bases):
+        puzzle, solution = generator.generate_puzzle(difficulty)
+        base_p.append([row[:] for row in puzzle])
+        base_s.append([row[:] for row in solution])
+    puzzles = np.asarray(base_p, dtype=np.int8)
+    solutions = np.asarray(base_s, dtype=np.int8)
+    if bases == n:
+        return puzzles, solutions
+    pick = np.arange(n) % bases
+    return batch_apply_random_transforms(puzzles[pick], solutions[pick])
+
+
+# --- Binary puzzle bank ---
+# File layout (little-endian):
+#   header : magic, version, board size, record size, number of index entries, offset of the first record
+#   index  : one entry per difficulty -> (name, first record number, record count)
+#   records: fixed-size, grouped by difficulty: puzzle cells, solution cells, rating (float32), seed (uint64)
+BANK_MAGIC = b"SDKBANK1"
+BANK_VERSION = 1
+BANK_NAME_BYTES = 16 # Difficulty names in the index are ASCII, at most this long
+_BANK_HEADER = struct.Struct("<8sHBxIII")
+_BANK_INDEX_ENTRY = struct.Struct(f"<{BANK_NAME_BYTES}sQQ")
+_BANK_RECORD_TAIL = struct.Struct("<fQ") # rating, seed
+
+
+def bank_record_size(size):
+    """Bytes per record for a size x size board (one byte per cell)."""
+    return 2 * size * size + _BANK_RECORD_TAIL.size
+
+
+class PuzzleBankWriter:
+    """
+    Writes a puzzle bank. Records may arrive in any order: each difficulty is
+    spooled to its own temporary file and close() writes the header, the index
+    and the grouped records, so banks of millions of puzzles never sit in memory.
+    """
+    def __init__(self, path, size=9):
+        self.path = path
+        self.size = size
+        self.record_size = bank_record_size(size)
+        self._spools = {} # difficulty -> (temporary file, count)
+
+    def add(self, difficulty, puzzle, solution, rating=0.0, seed=0):
+        """Appends one record. `rating` is the DifficultyRater score (None -> 0.0)."""
+        size = self.size
+        if len(puzzle) != size or len(solution) != size:
+            raise ValueError(f"PuzzleBankWriter expects {size}x{size} boards")
+        if len(difficulty.encode("ascii")) > BANK_NAME_BYTES:
+            raise ValueError(f"Difficulty name too long: {difficulty}")
+        record = bytearray(self.record_size)
+        cells = size * size
+        for r in range(size):
+            record[r * size:(r + 1) * size] = bytes(puzzle[r])
+            record[cells + r * size:cells + (r + 1) * size] = bytes(solution[r])
+        _BANK_RECORD_TAIL.pack_into(record, 2 * cells, rating or 0.0, seed & 0xFFFFFFFFFFFFFFFF)
+        spool, count = self._spools.get(difficulty, (None, 0))
+        if spool is None:
+            spool = tempfile.TemporaryFile()
+        spool.write(record)
+        self._spools[difficulty] = (spool, count + 1)
+
+    def count(self, difficulty=None):
+        if difficulty is None:
+            return sum(count for _, count in self._spools.values())
+        return self._spools.get(difficulty, (None, 0))[1]
+
+    def close(self):
+        """Writes the bank file (via a temporary file, then an atomic rename)."""
+        entries = sorted(self._spools.items())
+        data_offset = _BANK_HEADER.size + _BANK_INDEX_ENTRY.size * len(entries)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(_BANK_HEADER.pack(BANK_MAGIC, BANK_VERSION, self.size, self.record_size,
+                                        len(entries), data_offset))
+            first = 0
+            for difficulty, (_, count) in entries:
+                out.write(_BANK_INDEX_ENTRY.pack(difficulty.encode("ascii"), first, count))
+                first += count
+            for _, (spool, _) in entries:
+                spool.seek(0)
+                shutil.copyfileobj(spool, out)
+                spool.close()
+        os.replace(tmp_path, self.path)
+        self._spools = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for spool, _ in self._spools.values():
+                spool.close()
+            self._spools = {}
+
+
+class PuzzleBank:
+    """
+    Read-only puzzle bank opened with mmap. Only the header is parsed on open;
+    records are read straight from the mapping, so drawing a puzzle is O(1)
+    and several processes share the same pages through the OS cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # File rỗng không map được
+            self._file.close()
+            raise ValueError(f"Puzzle bank '{path}' is empty")
+        magic, version, size, record_size, num_entries, data_offset = _BANK_HEADER.unpack_from(self._map, 0)
+        if magic != BANK_MAGIC or version != BANK_VERSION:
+            self.close()
+            raise ValueError(f"'{path}' is not a puzzle bank (version {BANK_VERSION})")
+        if record_size != bank_record_size(size):
+            self.close()
+            raise ValueError(f"Puzzle bank '{path}' has an unexpected record size")
+        self.size = size
+        self.record_size = record_size
+        self.data_offset = data_offset
+        self.index = {} # difficulty -> (first record, count)
+        for i in range(num_entries):
+            name, first, count = _BANK_INDEX_ENTRY.unpack_from(self._map, _BANK_HEADER.size + i * _BANK_INDEX_ENTRY.size)
+            self.index[name.rstrip(b"\0").decode("ascii")] = (first, count)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return sum(count for _, count in self.index.values())
+
+    def count(self, difficulty):
+        return self.index.get(difficulty, (0, 0))[1]
+
+    def has(self, difficulty, size=None):
+        """True if the bank holds `difficulty` puzzles (of board `size`, if given)."""
+        return (size is None or size == self.size) and self.count(difficulty) > 0
+
+    def get(self, difficulty, i):
+        """Returns record `i` of `difficulty` as (puzzle, solution, rating, seed)."""
+        first, count = self.index.get(difficulty, (0, 0))
+        if not 0 <= i < count:
+            raise IndexError(f"Puzzle bank has {count} '{difficulty}' puzzles, asked for #{i}")
+        size = self.size
+        cells = size * size
+        offset = self.data_offset + (first + i) * self.record_size
+        data = self._map[offset:offset + self.record_size]
+        puzzle = [list(data[r * size:(r + 1) * size]) for r in range(size)]
+        solution = [list(data[cells + r * size:cells + (r + 1) * size]) for r in range(size)]
+        rating, seed = _BANK_RECORD_TAIL.unpack_from(data, 2 * cells)
+        return puzzle, solution, round(rating, 2), seed
+
+    def random(self, difficulty, rng=random):
+        """Draws a random (puzzle, solution, rating, seed) of `difficulty`; None if there is none."""
+        count = self.count(difficulty)
+        if not count:
+            return None
+        return self.get(difficulty, rng.randrange(count))
+
+
+# --- On-disk fingerprint set ---
+# File layout (little-endian): header (magic, number of slots, number of entries),
+# then a power-of-two table of FINGERPRINT_BYTES-byte slots; an all-zero slot is empty.
+FINGERPRINT_SET_MAGIC = b"SDKFPSET"
+FINGERPRINT_SET_SLOTS = 1 << 16 # Initial table size (1 MB)
+FINGERPRINT_SET_MAX_LOAD = 0.7  # Grow (double) once this share of the slots is taken
+_FINGERPRINT_SET_HEADER = struct.Struct("<8sQQ")
+_EMPTY_FINGERPRINT = bytes(FINGERPRINT_BYTES)
+
+
+class FingerprintSet:
+    """
+    Set of puzzle fingerprints kept in an mmap'ed open-addressing hash table,
+    so deduplicating banks of millions of puzzles needs no RAM beyond the
+    OS page cache, and the set survives between factory runs. Fingerprints
+    are already uniform hashes: their first 8 bytes pick the slot.
+    """
+    def __init__(self, path, slots=FINGERPRINT_SET_SLOTS):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._create(path, 1 << max(4, (slots - 1).bit_length()))
+        self._open()
+
+    @staticmethod
+    def _create(path, slots):
+        with open(path, "wb") as f:
+            f.write(_FINGERPRINT_SET_HEADER.pack(FINGERPRINT_SET_MAGIC, slots, 0))
+            f.truncate(_FINGERPRINT_SET_HEADER.size + slots * FINGERPRINT_BYTES)
+
+    def _open(self):
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.slots, self.count = _FINGERPRINT_SET_HEADER.unpack_from(self._map, 0)
+        if magic != FINGERPRINT_SET_MAGIC or len(self._map) != _FINGERPRINT_SET_HEADER.size + self.slots * FINGERPRINT_BYTES:
+            self.close()
+            raise ValueError(f"'{self.path}' is not a fingerprint set")
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, fingerprint):
+        """Offset of the slot holding `fingerprint`, or of the empty slot where it would go."""
+        mask = self.slots - 1
+        i = int.from_bytes(fingerprint[:8], "little") & mask
+        data = self._map
+        base = _FINGERPRINT_SET_HEADER.size
+        while True:
+            offset = base + i * FINGERPRINT_BYTES
+            current = data[offset:offset + FINGERPRINT_BYTES]
+            if current == fingerprint or current == _EMPTY_FINGERPRINT:
+                return offset, current == fingerprint
+            i = (i + 1) & mask
+
+    def __contains__(self, fingerprint):
+        return self._slot(fingerprint)[1]
+
+    def add(self, fingerprint):
+        """Adds `fingerprint`; returns True if it was not in the set yet."""
+        if len(fingerprint) != FINGERPRINT_BYTES or fingerprint == _EMPTY_FINGERPRINT:
+            raise ValueError("FingerprintSet expects non-zero 16-byte fingerprints")
+        offset, found = self._slot(fingerprint)
+        if found:
+            return False
+        self._map[offset:offset + FINGERPRINT_BYTES] = fingerprint
+        self.count += 1
+        _FINGERPRINT_SET_HEADER.pack_into(self._map, 0, FINGERPRINT_SET_MAGIC, self.slots, self.count)
+        if self.count > self.slots * FINGERPRINT_SET_MAX_LOAD:
+            self._grow()
+        return True
+
+    def _grow(self):
+        """Rehashes into a table twice as large (via a temporary file, then an atomic rename)."""
+        tmp_path = self.path + ".tmp"
+        self._create(tmp_path, 2 * self.slots)
+        with FingerprintSet(tmp_path) as bigger:
+            base = _FINGERPRINT_SET_HEADER.size
+            for i in range(self.slots):
+                offset = base + i * FINGERPRINT_BYTES
+                fingerprint = self._map[offset:offset + FINGERPRINT_BYTES]
+                if fingerprint != _EMPTY_FINGERPRINT:
+                    bigger.add(fingerprint)
+        self.close()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+
+POOL_RETRY_DELAY = 0.5  # Seconds a PuzzlePool worker waits after a failed puzzle (doubled per failure)
+POOL_MAX_RETRY_DELAY = 30.0
+POOL_MAX_FAILURES = 8   # Consecutive failures before a PuzzlePool worker gives up
+
+
+class PuzzlePool:
+    """
+    Keeps a bounded queue of ready puzzles for every difficulty so callers
+    (e.g. the server's create_game) can take one in O(1).
+
+    Background worker threads refill a queue once it drops below `low_water`
+    and keep generating until it holds `high_water` puzzles. Each worker
+    thread only hands its jobs to a process pool and waits, so generation
+    does not compete with the caller's threads for the GIL. A failing
+    worker backs off, and stops after POOL_MAX_FAILURES failures in a row.
+    If a queue is empty when asked, the puzzle is generated on the caller's
+    thread instead.
+    """
+    DIFFICULTIES = ("very_easy", "easy", "medium", "hard", "expert")
+
+    def __init__(self, difficulties=None, low_water=5, high_water=20, workers=1, size=9, solver="bitmask",
+                 collect_stats=False):
+        if not 0 <= low_water < high_water:
+            raise ValueError("PuzzlePool needs 0 <= low_water < high_water")
+        self.difficulties = tuple(difficulties or self.DIFFICULTIES)
+        self.low_water = low_water
+        self.high_water = high_water
+        self.num_workers = workers
+        self.size = size
+        self.solver = solver
+
+        self._queues = {d: deque() for d in self.difficulties}
+        self._refilling = set(self.difficulties) # Start by prefilling every level
+        self._in_progress = {d: 0 for d in self.difficulties}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._executor = None # ProcessPoolExecutor, tạo trong start()
+        self._running = False
+        self.collect_stats = collect_stats
+        self.stats = {d: SolverStats() for d in self.difficulties} # Aggregated generation stats per level
+        self._fallback_generator = SudokuGenerator(size, solver, collect_stats=collect_stats)
+        self._fallback_lock = threading.Lock()
+
+    def start(self):
+        """Starts the background refill workers."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        # "spawn": tiến trình con không fork giữa lúc các luồng khác đang giữ khóa
+        self._executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"PuzzlePool-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=None):
+        """Stops the workers; puzzles already queued stay available."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self._executor = None
+
+    def get(self, difficulty="medium"):
+        """Returns a (puzzle, solution) pair for `difficulty`."""
+        difficulty = difficulty.lower()
+        queue = self._queues.get(difficulty)
+        if queue is not None:
+            with self._cond:
+                item = queue.popleft() if queue else None
+                if len(queue) < self.low_water and difficulty not in self._refilling:
+                    self._refilling.add(difficulty)
+                    self._cond.notify_all()
+            if item is not None:
+                return item
+        # Hàng đợi rỗng (hoặc độ khó lạ): tạo trực tiếp trên luồng gọi
+        with self._fallback_lock:
+            item = self._fallback_generator.generate_puzzle(difficulty)
+            self._record_stats(difficulty, self._fallback_generator.last_stats)
+            return item
+
+    def available(self, difficulty):
+        """Number of ready puzzles for `difficulty`."""
+        queue = self._queues.get(difficulty.lower())
+        return len(queue) if queue is not None else 0
+
+    def stats_snapshot(self):
+        """Returns {difficulty: SolverStats.as_dict()} for the puzzles generated so far."""
+        with self._cond:
+            return {d: stats.as_dict() for d, stats in self.stats.items() if stats.calls}
+
+    def _record_stats(self, difficulty, stats):
+        if stats is None:
+            return
+        with self._cond:
+            if difficulty not in self.stats:
+                self.stats[difficulty] = SolverStats()
+            self.stats[difficulty].merge(stats)
+
+    def _next_job(self):
+        """Picks the emptiest level still being refilled. Caller holds the lock."""
+        best = None
+        for d in self._refilling:
+            pending = len(self._queues[d]) + self._in_progress[d]
+            if pending < self.high_water and (best is None or pending < best[0]):
+                best = (pending, d)
+        return best[1] if best else None
+
+    def _worker_loop(self):
+        executor = self._executor
+        failures = 0
+        while True:
+            with self._cond:
+                difficulty = self._next_job()
+                while self._running and difficulty is None:
+                    self._cond.wait()
+                    difficulty = self._next_job()
+                if not self._running:
+                    return
+                self._in_progress[difficulty] += 1
+
+            try:
+                puzzle, solution, stats = executor.submit(
+                    _pool_job, self.size, self.solver, difficulty, random.getrandbits(64),
+                    self.collect_stats).result()
+                item = (puzzle, solution)
+                self._record_stats(difficulty, stats)
+                failures = 0
+            except Exception as e:
+                item = None
+                failures += 1
+                if self._running:
+                    print(f"PuzzlePool ERROR: Không thể tạo puzzle '{difficulty}' (lần {failures}): {e}")
+
+            with self._cond:
+                self._in_progress[difficulty] -= 1
+                queue = self._queues[difficulty]
+                if item is not None:
+                    queue.append(item)
+                if len(queue) >= self.high_water:
+                    self._refilling.discard(difficulty)
+                if failures:
+                    if failures >= POOL_MAX_FAILURES:
+                        print(f"PuzzlePool ERROR: {failures} lần lỗi liên tiếp, dừng luồng {threading.current_thread().name}")
+                        return
+                    # Chờ lâu dần trước khi thử lại; stop() đánh thức ngay
+                    self._cond.wait(min(POOL_MAX_RETRY_DELAY, POOL_RETRY_DELAY * 2 ** (failures - 1)))
+
+
 # Example usage (for testing)
 if __name__ == "__main__":
     generator = SudokuGenerator()
@@ -0,0 +1,45 @@
+# conftest.py
+# Các module của STUDOKU import lẫn nhau theo tên phẳng (from sudoku_logic import ...)
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sudoku_logic import SudokuGenerator
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmarks", action="store_true", help="also run the wall-clock benchmark tests")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: wall-clock latency test, skipped unless --benchmarks is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Thời gian thực phụ thuộc máy và tải: chỉ chạy khi được yêu cầu
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="benchmark (run with --benchmarks)")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def puzzles():
+    """(puzzle, solution) pairs of several sizes and levels, the same on every run."""
+    state = random.getstate()
+    random.seed(2024)
+    pairs = []
+    for size, difficulties in ((4, ("easy",)), (6, ("easy", "medium")), (9, ("easy", "medium", "hard", "expert")),
+                               (16, ("easy",))):
+        generator = SudokuGenerator(size=size)
+        for difficulty in difficulties:
+            for _ in range(2):
+                pairs.append(generator.generate_puzzle(difficulty))
+    random.setstate(state)
+    return pairs
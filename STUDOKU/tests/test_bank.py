@@ -0,0 +1,117 @@
+import hashlib
+import random
+
+import pytest
+
+from puzzle_factory import build_bank
+from sudoku_logic import FingerprintSet, PuzzleBank, PuzzleBankWriter, puzzle_fingerprint
+
+
+def _fingerprint(i):
+    return hashlib.blake2b(str(i).encode(), digest_size=16).digest()
+
+
+def test_bank_round_trip(tmp_path, puzzles):
+    path = str(tmp_path / "bank.bin")
+    nines = [pair for pair in puzzles if len(pair[0]) == 9]
+    # Ghi xen kẽ các mức độ: bank phải gom lại theo mức độ, giữ thứ tự trong từng mức
+    records = [("hard" if i % 2 else "easy", puzzle, solution, 1.25 * i, 1000 + i)
+               for i, (puzzle, solution) in enumerate(nines)]
+    with PuzzleBankWriter(path) as writer:
+        for record in records:
+            writer.add(*record)
+        assert writer.count() == len(records)
+
+    with PuzzleBank(path) as bank:
+        assert bank.size == 9
+        assert len(bank) == len(records)
+        for difficulty in ("easy", "hard"):
+            expected = [r for r in records if r[0] == difficulty]
+            assert bank.count(difficulty) == len(expected)
+            for i, (_, puzzle, solution, rating, seed) in enumerate(expected):
+                assert bank.get(difficulty, i) == (puzzle, solution, rating, seed)
+        assert bank.has("easy") and bank.has("easy", size=9)
+        assert not bank.has("easy", size=16) and not bank.has("expert")
+        assert bank.random("expert") is None
+        assert bank.random("hard", random.Random(3))[0] in [r[1] for r in records if r[0] == "hard"]
+        with pytest.raises(IndexError):
+            bank.get("easy", bank.count("easy"))
+
+
+def test_bank_writer_rejects_bad_records(tmp_path, puzzles):
+    puzzle, solution = next(pair for pair in puzzles if len(pair[0]) == 4)
+    writer = PuzzleBankWriter(str(tmp_path / "bank.bin"))
+    with pytest.raises(ValueError):
+        writer.add("easy", puzzle, solution)
+    puzzle, solution = next(pair for pair in puzzles if len(pair[0]) == 9)
+    with pytest.raises(ValueError):
+        writer.add("x" * 17, puzzle, solution)
+
+
+def test_bank_writer_leaves_no_file_after_an_error(tmp_path, puzzles):
+    path = tmp_path / "bank.bin"
+    puzzle, solution = next(pair for pair in puzzles if len(pair[0]) == 9)
+    with pytest.raises(RuntimeError):
+        with PuzzleBankWriter(str(path)) as writer:
+            writer.add("easy", puzzle, solution)
+            raise RuntimeError("stop")
+    assert not path.exists()
+
+
+def test_bank_rejects_other_files(tmp_path):
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"not a bank" * 10)
+    for path in (empty, other):
+        with pytest.raises(ValueError):
+            PuzzleBank(str(path))
+
+
+def test_fingerprint_set_add_and_contains(tmp_path, puzzles):
+    with FingerprintSet(str(tmp_path / "seen.fps")) as seen:
+        puzzle = next(p for p, _ in puzzles if len(p) == 9)
+        fingerprint = puzzle_fingerprint(puzzle)
+        assert fingerprint not in seen
+        assert seen.add(fingerprint)
+        assert fingerprint in seen
+        assert not seen.add(fingerprint)
+        assert len(seen) == 1
+
+
+def test_fingerprint_set_grows_and_persists(tmp_path):
+    path = str(tmp_path / "seen.fps")
+    with FingerprintSet(path, slots=16) as seen:
+        for i in range(200): # Vượt tải 0.7 của 16 ô nhiều lần: bảng phải nhân đôi vài lần
+            assert seen.add(_fingerprint(i))
+        assert seen.slots > 16
+        assert len(seen) == 200
+
+    with FingerprintSet(path) as seen:
+        assert len(seen) == 200
+        assert all(_fingerprint(i) in seen for i in range(200))
+        assert _fingerprint(200) not in seen
+        assert not seen.add(_fingerprint(5))
+
+
+def test_fingerprint_set_rejects_bad_input(tmp_path):
+    with FingerprintSet(str(tmp_path / "seen.fps"), slots=16) as seen:
+        for fingerprint in (b"short", bytes(16)):
+            with pytest.raises(ValueError):
+                seen.add(fingerprint)
+    other = tmp_path / "other.fps"
+    other.write_bytes(b"not a fingerprint set" * 4)
+    with pytest.raises(ValueError):
+        FingerprintSet(str(other))
+
+
+def test_build_bank_stops_when_a_level_runs_out_of_puzzles(tmp_path):
+    path = str(tmp_path / "bank.bin")
+    # Bảng 4x4 rất dễ chỉ có vài chục puzzle khác nhau
+    results = build_bank(path, 500, ["very_easy"], size=4, workers=1, seed=5, report=lambda message: None,
+                         max_duplicate_streak=200)
+    result = results["very_easy"]
+    assert 0 < result['count'] < 500
+    assert result['shortfall'] == 500 - result['count']
+    with PuzzleBank(path) as bank:
+        assert bank.count("very_easy") == result['count']
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from sudoku_logic import (BitmaskSolver, batch_apply_random_transforms, batch_check_boards, batch_conflict_counts,
+                          generate_puzzle_batch, puzzle_fingerprint)
+from test_tracker import _recount, _units
+
+
+def _by_size(puzzles):
+    sizes = {}
+    for puzzle, solution in puzzles:
+        sizes.setdefault(len(puzzle), []).append((puzzle, solution))
+    return sizes
+
+
+def _scramble(grid, size, rate):
+    """A copy of `grid` with a fraction `rate` of its cells set to random values (0 included)."""
+    return [[random.randint(0, size) if random.random() < rate else v for v in row] for row in grid]
+
+
+def test_batch_checks_match_a_recount(puzzles):
+    random.seed(8)
+    for size, pairs in _by_size(puzzles).items():
+        units = _units(size, None)
+        boards, solutions = [], []
+        for puzzle, solution in pairs:
+            for board in (puzzle, solution, _scramble(puzzle, size, 0.3), _scramble(solution, size, 0.1)):
+                boards.append(board)
+                solutions.append(solution)
+        result = batch_check_boards(np.array(boards), np.array(solutions))
+        assert batch_conflict_counts(boards).tolist() == result['conflicts'].tolist()
+        for i, (board, solution) in enumerate(zip(boards, solutions)):
+            filled, mismatches, conflicts, _, _ = _recount(board, solution, units)
+            complete = filled == size * size
+            assert bool(result['complete'][i]) == complete
+            assert result['conflicts'][i] == conflicts
+            assert bool(result['correct'][i]) == (complete and mismatches == 0)
+        # Một bảng (size, size) được coi như lô một phần tử
+        assert batch_conflict_counts(boards[2]).tolist() == [_recount(boards[2], solutions[2], units)[2]]
+
+
+def test_batch_transforms_keep_puzzles_valid(puzzles):
+    random.seed(9)
+    for size, pairs in _by_size(puzzles).items():
+        base_p = np.array([p for p, _ in pairs] * 3, dtype=np.int8)
+        base_s = np.array([s for _, s in pairs] * 3, dtype=np.int8)
+        out_p, out_s = batch_apply_random_transforms(base_p, base_s)
+        assert out_p.shape == base_p.shape and out_s.shape == base_s.shape
+        checked = batch_check_boards(out_s)
+        assert checked['complete'].all() and not checked['conflicts'].any()
+        # Ô cho sẵn vẫn khớp lời giải của chính nó, số ô cho sẵn giữ nguyên
+        assert ((out_p == 0) | (out_p == out_s)).all()
+        assert ((out_p != 0).sum(axis=(1, 2)) == (base_p != 0).sum(axis=(1, 2))).all()
+        solver = BitmaskSolver(size)
+        for puzzle, solution in zip(out_p.tolist(), out_s.tolist()):
+            assert solver.count_solutions(puzzle) == 1
+            assert solver.solve(puzzle) == solution
+
+
+def test_puzzle_batch_from_base_puzzles():
+    random.seed(10)
+    puzzles, solutions = generate_puzzle_batch(6, "easy", base_puzzles=2)
+    assert puzzles.shape == solutions.shape == (6, 9, 9)
+    checked = batch_check_boards(puzzles, solutions)
+    assert not checked['complete'].any() and not checked['conflicts'].any() and not checked['correct'].any()
+    assert batch_check_boards(solutions, solutions)['correct'].all()
+    assert len({puzzle_fingerprint(puzzle) for puzzle in puzzles.tolist()}) == 2
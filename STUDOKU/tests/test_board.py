@@ -0,0 +1,98 @@
+import json
+import os
+import random
+
+import pytest
+
+from sudoku_logic import SudokuBoard, SudokuGenerator
+
+LEGACY_SAVE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sudoku_save.json")
+
+
+def _random_board(size, seed):
+    """A board of `size` with random values, fixed cells, pencil marks and error flags."""
+    random.seed(seed)
+    grid = [[random.choice([0, random.randint(1, size)]) for _ in range(size)] for _ in range(size)]
+    fixed_mask = [[bool(v) and random.random() < 0.5 for v in row] for row in grid]
+    pencil_data = {(r, c): set(random.sample(range(1, size + 1), random.randint(1, size)))
+                   for r in range(size) for c in range(size) if not grid[r][c] and random.random() < 0.5}
+    error_cells = {(r, c) for r in range(size) for c in range(size) if grid[r][c] and random.random() < 0.1}
+    return grid, fixed_mask, pencil_data, error_cells
+
+
+def _state(board):
+    return board.to_grid(), board.fixed_mask(), board.pencil_dict(), board.error_cells()
+
+
+@pytest.mark.parametrize("size", [4, 6, 9, 16, 25])
+def test_board_round_trips(size):
+    grid, fixed_mask, pencil_data, error_cells = _random_board(size, size)
+    board = SudokuBoard.from_grid(grid, fixed_mask, pencil_data, error_cells)
+    assert _state(board) == (grid, fixed_mask, pencil_data, error_cells)
+    assert [list(row) for row in board] == grid
+    assert _state(SudokuBoard.from_bytes(board.to_bytes(), size)) == _state(board)
+    # Qua JSON như file lưu game
+    restored, fields = SudokuBoard.from_save(json.loads(json.dumps({**board.to_save(), 'score': 7})))
+    assert _state(restored) == _state(board) and fields == {'size': size, 'score': 7}
+
+
+def test_pencil_marks_round_trip():
+    board = SudokuBoard.from_grid([[0] * 25 for _ in range(25)]) # 25x25: mặt nạ cần hơn 16 bit
+    for num in (1, 16, 17, 25):
+        board.toggle_pencil(24, 24, num)
+    board.toggle_pencil(0, 0, 3)
+    board.toggle_pencil(0, 0, 3)
+    assert board.pencil_marks(24, 24) == {1, 16, 17, 25}
+    assert board.pencil_dict() == {(24, 24): {1, 16, 17, 25}}
+    restored = SudokuBoard.from_bytes(board.to_bytes(), 25)
+    assert restored.pencil_dict() == board.pencil_dict()
+    copy = restored.copy()
+    copy.clear_pencil(24, 24)
+    copy.set(0, 0, 5)
+    assert restored.pencil_marks(24, 24) == {1, 16, 17, 25} and restored.get(0, 0) == 0
+    assert SudokuBoard.from_grid(restored.to_grid(), pencil_data=restored.pencil_dict()).to_bytes() == \
+        restored.to_bytes()
+
+
+def test_board_writes_through_rows():
+    solution = SudokuGenerator(size=6).new_solution_grid()
+    board = SudokuBoard.from_grid([[0] * 6 for _ in range(6)])
+    for r, row in enumerate(solution):
+        for c, v in enumerate(row):
+            board[r][c] = v
+    assert board.to_grid() == solution and board.values_view()[7] == solution[1][1]
+    assert not any(board.is_fixed(r, c) for r in range(6) for c in range(6))
+    board.set_error(2, 3)
+    board.set_error(2, 3, False)
+    assert board.error_cells() == set()
+
+
+def test_legacy_save_loads():
+    with open(LEGACY_SAVE) as f:
+        data = json.load(f)
+    board, fields = SudokuBoard.from_save(data)
+    assert board.to_grid() == data['board_data']
+    assert board.fixed_mask() == data['fixed_mask']
+    assert board.pencil_dict() == {} and board.error_cells() == set(map(tuple, data['error_cells']))
+    assert fields == {k: v for k, v in data.items()
+                      if k not in ('board_data', 'fixed_mask', 'pencil_data', 'error_cells')}
+    # Lưu lại ở dạng gọn rồi đọc ra: cùng bảng, cùng các trường khác
+    saved = json.loads(json.dumps({**fields, **board.to_save()}))
+    again, again_fields = SudokuBoard.from_save(saved)
+    assert _state(again) == _state(board)
+    assert again_fields == {**fields, 'size': 9}
+
+
+def test_legacy_save_with_pencil_and_errors():
+    grid, fixed_mask, pencil_data, error_cells = _random_board(9, 12)
+    data = {
+        'board_data': grid,
+        'fixed_mask': fixed_mask,
+        'pencil_data': {f"{r},{c}": sorted(marks) for (r, c), marks in pencil_data.items()},
+        'error_cells': [list(cell) for cell in error_cells],
+        'mistakes': 2,
+    }
+    board, fields = SudokuBoard.from_save(json.loads(json.dumps(data)))
+    assert _state(board) == (grid, fixed_mask, pencil_data, error_cells)
+    assert fields == {'mistakes': 2}
+    assert SudokuBoard.from_save({'mistakes': 2}) == (None, {'mistakes': 2})
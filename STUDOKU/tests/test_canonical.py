@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+import sudoku_logic
+from sudoku_logic import (apply_transform, box_dimensions, canonical_form, invert_transform, puzzle_fingerprint,
+                          random_transform)
+
+
+def test_canonical_form_ignores_random_transforms(puzzles):
+    random.seed(7)
+    for puzzle, _ in puzzles:
+        canonical, _ = canonical_form(puzzle)
+        for _ in range(5):
+            image = apply_transform(puzzle, random_transform(len(puzzle)))
+            assert canonical_form(image)[0] == canonical
+            assert puzzle_fingerprint(image) == puzzle_fingerprint(puzzle)
+
+
+def test_canonical_transform_maps_puzzle_onto_canonical_grid(puzzles):
+    for puzzle, _ in puzzles:
+        canonical, transform = canonical_form(puzzle)
+        assert apply_transform(puzzle, transform) == canonical
+        assert apply_transform(canonical, invert_transform(transform)) == puzzle
+
+
+def test_invert_transform_round_trip(puzzles):
+    random.seed(11)
+    for _, solution in puzzles:
+        transform = random_transform(len(solution))
+        image = apply_transform(solution, transform)
+        assert apply_transform(image, invert_transform(transform)) == solution
+
+
+def test_different_puzzles_get_different_fingerprints(puzzles):
+    puzzle = next(p for p, _ in puzzles if len(p) == 9)
+    r, c = next((r, c) for r in range(9) for c in range(9) if puzzle[r][c])
+    fewer = [row[:] for row in puzzle]
+    fewer[r][c] = 0
+    assert puzzle_fingerprint(fewer) != puzzle_fingerprint(puzzle)
+
+
+def test_canonical_form_on_complete_grid(puzzles):
+    random.seed(13)
+    solution = next(s for p, s in puzzles if len(p) == 9)
+    canonical, transform = canonical_form(solution)
+    assert apply_transform(solution, transform) == canonical
+    image = apply_transform(solution, random_transform(9))
+    assert canonical_form(image)[0] == canonical
+
+
+def test_canonical_form_on_dense_grids_tries_few_rows(monkeypatch, puzzles):
+    # Lưới dày từng hòa nhau trên mọi thứ tự cột ở hàng đầu; nay số ảnh hàng được thử vẫn nhỏ như một đề thường
+    random.seed(17)
+    solutions = [s for p, s in puzzles if len(p) == 9]
+    grids = solutions + [[[v if random.random() < 0.9 else 0 for v in row] for row in s] for s in solutions]
+    tried = []
+    image, refine = sudoku_logic._canon_image, sudoku_logic._canon_refine
+    monkeypatch.setattr(sudoku_logic, "_canon_image", lambda *args: tried.append(1) or image(*args))
+
+    def counted_refine(*args):
+        results = refine(*args)
+        tried.extend(results)
+        return results
+
+    monkeypatch.setattr(sudoku_logic, "_canon_refine", counted_refine)
+    for grid in grids:
+        tried.clear()
+        canonical, transform = canonical_form(grid)
+        assert apply_transform(grid, transform) == canonical
+        assert len(tried) <= 9 * sudoku_logic.CANONICAL_MAX_TIES
+        assert canonical_form(apply_transform(grid, random_transform(9)))[0] == canonical
+
+
+@pytest.mark.parametrize("size", [9, 16])
+def test_symmetric_grids_keep_few_tied_transforms(monkeypatch, size):
+    # Lưới mẫu dịch hàng và lưới chỉ có một hàng: gần như mọi thứ tự hòa nhau, trước đây tốn hàng giây
+    box_rows, box_cols = box_dimensions(size)
+    shifted = [[(box_cols * (r % box_rows) + r // box_rows + c) % size + 1 for c in range(size)] for r in range(size)]
+    one_row = [list(range(1, size + 1))] + [[0] * size for _ in range(size - 1)]
+    keys = []
+    state_key = sudoku_logic._canon_state_key
+    monkeypatch.setattr(sudoku_logic, "_canon_state_key", lambda *args: keys.append(1) or state_key(*args))
+    for grid in (shifted, one_row):
+        keys.clear()
+        canonical, transform = canonical_form(grid)
+        assert apply_transform(grid, transform) == canonical
+        assert len(keys) <= size * sudoku_logic.CANONICAL_MAX_TIES
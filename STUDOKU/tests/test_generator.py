@@ -0,0 +1,129 @@
+import random
+import time
+
+import pytest
+
+import sudoku_logic
+from sudoku_logic import (MINIMAL_GENERATION_TIMEOUT, SYMMETRIES, BitmaskSolver, SolverStats, SudokuGenerator,
+                          symmetry_orbits)
+
+
+class _TickingClock:
+    """Stand-in for the time module of sudoku_logic: every monotonic() read moves the clock one tick on."""
+    TICK = 1 / 64 # Lũy thừa của 2: cộng dồn không sai số làm tròn
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        self.now += self.TICK
+        return self.now
+
+    perf_counter = staticmethod(time.perf_counter)
+
+
+@pytest.mark.parametrize("size", [16, 25])
+def test_generation_stays_within_timeout(monkeypatch, size):
+    random.seed(size)
+    clock = _TickingClock()
+    monkeypatch.setattr(sudoku_logic, "time", clock)
+    generator = SudokuGenerator(size=size)
+    timeout = 0.5
+    for difficulty in ("hard", "expert"):
+        start = clock.now
+        puzzle, solution = generator.generate_puzzle(difficulty, timeout=timeout)
+        # Đồng hồ chỉ chạy khi được đọc: quá hạn thì dừng ở lần kiểm tra kế tiếp, không mở việc mới
+        assert clock.now - start <= timeout + 3 * clock.TICK, (difficulty, clock.now - start)
+        assert all(not v or v == solution[r][c] for r, row in enumerate(puzzle) for c, v in enumerate(row))
+        assert generator.last_rating['solved']
+
+
+@pytest.mark.parametrize("symmetry", SYMMETRIES)
+def test_symmetric_puzzles_keep_their_clue_pattern(symmetry):
+    random.seed(5)
+    puzzle, solution = SudokuGenerator().generate_puzzle("hard", symmetry=symmetry)
+    for orbit in symmetry_orbits(9, symmetry):
+        assert len({bool(puzzle[r][c]) for r, c in orbit}) == 1, orbit
+    assert BitmaskSolver(9).count_solutions(puzzle) == 1
+    assert BitmaskSolver(9).solve(puzzle) == solution
+
+
+@pytest.mark.parametrize("symmetry", (None,) + SYMMETRIES)
+def test_minimal_puzzles_need_every_clue(symmetry):
+    random.seed(7)
+    generator = SudokuGenerator()
+    # Thời gian rộng: một lần xóa bị cắt ngang thì đề không còn tối thiểu
+    puzzle, solution = generator.generate_puzzle("expert", timeout=5, symmetry=symmetry, minimal=True)
+    solver = BitmaskSolver(9)
+    assert solver.count_solutions(puzzle) == 1
+    assert solver.solve(puzzle) == solution
+    for orbit in symmetry_orbits(9, symmetry):
+        if puzzle[orbit[0][0]][orbit[0][1]]:
+            trial = [row[:] for row in puzzle]
+            for r, c in orbit:
+                trial[r][c] = 0
+            assert solver.count_solutions(trial) == 2, orbit
+    if symmetry is None:
+        assert generator.is_minimal()
+
+
+def test_minimal_generation_stays_within_its_budget(monkeypatch):
+    random.seed(9)
+    clock = _TickingClock()
+    monkeypatch.setattr(sudoku_logic, "time", clock)
+    generator = SudokuGenerator()
+    for _ in range(5):
+        start = clock.now
+        puzzle, solution = generator.generate_puzzle("expert", minimal=True)
+        assert clock.now - start <= MINIMAL_GENERATION_TIMEOUT + 3 * clock.TICK, clock.now - start
+        assert BitmaskSolver(9).count_solutions(puzzle) == 1
+
+
+def test_candidate_budget_stops_fresh_candidates(monkeypatch):
+    random.seed(11)
+    generator = SudokuGenerator()
+    searched = []
+    search = generator._search_rated_candidate
+    monkeypatch.setattr(generator, "_search_rated_candidate", lambda *args: searched.append(1) or search(*args))
+    monkeypatch.setattr(sudoku_logic, "CANDIDATE_BUDGET", 0.0)
+    for _ in range(5): # Hết ngân sách ngay: đúng một ứng viên mỗi lần, vẫn là đề duy nhất
+        puzzle, solution = generator.generate_puzzle("hard")
+        assert BitmaskSolver(9).count_solutions(puzzle) == 1
+    assert len(searched) == 5
+    # Có timeout tường minh: tìm tiếp tới khi vào dải điểm
+    generator.generate_puzzle("hard", timeout=5)
+    assert generator.in_band("hard")
+
+
+def test_collected_stats_count_nodes_and_phases():
+    random.seed(10)
+    generator = SudokuGenerator(collect_stats=True)
+    runs = []
+    for difficulty in ("hard", "expert"): # Đề dễ có thể không cần tìm kiếm nào (0 nút)
+        generator.generate_puzzle(difficulty)
+        stats = generator.last_stats
+        assert stats.calls == 1 and stats.nodes > 0 and stats.propagations > 0
+        assert {"solution", "carve", "rate", "total"} <= set(stats.phase_times)
+        assert stats.phase_times["total"] >= stats.phase_times["carve"] > 0
+        runs.append(stats)
+    first, second = runs
+    total = generator.total_stats
+    assert (total.calls, total.nodes, total.backtracks, total.propagations) == \
+        (2, first.nodes + second.nodes, first.backtracks + second.backtracks, first.propagations + second.propagations)
+    for phase in set(first.phase_times) | set(second.phase_times):
+        assert total.phase_times[phase] == pytest.approx(first.phase_times.get(phase, 0.0) +
+                                                         second.phase_times.get(phase, 0.0))
+    assert SolverStats().merge(first).merge(second).as_dict() == total.as_dict()
+
+
+@pytest.mark.benchmark
+def test_expert_latency_p99():
+    random.seed(12)
+    generator = SudokuGenerator()
+    times = []
+    for _ in range(200):
+        start = time.perf_counter()
+        generator.generate_puzzle("expert")
+        times.append(time.perf_counter() - start)
+    times.sort()
+    assert times[int(0.99 * len(times))] < 0.1, times[-5:]
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from puzzle_io import parse_line
+from sudoku_logic import BitmaskSolver, DifficultyRater, HintEngine, SudokuBoard, SudokuGenerator
+from test_rater import KNOWN_RATINGS
+
+
+def _recount(engine, variant=None):
+    """(candidates, naked, hidden, dead) of the engine's board by brute force."""
+    size = engine.size
+    values = engine.values
+    cands = []
+    for cell, v in enumerate(values):
+        if v:
+            cands.append(0)
+            continue
+        taken = {values[p] for p in engine.peers[cell]}
+        if variant is not None: # Ô liên quan theo nước mã cũng loại ứng viên
+            taken.update(values[p] for p in variant.extra_peers[cell])
+        cands.append(sum(1 << (d - 1) for d in range(1, size + 1) if d not in taken))
+    naked = {cell for cell, m in enumerate(cands) if m and not m & (m - 1)}
+    hidden = {(u, d) for u, unit in enumerate(engine.units) for d in range(size)
+              if sum(1 for cell in unit if cands[cell] >> d & 1) == 1}
+    dead = {cell for cell, m in enumerate(cands) if not values[cell] and not m}
+    return cands, naked, hidden, dead
+
+
+@pytest.mark.parametrize("line, hardest, score, counts", KNOWN_RATINGS, ids=[case[1] for case in KNOWN_RATINGS])
+def test_hints_follow_the_rater_ladder(line, hardest, score, counts):
+    puzzle = parse_line(line)
+    solution = BitmaskSolver(9).solve(puzzle)
+    engine = HintEngine(SudokuBoard.from_grid(puzzle))
+    weights = DifficultyRater(9).weights
+    techniques = set()
+    while (hint := engine.hint()) is not None:
+        r, c = hint['cell']
+        assert hint['digit'] == solution[r][c], hint
+        for er, ec, digit, _ in hint['eliminations']: # Chỉ loại những số không phải lời giải
+            assert not puzzle[er][ec] and digit != solution[er][ec], hint
+        if hint['technique'] == "hidden_single":
+            kind, index = hint['unit']
+            assert kind in HintEngine.UNIT_KINDS and 0 <= index < 9
+        techniques.add(hint['technique'])
+        engine.set(r, c, hint['digit'])
+    if hardest == "guess": # Vượt quá các kỹ thuật logic: gợi ý dừng giữa chừng
+        assert 0 in engine.values
+        assert max(techniques, key=weights.get) == "naked_triple"
+    else:
+        assert 0 not in engine.values
+        assert max(techniques, key=weights.get) == hardest
+
+
+def test_hint_reports_a_cell_without_candidates():
+    line = KNOWN_RATINGS[0][0]
+    puzzle = parse_line(line)
+    engine = HintEngine(puzzle)
+    # Ô (0, 3) chỉ còn số 3; đặt 3 vào một ô cùng hàng khiến nó hết ứng viên
+    assert engine.candidate_digits(0, 3) == {3}
+    engine.set(1, 3, 3)
+    assert engine.hint() == {'cell': (0, 3), 'digit': None, 'technique': "contradiction", 'unit': None,
+                             'eliminations': []}
+    engine.set(1, 3, 0)
+    assert engine.hint()['technique'] == "naked_single"
+
+
+@pytest.mark.parametrize("variant", [None, "anti_knight"])
+def test_candidates_match_a_recount(puzzles, variant):
+    random.seed(16)
+    if variant is None:
+        puzzle, solution = next(pair for pair in puzzles if len(pair[0]) == 9)
+        rules = None
+    else:
+        generator = SudokuGenerator(variant=variant)
+        puzzle, solution = generator.generate_puzzle("easy")
+        rules = generator.variant
+    size = len(puzzle)
+    engine = HintEngine(puzzle, rules)
+    history = []
+    for step in range(300):
+        r, c = random.randrange(size), random.randrange(size)
+        if puzzle[r][c]:
+            continue
+        if history and random.random() < 0.4: # Hoàn tác nước gần nhất
+            r, c, old = history.pop()
+            engine.set(r, c, old)
+        else:
+            history.append((r, c, engine.values[r * size + c]))
+            engine.set(r, c, random.choice([0, solution[r][c], random.randint(1, size)]))
+        cell = r * size + c
+        related = set(engine.peers[cell]) | (set(rules.extra_peers[cell]) if rules is not None else set()) | {cell}
+        assert {rr * size + cc for rr, cc in engine.take_changed()} <= related
+        if step % 10 == 0:
+            cands, naked, hidden, dead = _recount(engine, rules)
+            assert engine.cands == cands
+            assert (engine.naked, engine.hidden, engine.dead) == (naked, hidden, dead)
+    while history:
+        r, c, old = history.pop()
+        engine.set(r, c, old)
+    assert engine.values == [v for row in puzzle for v in row]
+    assert engine.cands == _recount(engine, rules)[0]
@@ -0,0 +1,156 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from protocol import (FRAME_HEADER, FrameError, FrameReader, decode_payload, encode_frame, encode_payload, frame,
+                      read_message)
+
+MESSAGES = [{'command': 'hello', 'protocol': 1}, {'type': 'board', 'cells': list(range(81)), 'note': "a\nb"},
+            {'empty': ''}]
+
+
+def _send_in_pieces(sock, data, piece):
+    """Sends `data` `piece` bytes at a time from another thread, pausing so the reader sees partial reads."""
+    def run():
+        for i in range(0, len(data), piece):
+            sock.sendall(data[i:i + piece])
+            time.sleep(0.001)
+        sock.close()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+@pytest.mark.parametrize("framing", ["length", "newline"])
+@pytest.mark.parametrize("piece", [1, 7, 4096])
+def test_frame_reader_reassembles_fragments(framing, piece):
+    left, right = socket.socketpair()
+    data = b"".join(encode_frame(message, framing) for message in MESSAGES)
+    thread = _send_in_pieces(right, data, piece)
+    try:
+        reader = FrameReader(left, framing)
+        assert [reader.read() for _ in MESSAGES] == MESSAGES
+        with pytest.raises(EOFError):
+            reader.read()
+    finally:
+        thread.join()
+        left.close()
+
+
+def test_frame_reader_hands_pending_bytes_to_length_frames():
+    # Hello theo dòng, rồi frame có độ dài đến cùng một lần gửi: phần thừa nằm trong pending
+    left, right = socket.socketpair()
+    try:
+        right.sendall(encode_frame(MESSAGES[0], "newline") + encode_frame(MESSAGES[1], "length")
+                      + encode_frame(MESSAGES[2], "length"))
+        reader = FrameReader(left)
+        assert reader.read() == MESSAGES[0]
+        assert reader.pending # Đã nhận trước một phần frame kế tiếp
+        reader.framing = "length"
+        assert reader.read() == MESSAGES[1]
+        assert reader.read() == MESSAGES[2]
+        assert not reader.pending
+    finally:
+        left.close()
+        right.close()
+
+
+def test_frame_reader_skips_blank_lines():
+    left, right = socket.socketpair()
+    try:
+        right.sendall(b"\n  \n" + encode_frame(MESSAGES[0], "newline"))
+        assert FrameReader(left).read() == MESSAGES[0]
+    finally:
+        left.close()
+        right.close()
+
+
+@pytest.mark.parametrize("framing, cut", [("length", 2), ("length", FRAME_HEADER.size + 3), ("newline", 5)])
+def test_frame_reader_eof_mid_frame(framing, cut):
+    left, right = socket.socketpair()
+    try:
+        right.sendall(encode_frame(MESSAGES[1], framing)[:cut])
+        right.close()
+        with pytest.raises(EOFError):
+            FrameReader(left, framing).read()
+    finally:
+        left.close()
+
+
+def test_frame_reader_rejects_oversize_frames():
+    left, right = socket.socketpair()
+    try:
+        right.sendall(FRAME_HEADER.pack(101) + b"x" * 101)
+        with pytest.raises(FrameError):
+            FrameReader(left, "length", max_frame_size=100).read()
+        right.sendall(b"x" * 300)
+        with pytest.raises(FrameError):
+            FrameReader(left, "newline", max_frame_size=100).read()
+    finally:
+        left.close()
+        right.close()
+
+
+@pytest.mark.parametrize("payload", [b"[1, 2]", b"42", b"{not json", b"\xff\xfe"])
+def test_non_object_payloads_are_frame_errors(payload):
+    with pytest.raises(FrameError):
+        decode_payload(payload)
+    left, right = socket.socketpair()
+    try:
+        right.sendall(frame(payload, "length"))
+        with pytest.raises(FrameError):
+            FrameReader(left, "length").read()
+    finally:
+        left.close()
+        right.close()
+
+
+def test_frame_refuses_oversize_payloads_and_unknown_framings():
+    with pytest.raises(FrameError):
+        frame(b"x" * ((1 << 20) + 1), "length")
+    with pytest.raises(FrameError):
+        frame(encode_payload(MESSAGES[0]), "xml")
+
+
+def _read_all(chunks, framing, limit=1 << 16, max_frame_size=1 << 20):
+    """Feeds `chunks` to a StreamReader (then EOF) and collects read_message() results until None."""
+    async def run():
+        reader = asyncio.StreamReader(limit=limit)
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        messages = []
+        while True:
+            message = await read_message(reader, framing, max_frame_size)
+            if message is None:
+                return messages
+            messages.append(message)
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("framing", ["length", "newline"])
+@pytest.mark.parametrize("piece", [1, 7, 4096])
+def test_read_message_reassembles_fragments(framing, piece):
+    data = b"".join(encode_frame(message, framing) for message in MESSAGES)
+    chunks = [data[i:i + piece] for i in range(0, len(data), piece)]
+    assert _read_all(chunks, framing) == MESSAGES
+
+
+@pytest.mark.parametrize("framing", ["length", "newline"])
+def test_read_message_eof_mid_frame_ends_the_stream(framing):
+    data = encode_frame(MESSAGES[0], framing) + encode_frame(MESSAGES[1], framing)[:9]
+    assert _read_all([data], framing) == [MESSAGES[0]]
+
+
+def test_read_message_rejects_oversize_and_bad_frames():
+    with pytest.raises(FrameError):
+        _read_all([FRAME_HEADER.pack(101) + b"x" * 101], "length", max_frame_size=100)
+    with pytest.raises(FrameError):
+        _read_all([b"x" * 300 + b"\n"], "newline", limit=1000, max_frame_size=100)
+    with pytest.raises(FrameError):
+        _read_all([b"x" * 300 + b"\n"], "newline", limit=100) # Vượt giới hạn của StreamReader
+    with pytest.raises(FrameError):
+        _read_all([frame(b"[1]", "length")], "length")
@@ -0,0 +1,106 @@
+import io
+
+import pytest
+
+from puzzle_io import (detect_format, format_line, format_sadman, format_sdk, iter_puzzles_from_lines, parse_line,
+                       read_line_puzzles, read_puzzles, read_sadman_puzzles, read_sdk_puzzles, write_puzzles)
+
+LINE = "53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79"
+
+
+def test_parse_line_reads_blanks_and_ignores_trailing_fields():
+    grid = parse_line(LINE + ",3.4 name")
+    assert grid[0] == [5, 3, 0, 0, 7, 0, 0, 0, 0]
+    assert grid[8] == [0, 0, 0, 0, 8, 0, 0, 7, 9]
+    assert parse_line(LINE.replace(".", "0")) == grid
+    assert format_line(grid) == LINE
+
+
+def test_parse_line_sizes_and_letters(puzzles):
+    for puzzle, _ in puzzles:
+        assert parse_line(format_line(puzzle, blank="0")) == puzzle
+    sixteen = next(p for p, _ in puzzles if len(p) == 16)
+    assert any(ch in "ABCDEFG" for ch in format_line(sixteen))
+
+
+@pytest.mark.parametrize("text", [LINE[:80], LINE + LINE, LINE[:40] + "x" + LINE[41:]])
+def test_parse_line_rejects_wrong_cell_counts(text):
+    with pytest.raises(ValueError):
+        parse_line(text)
+
+
+def test_parse_line_rejects_digits_above_the_board_size():
+    with pytest.raises(ValueError, match="Line 2: Digit 'A' is too large for a 9x9 board"):
+        parse_line("A" + LINE[1:], 2)
+    with pytest.raises(ValueError, match="Digit '5' is too large for a 4x4 board"):
+        parse_line("1234" * 3 + "5...")
+
+
+def test_read_line_puzzles_skips_comments_and_names_bad_lines():
+    lines = ["# header", "", LINE, LINE[:80], LINE]
+    reader = read_line_puzzles(lines)
+    assert next(reader) == parse_line(LINE)
+    with pytest.raises(ValueError, match="Line 4"):
+        next(reader)
+
+
+def test_read_sdk_puzzles(puzzles):
+    nine = next(p for p, _ in puzzles if len(p) == 9)
+    four = next(p for p, _ in puzzles if len(p) == 4)
+    text = "# two puzzles\n" + format_sdk(nine) + "\n\n" + format_sdk(four)
+    assert list(read_sdk_puzzles(text.splitlines())) == [nine, four]
+
+
+@pytest.mark.parametrize("bad_row, message", [
+    ("12x......", "Line 3: Not a valid SDK row"),   # Ký tự lạ
+    ("1........5", "Line 3: SDK row has 10 cells"),  # Dài hơn hàng đầu
+    ("1.......", "Line 3: SDK row has 8 cells"),     # Ngắn hơn hàng đầu
+    ("1.......A", "Line 3: Digit 'A' is too large"), # Số 10 trên bảng 9x9
+])
+def test_read_sdk_puzzles_names_malformed_lines(bad_row, message):
+    lines = ["# puzzle", "53..7....", bad_row] + ["........."] * 7
+    with pytest.raises(ValueError, match=message):
+        list(read_sdk_puzzles(lines))
+
+
+def test_read_sdk_puzzles_rejects_bad_widths_and_truncation():
+    with pytest.raises(ValueError, match="Line 1"):
+        list(read_sdk_puzzles(["1234567"])) # 7 không phải kích thước bảng
+    with pytest.raises(ValueError, match="end of input"):
+        list(read_sdk_puzzles(["53..7...."] * 5))
+
+
+def test_read_sadman_puzzles(puzzles):
+    nine = next(p for p, _ in puzzles if len(p) == 9)
+    six = next(p for p, _ in puzzles if len(p) == 6)
+    text = ("[Options]\nAuthor=test\n" + format_sadman(nine) + "[State]\n" + format_sdk(nine)
+            + "[Puzzle]\n\n" + format_sdk(six))
+    assert list(read_sadman_puzzles(text.splitlines())) == [nine, six]
+
+
+def test_read_sadman_puzzles_names_malformed_lines():
+    lines = ["[Puzzle]", "53..7....", "6..195..."] + ["........."] * 2 + ["[State]"]
+    with pytest.raises(ValueError, match="Line 6: Incomplete SadMan puzzle: 4 of 9 rows"):
+        list(read_sadman_puzzles(lines))
+    with pytest.raises(ValueError, match="Line 3: Not a valid SadMan row"):
+        list(read_sadman_puzzles(["[Puzzle]", "53..7....", "6..1?5..."]))
+    with pytest.raises(ValueError, match="end of input"):
+        list(read_sadman_puzzles(["[Puzzle]", "53..7...."]))
+
+
+def test_detect_format():
+    assert detect_format(LINE) == "line"
+    assert detect_format("53..7....") == "sdk"
+    assert detect_format("[Puzzle]") == "sadman"
+    assert list(iter_puzzles_from_lines(["# only comments", ""])) == []
+    with pytest.raises(ValueError):
+        list(iter_puzzles_from_lines([LINE], fmt="csv"))
+
+
+@pytest.mark.parametrize("fmt", ["line", "sdk", "sadman"])
+def test_write_then_read_round_trip(fmt, puzzles):
+    grids = [p for p, _ in puzzles if len(p) == 9]
+    out = io.StringIO()
+    assert write_puzzles(grids, out, fmt=fmt) == len(grids)
+    out.seek(0)
+    assert list(read_puzzles(out)) == grids
@@ -0,0 +1,79 @@
+import pytest
+
+from puzzle_io import parse_line
+from sudoku_logic import BitmaskSolver, DifficultyRater, SudokuVariant
+
+# (puzzle, hardest technique, score, technique counts) - one 9x9 puzzle per rung of the ladder
+KNOWN_RATINGS = [
+    ("617.42859.5368972.82...7.342.471.56.1.89.524757.82419..415.63.238.291..6762438915", "naked_single", 1.0,
+     {'naked_single': 20}),
+    (".79..8542......371.2..5....69.8.3.15..154.9..5..9.6.8...4...2...1.2.....2.....139", "hidden_single", 1.2,
+     {'hidden_single': 8, 'naked_single': 40}),
+    ("743..9.....576.....6.....93.1...8.5..5.197.3.4.9..6...5.1.84..7..86...1.6..9...8.", "pointing_pair", 2.65,
+     {'naked_single': 45, 'hidden_single': 4, 'pointing_pair': 1}),
+    (".5............25.6.238.........7..15...4.18..16.5........34.697..4......9..7.8...", "box_line_reduction", 3.05,
+     {'naked_single': 48, 'hidden_single': 8, 'pointing_pair': 3, 'box_line_reduction': 2}),
+    (".7...4..88657..34.2....8..99.....2...34.2.86.....73.5...31...96.9.6..1...8..49..5", "naked_pair", 3.1,
+     {'naked_single': 39, 'hidden_single': 9, 'pointing_pair': 1, 'naked_pair': 1}),
+    (".7....6....8279...31...........6...5..57.4.3.89735....18.6..5.2....914...4.....1.", "hidden_pair", 3.6,
+     {'naked_single': 27, 'hidden_single': 25, 'pointing_pair': 1, 'box_line_reduction': 1, 'naked_pair': 1,
+      'hidden_pair': 1}),
+    ("1.2....98....1..2....4.91.....56.87.6..8....5.2.....63.97..6.8...83.7...5........", "naked_triple", 3.75,
+     {'hidden_single': 22, 'naked_single': 32, 'pointing_pair': 1, 'naked_pair': 1, 'naked_triple': 1}),
+    ("6.4.2..7.7........1..56.9...9...1...5.3.8........9..32....72.....6....419..4....6", "hidden_triple", 4.2,
+     {'hidden_single': 30, 'naked_single': 26, 'pointing_pair': 2, 'box_line_reduction': 1, 'hidden_triple': 1}),
+    ("7.....5...6...8.7.8...372...1...5.8.3..4.26.7.2.8.........64...6..12...4.4.....69", "x_wing", 4.3,
+     {'naked_single': 37, 'hidden_single': 16, 'pointing_pair': 1, 'x_wing': 1}),
+    ("5..1.9.6...9.2.....1.6.52...7..519.....4.....3.5.9..2...3.8..52...5...3......7..6", "swordfish", 5.4,
+     {'naked_single': 53, 'hidden_single': 1, 'pointing_pair': 3, 'box_line_reduction': 1, 'naked_pair': 2,
+      'swordfish': 1, 'hidden_pair': 1}),
+    ("..72.9..36.4.....29.36.....3....8.19....4.......1.3....4.....981.....36.....1.2.4", "chain", 6.4,
+     {'hidden_single': 18, 'pointing_pair': 4, 'hidden_pair': 1, 'chain': 3, 'naked_single': 37}),
+    (".......6.4.......18....9..7.2.4916.8..7.6..93...7...1..4.9...3.7..1.6....36......", "guess", 9.15,
+     {'hidden_single': 19, 'naked_single': 34, 'naked_triple': 1, 'guess': 2}),
+]
+
+
+@pytest.mark.parametrize("line, hardest, score, counts", KNOWN_RATINGS, ids=[case[1] for case in KNOWN_RATINGS])
+def test_rater_scores_known_puzzles(line, hardest, score, counts):
+    puzzle = parse_line(line)
+    solution = BitmaskSolver(9).solve(puzzle)
+    rater = DifficultyRater(9)
+    rating = rater.rate(puzzle)
+    assert rating == {'score': score, 'hardest': hardest, 'counts': counts, 'solved': True}
+    # Lời giải đưa sẵn (như lúc tạo đề) chỉ bỏ bớt lần giải, không đổi kết quả
+    assert rater.rate(puzzle, solution=solution) == rating
+
+
+def test_rater_reports_where_it_stalled():
+    line, hardest, _, _ = KNOWN_RATINGS[8] # x_wing
+    puzzle = parse_line(line)
+    rating = DifficultyRater(9).rate(puzzle, stalls=True)
+    assert set(rating['open_at']) == set(rating['counts']) - {'naked_single', 'hidden_single'}
+    open_cells = {r * 9 + c for r in range(9) for c in range(9) if not puzzle[r][c]}
+    assert set(rating['open_at'][hardest]) < open_cells
+
+
+def test_x_wing_step_eliminates_from_the_cover_columns():
+    rater = DifficultyRater(9)
+    steps = dict(rater.elimination_steps())
+    cands = [rater.solver.full_mask] * 81
+    for r in (0, 4): # Số 1 chỉ còn ở cột 0 và 8 của hàng 0 và hàng 4
+        for c in range(1, 8):
+            cands[r * 9 + c] &= ~1
+    assert steps["x_wing"]([0] * 81, cands) == 1
+    for r in range(9):
+        for c in range(9):
+            has_one = bool(cands[r * 9 + c] & 1)
+            assert has_one == ((c in (0, 8)) == (r in (0, 4))), (r, c)
+
+
+def test_rater_rejects_broken_puzzles():
+    rater = DifficultyRater(9)
+    duplicate = [[0] * 9 for _ in range(9)]
+    duplicate[0][0] = duplicate[0][5] = 3
+    assert rater.rate(duplicate) == {'score': None, 'hardest': None, 'counts': {}, 'solved': False}
+    # Hai số giống nhau cách một nước mã: trái luật anti-knight
+    knight = [[0] * 9 for _ in range(9)]
+    knight[0][0] = knight[1][2] = 5
+    assert DifficultyRater(9, SudokuVariant(9, anti_knight=True)).rate(knight)['solved'] is False
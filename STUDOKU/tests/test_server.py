@@ -0,0 +1,114 @@
+import asyncio
+import random
+
+import pytest
+
+from protocol import PROTOCOL_VERSION, encode_frame, read_message
+from server import SudokuServer
+from sudoku_logic import SudokuGenerator
+
+
+async def _connect(port):
+    """Opens a client connection and switches it to length framing; returns (reader, writer, player_id)."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    ack = await read_message(reader, 'newline')
+    assert ack['command'] == 'connected_ack' and ack['protocol'] == PROTOCOL_VERSION
+    writer.write(encode_frame({'command': 'hello', 'protocol': PROTOCOL_VERSION, 'framing': 'length'}, 'newline'))
+    assert await read_message(reader, 'length') == {'command': 'hello_ack', 'protocol': PROTOCOL_VERSION,
+                                                    'framing': 'length'}
+    return reader, writer, ack['player_id']
+
+
+async def _read_until(reader, command):
+    """Next message with the given command, skipping the ones before it."""
+    while True:
+        message = await asyncio.wait_for(read_message(reader, 'length'), timeout=10)
+        assert message is not None, f"connection closed while waiting for {command}"
+        if message['command'] == command:
+            return message
+
+
+async def _start(server):
+    """Listens on a free port with server.handle_client; no PuzzlePool or process pool (those start in serve())."""
+    handlers = []
+    async def handle(reader, writer):
+        handlers.append(asyncio.current_task())
+        await server.handle_client(reader, writer)
+    listener = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return listener, listener.sockets[0].getsockname()[1], handlers
+
+
+def test_two_players_create_join_move_and_quit():
+    async def run():
+        server = SudokuServer('127.0.0.1', 0, bank_path=None)
+        listener, port, _ = await _start(server)
+        async with listener:
+            reader_a, writer_a, player_a = await _connect(port)
+            writer_a.write(encode_frame({'command': 'create_game', 'difficulty': 'easy', 'size': 4}, 'length'))
+            created = await _read_until(reader_a, 'message')
+            (game_id, game), = server.games.items()
+            assert game_id in created['text'] and game.size == 4
+
+            reader_b, writer_b, player_b = await _connect(port)
+            writer_b.write(encode_frame({'command': 'join_game', 'game_id': game_id}, 'length'))
+            state = await _read_until(reader_a, 'game_state_update')
+            assert state['your_turn'] and state['board_data'] == game.puzzle_board
+            assert (await _read_until(reader_b, 'game_state_update'))['current_turn'] == player_a
+
+            r, c = next((r, c) for r in range(4) for c in range(4) if not game.puzzle_board[r][c])
+            number = game.solution_board[r][c]
+            writer_a.write(encode_frame({'command': 'make_move', 'row': r, 'col': c, 'number': number}, 'length'))
+            assert await _read_until(reader_a, 'move_accepted') == {'command': 'move_accepted', 'row': r, 'col': c,
+                                                                     'number': number}
+            moved = await _read_until(reader_b, 'opponent_moved')
+            assert (moved['mover_id'], moved['next_turn']) == (player_a, player_b)
+            assert game.current_board_state.get(r, c) == number
+
+            # Người chơi rời giữa ván: đối thủ thắng mặc định, server đóng kết nối của người rời
+            writer_a.write(encode_frame({'command': 'quit'}, 'length'))
+            assert (await _read_until(reader_b, 'game_over'))['winner_id'] == player_b
+            assert await asyncio.wait_for(read_message(reader_a, 'length'), timeout=10) is None
+            writer_b.write(encode_frame({'command': 'quit'}, 'length'))
+            assert await asyncio.wait_for(read_message(reader_b, 'length'), timeout=10) is None
+            for writer in (writer_a, writer_b):
+                writer.close()
+                await writer.wait_closed()
+        assert not server.clients and not server.games
+    asyncio.run(run())
+
+
+def test_cancelled_handler_cleans_up_and_propagates():
+    async def run():
+        server = SudokuServer('127.0.0.1', 0, bank_path=None)
+        listener, port, handlers = await _start(server)
+        async with listener:
+            reader, writer, _ = await _connect(port)
+            assert len(server.clients) == 1
+            handler, = handlers
+            handler.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await handler
+            assert not server.clients
+            assert await asyncio.wait_for(read_message(reader, 'length'), timeout=10) is None
+            writer.close()
+            await writer.wait_closed()
+    asyncio.run(run())
+
+
+def test_create_game_stats_add_up():
+    random.seed(10)
+    server = SudokuServer('127.0.0.1', 0, bank_path=None)
+    generator = SudokuGenerator(collect_stats=True)
+    generated = []
+    for elapsed in (0.01, 0.02):
+        generator.generate_puzzle("hard")
+        generated.append(generator.last_stats)
+        server.record_create_game_stats("hard", 9, elapsed, generator.last_stats)
+    server.record_create_game_stats("hard", 9, 0.005, None) # Đề lấy từ PuzzlePool: không có số liệu bộ giải
+    stats = server.create_game_stats[("hard", 9)]
+    assert stats.calls == 3
+    assert stats.nodes == sum(s.nodes for s in generated) > 0
+    assert stats.propagations == sum(s.propagations for s in generated)
+    assert stats.phase_times["create_game"] == pytest.approx(0.035)
+    assert stats.phase_times["total"] == pytest.approx(sum(s.phase_times["total"] for s in generated))
+    assert server.get_stats_snapshot()['create_game']["hard_9x9"] == stats.as_dict()
@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+
+import pytest
+
+import sudoku_logic
+from sudoku_logic import (PORTFOLIO_CANCEL_SLOTS, PORTFOLIO_NODE_LIMIT, SOLVER_BACKENDS, BitmaskSolver, ParallelSolver,
+                          PortfolioSolver, SearchLimitExceeded, box_dimensions)
+
+
+def _is_solution(grid, puzzle):
+    size = len(puzzle)
+    box_rows, box_cols = box_dimensions(size)
+    digits = set(range(1, size + 1))
+    units = [list(row) for row in grid] + [list(col) for col in zip(*grid)]
+    units += [[grid[r][c] for r in range(br, br + box_rows) for c in range(bc, bc + box_cols)]
+              for br in range(0, size, box_rows) for bc in range(0, size, box_cols)]
+    return (all(set(unit) == digits for unit in units)
+            and all(not v or grid[r][c] == v for r, row in enumerate(puzzle) for c, v in enumerate(row)))
+
+
+def _solvers(size):
+    solvers = {name: backend(size) for name, backend in SOLVER_BACKENDS.items()}
+    solvers["bitmask-reverse"] = BitmaskSolver(size, reverse=True)
+    return solvers
+
+
+def test_backends_agree_on_unique_puzzles(puzzles):
+    for puzzle, solution in puzzles:
+        for name, solver in _solvers(len(puzzle)).items():
+            assert solver.solve(puzzle) == solution, name
+            assert solver.count_solutions(puzzle) == 1, name
+
+
+def test_backends_agree_on_open_puzzles(puzzles):
+    for puzzle, solution in puzzles:
+        size = len(puzzle)
+        if size > 9:
+            continue
+        # Chỉ giữ hàng đầu: còn rất nhiều lời giải
+        open_puzzle = [solution[0][:]] + [[0] * size for _ in range(size - 1)]
+        for name, solver in _solvers(size).items():
+            assert solver.count_solutions(open_puzzle) == 2, name
+            assert solver.count_solutions(open_puzzle, limit=5) == 5, name
+            assert _is_solution(solver.solve(open_puzzle), open_puzzle), name
+            assert _is_solution(solver.solve(open_puzzle, randomize=True), open_puzzle), name
+
+
+def test_backends_agree_on_unsolvable_puzzles(puzzles):
+    puzzle, solution = next(pair for pair in puzzles if len(pair[0]) == 9)
+    duplicate = [row[:] for row in puzzle]
+    duplicate[0] = [solution[0][0]] * 2 + [0] * 7 # Hai số giống nhau trên một hàng
+    # Không trùng số nào, nhưng ô (0, 0) không còn số nào đặt được
+    blocked = [[0] * 9 for _ in range(9)]
+    blocked[0][1:] = range(1, 9)
+    blocked[1][0] = 9
+    for grid in (duplicate, blocked):
+        for name, solver in _solvers(9).items():
+            assert solver.solve(grid) is None, name
+            assert solver.count_solutions(grid) == 0, name
+
+
+def test_node_budget_stops_the_search():
+    empty = [[0] * 9 for _ in range(9)]
+    for name, solver in _solvers(9).items():
+        with pytest.raises(SearchLimitExceeded):
+            solver.solve(empty, budget=[3])
+
+
+def test_process_solvers_match_bitmask(puzzles):
+    nines = [pair for pair in puzzles if len(pair[0]) == 9][:3]
+    with ParallelSolver(9, workers=2) as parallel:
+        for puzzle, solution in nines:
+            assert parallel.solve(puzzle) == solution
+            assert parallel.count_solutions(puzzle) == 1
+    portfolio = PortfolioSolver(9)
+    try:
+        for puzzle, solution in nines:
+            result = portfolio.solve(puzzle, timeout=30)
+            assert result['status'] == 'solved'
+            assert result['solution'] == solution
+        assert not any(portfolio._cancel) # Mỗi lần gọi trả ô của nó khi xong
+    finally:
+        portfolio.close()
+
+
+def test_portfolio_jobs_of_an_older_call_stay_cancelled(monkeypatch, puzzles):
+    # Ô hủy được dùng lại vòng tròn: việc còn xếp hàng của lần gọi cũ không được chạy tiếp cho lần gọi mới
+    puzzle, solution = next(pair for pair in puzzles if len(pair[0]) == 9)
+    cancel = multiprocessing.RawArray('q', PORTFOLIO_CANCEL_SLOTS)
+    monkeypatch.setattr(sudoku_logic, "_portfolio_cancel", cancel)
+    monkeypatch.setattr(sudoku_logic, "_portfolio_solvers", {})
+    deadline = time.monotonic() + 30
+    cancel[3] = 7 # Ô 3 đang thuộc lần gọi thứ 7
+    for generation in (6, 8):
+        assert sudoku_logic._portfolio_job(9, "bitmask", puzzle, 3, generation, deadline, PORTFOLIO_NODE_LIMIT, 0) == \
+            ('cancelled', None, 0)
+    status, found, _ = sudoku_logic._portfolio_job(9, "bitmask", puzzle, 3, 7, deadline, PORTFOLIO_NODE_LIMIT, 0)
+    assert status == 'solved' and found == solution
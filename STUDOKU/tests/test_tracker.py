@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from sudoku_logic import BoardTracker, SudokuBoard, SudokuGenerator, SudokuVariant, box_dimensions
+
+
+def _units(size, variant):
+    if variant is not None:
+        return [list(unit) for unit in variant.units]
+    box_rows, box_cols = box_dimensions(size)
+    units = [[r * size + c for c in range(size)] for r in range(size)]
+    units += [[r * size + c for r in range(size)] for c in range(size)]
+    units += [[r * size + c for r in range(br, br + box_rows) for c in range(bc, bc + box_cols)]
+              for br in range(0, size, box_rows) for bc in range(0, size, box_cols)]
+    return units
+
+
+def _recount(board, solution, units):
+    """(filled, mismatches, conflicts, digit counts, cells in a repeated unit digit) by brute force."""
+    size = len(solution)
+    values = [board[r][c] for r in range(size) for c in range(size)]
+    digit_counts = [0] * (size + 1)
+    for v in values:
+        if v:
+            digit_counts[v] += 1
+    conflicts = 0
+    clashing = set()
+    for unit in units:
+        for d in range(1, size + 1):
+            cells = [cell for cell in unit if values[cell] == d]
+            if len(cells) > 1:
+                conflicts += len(cells) - 1
+                clashing.update(cells)
+    mismatches = sum(1 for cell, v in enumerate(values) if v and v != solution[cell // size][cell % size])
+    return sum(1 for v in values if v), mismatches, conflicts, digit_counts, clashing
+
+
+@pytest.mark.parametrize("size", [4, 6, 8, 9, 10, 12])
+@pytest.mark.parametrize("compact", [False, True])
+def test_counters_match_a_recount(size, compact):
+    random.seed(size)
+    solution = SudokuGenerator(size=size).new_solution_grid()
+    start = [[v if random.random() < 0.4 else 0 for v in row] for row in solution]
+    board = SudokuBoard.from_grid(start) if compact else [row[:] for row in start]
+    tracker = BoardTracker(board, solution)
+    units = _units(size, None)
+    for step in range(400):
+        r, c = random.randrange(size), random.randrange(size)
+        if random.random() < 0.25:
+            tracker.clear(r, c)
+        else:
+            num = random.randint(1, size)
+            peers = {cell for unit in units if r * size + c in unit for cell in unit} - {r * size + c}
+            assert tracker.would_conflict(r, c, num) == any(board[p // size][p % size] == num for p in peers)
+            nums = {num, random.randint(0, size)}
+            assert tracker.cells_with(r, c, nums) == {divmod(p, size) for p in peers | {r * size + c}
+                                                      if board[p // size][p % size] in nums - {0}}
+            tracker.set(r, c, num)
+        if step % 20 == 0 or step == 399:
+            filled, mismatches, conflicts, digit_counts, clashing = _recount(board, solution, units)
+            assert (tracker.filled, tracker.mismatches, tracker.conflicts) == (filled, mismatches, conflicts)
+            assert tracker.digit_counts[1:] == digit_counts[1:]
+            for cell in range(size * size):
+                assert tracker.has_conflict(*divmod(cell, size)) == (cell in clashing)
+
+    # Điền đúng lời giải: bảng hoàn thành và đúng
+    for r in range(size):
+        for c in range(size):
+            tracker.set(r, c, solution[r][c])
+    assert tracker.check_board_state() == (True, True)
+    assert (tracker.mismatches, tracker.conflicts) == (0, 0)
+
+
+def test_counters_with_variant_units():
+    random.seed(3)
+    variant = SudokuVariant(9, diagonals=True, name="diagonal")
+    solution = SudokuGenerator(variant="diagonal").new_solution_grid()
+    board = [[0] * 9 for _ in range(9)]
+    tracker = BoardTracker(board, variant=variant)
+    units = _units(9, variant)
+    for _ in range(300):
+        r, c = random.randrange(9), random.randrange(9)
+        tracker.set(r, c, random.choice([0, random.randint(1, 9)]))
+        filled, _, conflicts, _, _ = _recount(board, solution, units)
+        assert (tracker.filled, tracker.conflicts) == (filled, conflicts)
+    for r in range(9):
+        for c in range(9):
+            tracker.set(r, c, solution[r][c])
+    assert tracker.check_board_state() == (True, True)
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import server
+from sudoku_logic import KNIGHT_MOVES, VARIANTS, BitmaskSolver, DifficultyRater, SudokuGenerator, SudokuVariant
+
+
+@pytest.mark.parametrize("variant", VARIANTS[1:])
+def test_variant_puzzles_have_one_solution_under_their_rules(variant):
+    random.seed(21)
+    generator = SudokuGenerator(variant=variant)
+    for difficulty in ("easy", "medium"):
+        puzzle, solution = generator.generate_puzzle(difficulty, timeout=1)
+        rules = generator.variant
+        assert rules.name == variant and generator.in_band(difficulty), generator.last_rating
+        assert rules.check_grid(solution)
+        assert all(not v or v == solution[r][c] for r, row in enumerate(puzzle) for c, v in enumerate(row))
+        solver = BitmaskSolver(9, variant=rules)
+        assert solver.count_solutions(puzzle) == 1
+        assert solver.solve(puzzle) == solution
+        assert DifficultyRater(9, rules).rate(puzzle) == {k: v for k, v in generator.last_rating.items()
+                                                          if k != 'open_at'}
+        # Luật của đề đi qua JSON (game_state_update) rồi dựng lại y hệt
+        assert SudokuVariant.from_dict(rules.to_dict()).key == rules.key
+
+
+def test_variant_rules_reject_what_classic_allows():
+    random.seed(8)
+    size = 9
+    solution = SudokuGenerator().new_solution_grid()
+    assert SudokuVariant(size).check_grid(solution)
+    # Lưới cổ điển ngẫu nhiên gần như luôn có hai số giống nhau cách một nước mã
+    assert any(solution[r][c] == solution[r + dr][c + dc] for r in range(size) for c in range(size)
+               for dr, dc in KNIGHT_MOVES if 0 <= r + dr < size and 0 <= c + dc < size)
+    assert not SudokuVariant(size, anti_knight=True).check_grid(solution)
+    # Tổng lồng sai một đơn vị, hoặc vạch giữa hai số không liền nhau
+    cage = (solution[0][0] + solution[0][1] + 1, [(0, 0), (0, 1)])
+    assert not SudokuVariant(size, cages=[cage]).check_grid(solution)
+    far = next(c for c in range(1, size) if abs(solution[0][c] - solution[0][c - 1]) != 1)
+    assert not SudokuVariant(size, consecutive=[((0, far - 1), (0, far))]).check_grid(solution)
+
+
+@pytest.mark.parametrize("rules", [SudokuVariant(9, diagonals=True), SudokuVariant(9, anti_knight=True)])
+def test_solver_fills_an_empty_variant_grid(rules):
+    random.seed(4)
+    grid = BitmaskSolver(9, variant=rules).solve([[0] * 9 for _ in range(9)], True)
+    assert rules.check_grid(grid)
+
+
+def test_off_band_variant_puzzles_are_refused(monkeypatch):
+    # Dải không thể đạt: mọi lần thử đều ra đề sai độ khó, nên server báo lỗi thay vì cho chơi
+    generator = SudokuGenerator(variant="killer")
+    generator.rating_bands["medium"] = (20.0, 30.0)
+    monkeypatch.setitem(server._worker_generators, (9, "killer"), generator)
+    monkeypatch.setattr(server, "VARIANT_GENERATION_TIMEOUT", 0.1)
+    with pytest.raises(ValueError):
+        server._generate_game_puzzle("medium", 9, "killer")
+    assert generator.last_rating is not None and not generator.in_band("medium")
+
+    monkeypatch.setitem(server._worker_generators, (9, "killer"), SudokuGenerator(variant="killer"))
+    puzzle, solution, rules, _ = server._generate_game_puzzle("medium", 9, "killer")
+    assert rules.cages and rules.check_grid(solution)
@@ -1,5 +1,6 @@
 import customtkinter as ctk
 from tkinter import messagebox, StringVar, colorchooser
+from sudoku_logic import box_dimensions, SudokuBoard
 
 # --- UI Styling and Theming ---
 
@@ -243,13 +244,15 @@ class NewGameDialog(ctk.CTkToplevel):
         self.transient(parent) # Keep dialog on top of parent
         self.grab_set()       # Modal behavior
         self.title(title)
-        self.geometry("550x320")
+        self.geometry("550x380")
         self.resizable(False, False)
         self.configure(fg_color=self.colors['background'])
 
         self.selected_difficulty_internal = "medium" # Default difficulty
         self.ok_pressed = False
         self.result = None # Stores the selected difficulty on OK
+        self.selected_size = 9 # Board size (grid_size) chosen in the dialog
+        self.sizes_map = {"4x4": 4, "6x6": 6, "9x9": 9, "12x12": 12, "16x16": 16, "25x25": 25}
 
         self.difficulties_map = {
             "Rất Dễ": ("very_easy", "🟢", "Người mới"),
@@ -341,6 +344,15 @@ class NewGameDialog(ctk.CTkToplevel):
             
             self.difficulty_buttons_data[display_name] = diff_container
 
+        # Board Size Selection
+        size_frame = ctk.CTkFrame(main_content_frame, fg_color="transparent")
+        size_frame.pack(fill=ctk.X, padx=20, pady=(5, 0))
+        ctk.CTkLabel(size_frame, text="Kích thước:", font=self.fonts['body_large']).pack(side=ctk.LEFT, padx=(0, 10))
+        self.size_selector = ctk.CTkSegmentedButton(size_frame, values=list(self.sizes_map.keys()), font=self.fonts['body_medium'],
+                                                    command=lambda value: setattr(self, 'selected_size', self.sizes_map[value]))
+        self.size_selector.set("9x9")
+        self.size_selector.pack(side=ctk.LEFT, fill=ctk.X, expand=True)
+
         # OK/Cancel Buttons
         button_frame = ctk.CTkFrame(main_content_frame, fg_color="transparent")
         button_frame.pack(fill=ctk.X, padx=20, pady=(10, 20))
@@ -381,22 +393,26 @@ class NewGameDialog(ctk.CTkToplevel):
 
 class GameScreenUI(BaseScreen):
     """The main game screen, displaying the Sudoku board, controls, and info."""
-    def __init__(self, master_app, controller, game_mode="classic"):
+    def __init__(self, master_app, controller, game_mode="classic", grid_size=9):
         super().__init__(master_app, controller)
         
         self.game_mode = game_mode # "classic" or "multiplayer"
-        self.grid_size = 9
-        self.subgrid_size = 3
+        self.grid_size = grid_size
+        self.box_rows, self.box_cols = box_dimensions(grid_size) # Subgrid shape, e.g. 2x3 for 6x6
 
         # UI element storage
         self.cells_widgets = {}  # (r, c) -> CTkFrame (cell background)
         self.num_labels = {}     # (r, c) -> CTkLabel (main number)
         self.pencil_labels = {}  # (r, c) -> CTkLabel (pencil marks)
         self.action_buttons_map = {} # Stores references to action buttons like "Pencil"
+        self.board_tracker = None # BoardTracker of the displayed board, set by the controller
+        self.highlighted_cells = {} # (r, c) -> background applied by the last highlight (default color if absent)
+        self.highlight_default_bg = None # Default background the cells were last painted with
 
         # Game state for UI display
         self.selected_cell_coords = None # (r, c) of the currently selected cell
         self.is_pencil_mode_on = False
+        self.auto_candidates_on = False # Show the tracker's live candidates instead of manual pencil marks
         self.mistakes_count_ui = 0
         self.max_mistakes_ui = 0 # For classic mode with mistake limit
         self.time_seconds_ui = 0
@@ -404,7 +420,7 @@ class GameScreenUI(BaseScreen):
         self.difficulty_ui_text = "N/A"
         
         # StringVars for dynamic UI text
-        self.number_counts_vars = {i: StringVar(value="9") for i in range(1, 10)} # Counts for number pad
+        self.number_counts_vars = {i: StringVar(value=str(grid_size)) for i in range(1, grid_size + 1)} # Counts for number pad
         self.hints_remaining_var = StringVar(value="💡 Gợi ý (6)") # For classic mode
 
         # Load current color settings
@@ -489,51 +505,55 @@ class GameScreenUI(BaseScreen):
         return frame # Return for easy access to child labels if needed
 
     def _create_game_board(self, parent):
-        """Creates the 9x9 Sudoku game board."""
+        """Creates the Sudoku game board (grid_size x grid_size, split into box_rows x box_cols subgrids)."""
         board_outer_container = EnhancedFrame(parent, corner_radius=15, fg_color=self.colors['surface'])
         board_outer_container.pack(pady=10, anchor="center", padx=5) # Center the board
 
         grid_container = ctk.CTkFrame(board_outer_container, fg_color=self.grid_line_color_thick, corner_radius=10) # Thick lines around 3x3 subgrids
         grid_container.pack(padx=10, pady=10)
 
-        cell_size = 48  # Approximate size for cells
+        cell_size = 48 if self.grid_size <= 9 else max(22, 432 // self.grid_size)  # Shrink cells so big boards still fit
         subgrid_spacing = 2 # Space for thick lines between subgrids
         cell_spacing = 1    # Space for thin lines between cells
+        number_font = self.fonts['cell_number'] if self.grid_size <= 9 else ctk.CTkFont(family="JetBrains Mono NL", size=max(10, cell_size // 2), weight="bold")
+        pencil_font = self.fonts['cell_pencil'] if self.grid_size <= 9 else ctk.CTkFont(family="JetBrains Mono NL", size=6)
+        box_rows_count = self.grid_size // self.box_rows # Number of subgrid rows
+        box_cols_count = self.grid_size // self.box_cols # Number of subgrid cols
 
-        for sr in range(self.subgrid_size): # Subgrid row
-            for sc in range(self.subgrid_size): # Subgrid col
+        for sr in range(box_rows_count): # Subgrid row
+            for sc in range(box_cols_count): # Subgrid col
                 subgrid_frame = ctk.CTkFrame(grid_container, fg_color=self.grid_line_color_thin, corner_radius=0) # Thin lines inside subgrids
                 subgrid_frame.grid(row=sr, column=sc,
-                                   padx=(0, subgrid_spacing if sc < self.subgrid_size -1 else 0),
-                                   pady=(0, subgrid_spacing if sr < self.subgrid_size -1 else 0))
+                                   padx=(0, subgrid_spacing if sc < box_cols_count -1 else 0),
+                                   pady=(0, subgrid_spacing if sr < box_rows_count -1 else 0))
 
-                for r_in_sub in range(self.subgrid_size): # Row within subgrid
-                    for c_in_sub in range(self.subgrid_size): # Col within subgrid
-                        r_abs, c_abs = sr * self.subgrid_size + r_in_sub, sc * self.subgrid_size + c_in_sub # Absolute coordinates
+                for r_in_sub in range(self.box_rows): # Row within subgrid
+                    for c_in_sub in range(self.box_cols): # Col within subgrid
+                        r_abs, c_abs = sr * self.box_rows + r_in_sub, sc * self.box_cols + c_in_sub # Absolute coordinates
 
                         cell_frame = ctk.CTkFrame(subgrid_frame, width=cell_size, height=cell_size, fg_color=self.cell_bg_color_default, corner_radius=3, border_width=0)
                         cell_frame.grid(row=r_in_sub, column=c_in_sub,
-                                        padx=(0, cell_spacing if c_in_sub < self.subgrid_size -1 else 0),
-                                        pady=(0, cell_spacing if r_in_sub < self.subgrid_size -1 else 0),
+                                        padx=(0, cell_spacing if c_in_sub < self.box_cols -1 else 0),
+                                        pady=(0, cell_spacing if r_in_sub < self.box_rows -1 else 0),
                                         sticky="nsew")
                         cell_frame.pack_propagate(False) # Prevent resizing by labels
                         cell_frame.bind("<Button-1>", lambda e, r_b=r_abs, c_b=c_abs: self._on_cell_click(r_b, c_b))
                         self.cells_widgets[(r_abs, c_abs)] = cell_frame
 
                         # Pencil marks label (placed first, behind number label)
-                        pencil_lbl = ctk.CTkLabel(cell_frame, text="", font=self.fonts['cell_pencil'], text_color=self.pencil_text_color)
+                        pencil_lbl = ctk.CTkLabel(cell_frame, text="", font=pencil_font, text_color=self.pencil_text_color)
                         pencil_lbl.place(relx=0.5, rely=0.5, anchor=ctk.CENTER, relwidth=0.95, relheight=0.95) # Fill cell
                         pencil_lbl.bind("<Button-1>", lambda e, r_b=r_abs, c_b=c_abs: self._on_cell_click(r_b, c_b))
                         self.pencil_labels[(r_abs, c_abs)] = pencil_lbl
 
                         # Main number label
-                        num_lbl = ctk.CTkLabel(cell_frame, text="", font=self.fonts['cell_number'], text_color=self.user_text_color)
+                        num_lbl = ctk.CTkLabel(cell_frame, text="", font=number_font, text_color=self.user_text_color)
                         num_lbl.place(relx=0.5, rely=0.5, anchor=ctk.CENTER)
                         num_lbl.bind("<Button-1>", lambda e, r_b=r_abs, c_b=c_abs: self._on_cell_click(r_b, c_b))
                         self.num_labels[(r_abs, c_abs)] = num_lbl
 
     def _create_action_panel(self, parent):
-        """Creates the panel for game actions (Undo, Erase, Pencil, Hint)."""
+        """Creates the panel for game actions (Undo, Erase, Pencil, Hint, and Check in multiplayer)."""
         action_panel = EnhancedFrame(parent, fg_color="transparent")
         action_panel.pack(fill=ctk.X, pady=10)
 
@@ -544,12 +564,14 @@ class GameScreenUI(BaseScreen):
             ("↺ Hoàn tác", self.controller.undo_move, "secondary", "classic"),
             ("⌫ Xóa", self._erase_selected_cell, "warning", "both"),
             ("✏️ Viết chì", self._toggle_pencil_mode, "accent", "classic"),
-            (" Gợi ý", self.controller.request_hint, "success", "classic") # Space for icon
+            ("🔢 Tự ghi chú", self._toggle_auto_candidates, "accent", "classic"),
+            (" Gợi ý", self.controller.request_hint, "success", "both"), # Space for icon
+            ("🔍 Kiểm tra", self.controller.request_puzzle_check, "secondary", "multiplayer")
         ]
         action_btn_font = self.fonts['button']
         col = 0
         for text, cmd, style, mode_avail in actions_config:
-            if mode_avail == "both" or (mode_avail == "classic" and self.game_mode == "classic"):
+            if mode_avail == "both" or mode_avail == self.game_mode:
                 if "Gợi ý" in text: # Hint button uses a StringVar for its text
                     btn = EnhancedButton(actions_grid, textvariable=self.hints_remaining_var, command=cmd, style=style, height=40, font=action_btn_font)
                 else:
@@ -560,21 +582,24 @@ class GameScreenUI(BaseScreen):
 
                 if "Viết chì" in text:
                     self.action_buttons_map["pencil_button"] = btn # Store for easy access
+                elif "Tự ghi chú" in text:
+                    self.action_buttons_map["auto_candidates_button"] = btn
                 col += 1
     
     def _create_number_pad(self, parent):
-        """Creates the number input pad (1-9)."""
+        """Creates the number input pad (1..grid_size), at most 9 buttons per row."""
         number_pad_container = EnhancedFrame(parent, fg_color="transparent")
         number_pad_container.pack(pady=(5, 10))
 
-        pad_horizontal_frame = ctk.CTkFrame(number_pad_container, fg_color="transparent") # To align buttons horizontally
-        pad_horizontal_frame.pack()
-
-        for i in range(1, 10):
+        button_size = 50 if self.grid_size <= 9 else 40
+        for i in range(1, self.grid_size + 1):
+            if (i - 1) % 9 == 0: # Start a new row of buttons
+                pad_horizontal_frame = ctk.CTkFrame(number_pad_container, fg_color="transparent") # To align buttons horizontally
+                pad_horizontal_frame.pack()
             num_btn_wrapper = ctk.CTkFrame(pad_horizontal_frame, fg_color="transparent") # Wrapper for button and count label
             num_btn_wrapper.pack(side=ctk.LEFT, padx=3, pady=3)
             
-            btn = EnhancedButton(num_btn_wrapper, text=str(i), command=lambda num=i: self._on_number_press(num), style="primary", height=50, width=50, font=self.fonts['number_pad'])
+            btn = EnhancedButton(num_btn_wrapper, text=str(i), command=lambda num=i: self._on_number_press(num), style="primary", height=button_size, width=button_size, font=self.fonts['number_pad'])
             btn.pack()
             
             # Label to show remaining count for each number
@@ -628,10 +653,40 @@ class GameScreenUI(BaseScreen):
             else:
                 pencil_btn.configure(fg_color=self.colors['accent'], hover_color=self.colors['primary'])
 
+    def _toggle_auto_candidates(self):
+        """Toggles auto-candidates (every empty cell shows its legal digits) on/off (Classic mode only)."""
+        if self.game_mode != "classic":
+            return
+        self.auto_candidates_on = not self.auto_candidates_on
+        auto_btn = self.action_buttons_map.get("auto_candidates_button")
+        if auto_btn:
+            auto_btn.configure(text=f"🔢 Tự ghi chú ({'ON' if self.auto_candidates_on else 'OFF'})",
+                               fg_color=self.colors['success'] if self.auto_candidates_on else self.colors['accent'])
+        board = self.controller.classic_game_state.get('board_data')
+        if board is not None:
+            self.controller.get_board_tracker() # Make sure the candidates follow this board
+            self.update_board_display(board)
+
+    def _cell_pencil_marks(self, board, r, c):
+        """Pencil marks to draw in (r, c): live candidates in auto mode, else the manual marks (or None)."""
+        tracker = self.board_tracker
+        if self.auto_candidates_on and tracker is not None and tracker.board is board and tracker.hint_engine is not None:
+            return tracker.hint_engine.candidate_digits(r, c)
+        return board.pencil_marks(r, c) if board.pencil_mask(r, c) else None
+
+    def _board_value(self, board_data, r, c):
+        """Digit in (r, c) of a SudokuBoard (flat read) or a list-of-lists grid."""
+        if isinstance(board_data, SudokuBoard):
+            return board_data.get(r, c)
+        return board_data[r][c]
+
     def highlight_selected_cell(self, r_selected, c_selected, related_coords=None):
-        """Highlights the selected cell, its row, column, and subgrid, and same numbers."""
-        self._clear_all_highlights()
-        related_coords = related_coords or []
+        """
+        Highlights the selected cell, its row, column, and subgrid, and same numbers.
+        `related_coords` is a set of (r, c). Only cells whose background changes
+        are restyled: the old and new selection's row, column, box and same numbers.
+        """
+        related_coords = related_coords or set()
 
         active_board_data = None
         if self.game_mode == "classic" and self.controller.classic_game_state.get('board_data'):
@@ -641,39 +696,55 @@ class GameScreenUI(BaseScreen):
         
         selected_val_on_board = 0
         if active_board_data and 0 <= r_selected < self.grid_size and 0 <= c_selected < self.grid_size:
-             if active_board_data[r_selected][c_selected] != 0:
-                selected_val_on_board = active_board_data[r_selected][c_selected]
+            selected_val_on_board = self._board_value(active_board_data, r_selected, c_selected)
+
+        # Cells with the same number as the selected cell, then row/col/subgrid, then the cell itself on top
+        targets = {}
+        if selected_val_on_board != 0:
+            for coords in self._cells_with_value(active_board_data, selected_val_on_board):
+                targets[coords] = self.same_number_bg_color
+        for coords in related_coords:
+            targets[coords] = self.related_cell_bg_color
+        targets[(r_selected, c_selected)] = self.selected_cell_bg_color
+        self._apply_highlights(targets)
+
+    def _cells_with_value(self, board_data, num):
+        """(r, c) of every cell holding `num`."""
+        size = self.grid_size
+        if isinstance(board_data, SudokuBoard):
+            values = board_data.values
+            idx = values.find(num)
+            while idx >= 0:
+                yield divmod(idx, size)
+                idx = values.find(num, idx + 1)
+            return
+        for r_idx in range(size):
+            row = board_data[r_idx]
+            for c_idx in range(size):
+                if row[c_idx] == num:
+                    yield r_idx, c_idx
 
-        for r_idx in range(self.grid_size):
-            for c_idx in range(self.grid_size):
-                cell_frame = self.cells_widgets.get((r_idx, c_idx))
-                if not cell_frame or not cell_frame.winfo_exists(): continue
-
-                current_cell_val = 0
-                if active_board_data and 0 <= r_idx < self.grid_size and 0 <= c_idx < self.grid_size:
-                     current_cell_val = active_board_data[r_idx][c_idx]
-
-                target_bg = self.cell_bg_color_default
-                if (r_idx, c_idx) == (r_selected, c_selected):
-                    target_bg = self.selected_cell_bg_color
-                elif (r_idx, c_idx) in related_coords: # Row, col, subgrid highlights
-                    target_bg = self.related_cell_bg_color
-                
-                # Highlight cells with the same number as the selected cell's number
-                if selected_val_on_board != 0 and current_cell_val == selected_val_on_board:
-                    # Prioritize selected_cell_bg if it's the same number cell
-                    if target_bg == self.cell_bg_color_default: # Don't override related/selected highlights
-                         target_bg = self.same_number_bg_color
-                
+    def _apply_highlights(self, targets):
+        """
+        Sets the cell backgrounds to `targets` ((r, c) -> color, default elsewhere),
+        configuring only cells whose background differs from what was last applied.
+        """
+        default = self.cell_bg_color_default
+        repaint_all = default != self.highlight_default_bg # Theme changed: every cell needs the new default
+        self.highlight_default_bg = default
+        changed = self.cells_widgets.keys() if repaint_all else self.highlighted_cells.keys() | targets.keys()
+        for coords in changed:
+            target_bg = targets.get(coords, default)
+            if not repaint_all and self.highlighted_cells.get(coords, default) == target_bg:
+                continue
+            cell_frame = self.cells_widgets.get(coords)
+            if cell_frame and cell_frame.winfo_exists():
                 cell_frame.configure(fg_color=target_bg)
+        self.highlighted_cells = targets
 
     def _clear_all_highlights(self):
-        """Resets all cell backgrounds to the default color."""
-        for r_idx in range(self.grid_size):
-            for c_idx in range(self.grid_size):
-                cell_frame = self.cells_widgets.get((r_idx, c_idx))
-                if cell_frame and cell_frame.winfo_exists():
-                    cell_frame.configure(fg_color=self.cell_bg_color_default)
+        """Resets the highlighted cell backgrounds to the default color."""
+        self._apply_highlights({})
 
     def update_cell_display(self, r, c, number, is_fixed, is_error=False, pencil_marks_set=None, is_hint_fill=False):
         """Updates the visual appearance of a single cell (number, color, pencil marks)."""
@@ -690,6 +761,7 @@ class GameScreenUI(BaseScreen):
 
         if is_hint_fill:
             target_cell_bg = self.hint_fill_bg_color
+            self.highlighted_cells[(r, c)] = target_cell_bg # Lần highlight sau sẽ tô lại ô này
             current_text_color = self._get_appearance_mode_color(self.board_specific_colors.get("cell_hint_text_custom") or self.colors['on_surface']) # Custom hint text color or default
         elif is_fixed:
             current_text_color = self.fixed_text_color
@@ -707,22 +779,37 @@ class GameScreenUI(BaseScreen):
         else:
             num_lbl.configure(text="")
             if pencil_marks_set and len(pencil_marks_set) > 0:
-                # Format pencil marks into a 3x3 grid string
+                # Format pencil marks into a grid string shaped like a subgrid (3x3 for 9x9)
                 lines = []
-                for i_row in range(1, 10, 3): # 1, 4, 7
+                width = len(str(self.grid_size))
+                for i_row in range(1, self.grid_size + 1, self.box_cols): # 1, 4, 7 for 9x9
                     line_str = ""
-                    for j_col_in_row in range(3): # 0, 1, 2
+                    for j_col_in_row in range(self.box_cols): # 0, 1, 2 for 9x9
                         mark = i_row + j_col_in_row
-                        line_str += str(mark) if mark in pencil_marks_set else " "
-                        if j_col_in_row < 2 : line_str += " " # Space between numbers in a line
+                        line_str += str(mark).rjust(width) if mark in pencil_marks_set else " " * width
+                        if j_col_in_row < self.box_cols - 1 : line_str += " " # Space between numbers in a line
                     lines.append(line_str.strip())
                 pencil_lbl.configure(text="\n".join(lines))
             else:
                 pencil_lbl.configure(text="")
 
-    def update_board_display(self, board_data, fixed_mask, error_cells=None, pencil_data=None):
-        """Redraws the entire Sudoku board based on the provided data."""
+    def update_board_display(self, board_data, fixed_mask=None, error_cells=None, pencil_data=None):
+        """
+        Redraws the entire Sudoku board based on the provided data.
+        `board_data` is either a SudokuBoard (which carries its own fixed cells,
+        errors and pencil marks) or a list-of-lists grid plus the separate structures.
+        """
         self._update_dynamic_colors() # Ensure colors are up-to-date with theme/settings
+        if isinstance(board_data, SudokuBoard):
+            board = board_data
+            for r_idx in range(self.grid_size):
+                for c_idx in range(self.grid_size):
+                    num = board.get(r_idx, c_idx)
+                    self.update_cell_display(r_idx, c_idx, num, board.is_fixed(r_idx, c_idx),
+                                             is_error=num != 0 and board.is_error(r_idx, c_idx),
+                                             pencil_marks_set=self._cell_pencil_marks(board, r_idx, c_idx))
+            self._refresh_after_board_update(board_data)
+            return
         error_cells = error_cells or set()
         pencil_data = pencil_data or {}
 
@@ -734,23 +821,45 @@ class GameScreenUI(BaseScreen):
                                          fixed_mask[r_idx][c_idx],
                                          is_error=is_err,
                                          pencil_marks_set=pencil_data.get((r_idx,c_idx), set()))
-        
+        self._refresh_after_board_update(board_data)
+
+    def update_cells_display(self, board, cells):
+        """
+        Redraws only `cells` of a SudokuBoard: after a move that is the cell
+        itself plus the peers whose candidates changed, not the whole board.
+        """
+        self._update_dynamic_colors()
+        for r_idx, c_idx in cells:
+            num = board.get(r_idx, c_idx)
+            self.update_cell_display(r_idx, c_idx, num, board.is_fixed(r_idx, c_idx),
+                                     is_error=num != 0 and board.is_error(r_idx, c_idx),
+                                     pencil_marks_set=self._cell_pencil_marks(board, r_idx, c_idx))
+        self._refresh_after_board_update(board)
+
+    def _refresh_after_board_update(self, board_data):
+        """Number pad counts and selection highlight, after the cells were redrawn."""
         self.update_number_pad_counts(board_data) # Update counts on number pad
         
         # Re-apply selection highlight if a cell is selected
         if self.selected_cell_coords:
             sr,sc = self.selected_cell_coords
-            related = self.controller.get_related_coords_for_highlight(sr,sc) if self.game_mode == "classic" else []
+            related = self.controller.get_related_coords_for_highlight(sr,sc) if self.game_mode == "classic" else set()
             self.highlight_selected_cell(sr,sc,related)
         else:
             self._clear_all_highlights()
 
     def update_number_pad_counts(self, board_data):
         """Updates the remaining number counts displayed below the number pad buttons."""
-        counts = {i:0 for i in range(1,10)}
+        tracker = self.board_tracker
+        if tracker is not None and tracker.board is board_data: # Counts kept up to date by the tracker
+            for num_key, count_var in self.number_counts_vars.items():
+                remaining = tracker.remaining(num_key)
+                count_var.set(str(remaining if remaining > 0 else "✓"))
+            return
+        counts = {i:0 for i in range(1,self.grid_size+1)}
         for r_row in board_data:
             for num_val_cell in r_row:
-                if 1 <= num_val_cell <= 9:
+                if 1 <= num_val_cell <= self.grid_size:
                     counts[num_val_cell] += 1
         
         for num_key, count_var in self.number_counts_vars.items():
@@ -812,6 +921,10 @@ class GameScreenUI(BaseScreen):
         pencil_btn = self.action_buttons_map.get("pencil_button")
         if pencil_btn and pencil_btn.winfo_exists():
             pencil_btn.configure(text="✏️ Viết chì (OFF)", fg_color=self.colors['accent'])
+        self.auto_candidates_on = False
+        auto_btn = self.action_buttons_map.get("auto_candidates_button")
+        if auto_btn and auto_btn.winfo_exists():
+            auto_btn.configure(text="🔢 Tự ghi chú", fg_color=self.colors['accent'])
         
         self._clear_all_highlights()
         
@@ -824,15 +937,15 @@ class GameScreenUI(BaseScreen):
         if self.game_mode == "classic":
             self.hints_remaining_var.set("💡 Gợi ý (6)") # Default hints
         else: # Multiplayer
-            self.hints_remaining_var.set("💡 Gợi ý (0)") # No hints in MP
+            self.hints_remaining_var.set("💡 Gợi ý") # MP: server coach hints, no limit and nothing filled in
             
-        for i in range(1,10): self.number_counts_vars[i].set("9") # Reset number pad counts
+        for i in range(1,self.grid_size+1): self.number_counts_vars[i].set(str(self.grid_size)) # Reset number pad counts
         
         self.update_info_display(self.mistakes_count_ui, self.time_seconds_ui, self.difficulty_ui_text, self.score_ui, self.max_mistakes_ui)
         
         # Clear the board display (optional, as update_board_display will be called by controller)
-        empty_board = [[0 for _ in range(9)] for _ in range(9)]
-        empty_mask = [[False for _ in range(9)] for _ in range(9)]
+        empty_board = [[0 for _ in range(self.grid_size)] for _ in range(self.grid_size)]
+        empty_mask = [[False for _ in range(self.grid_size)] for _ in range(self.grid_size)]
         self.update_board_display(empty_board, empty_mask, {}, {})
 
 